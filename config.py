@@ -16,6 +16,13 @@ class Config:
         self.session_name: str = "userbot"
         self.cmd_prefix: str = "."
         
+        # Дополнительные сессии для распределения источников
+        self.extra_session_names: List[str] = []
+        self.extra_session_string_files: List[str] = []
+        
+        # Количество процессов-воркеров для обработки пайплайнов (0 - в основном процессе)
+        self.pipeline_processes: int = 0
+        
         # Настройки пересылки
         self.forwarding_enabled: bool = False
         self.source_group_id: Optional[int] = None
@@ -77,6 +84,9 @@ class Config:
         self.backup_interval_hours: int = 24
         self.cache_enabled: bool = True
         self.cache_size_mb: int = 50
+        # Загрузка медиа: одновременных загрузок и скорость (КБ/с, 0 - без ограничения)
+        self.media_max_downloads: int = 4
+        self.media_bandwidth_kbps: int = 0
         
         # Настройки безопасности
         self.encrypt_data: bool = False
@@ -105,6 +115,15 @@ class Config:
         self.session_name = os.getenv("SESSION_NAME", "userbot")
         self.cmd_prefix = os.getenv("CMD_PREFIX", ".")
         
+        # Дополнительные сессии для распределения источников
+        extra_sessions_str = os.getenv("EXTRA_SESSION_NAMES", "")
+        self.extra_session_names = [name.strip() for name in extra_sessions_str.split(",") if name.strip()]
+        extra_session_files_str = os.getenv("EXTRA_SESSION_STRING_FILES", "")
+        self.extra_session_string_files = [path.strip() for path in extra_session_files_str.split(",") if path.strip()]
+        
+        # Количество процессов-воркеров для обработки пайплайнов
+        self.pipeline_processes = int(os.getenv("PIPELINE_PROCESSES", "0"))
+        
         # Настройки пересылки
         self.forwarding_enabled = os.getenv("FORWARDING_ENABLED", "false").lower() == "true"
         self.source_group_id = int(os.getenv("SOURCE_GROUP_ID", "0")) if os.getenv("SOURCE_GROUP_ID") else None
@@ -175,6 +194,8 @@ class Config:
         self.backup_interval_hours = int(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
         self.cache_enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
         self.cache_size_mb = int(os.getenv("CACHE_SIZE_MB", "50"))
+        self.media_max_downloads = int(os.getenv("MEDIA_MAX_DOWNLOADS", "4"))
+        self.media_bandwidth_kbps = int(os.getenv("MEDIA_BANDWIDTH_KBPS", "0"))
         
         # Настройки безопасности
         self.encrypt_data = os.getenv("ENCRYPT_DATA", "false").lower() == "true"
@@ -236,6 +257,8 @@ class Config:
 - API_ID: {'✅' if self.api_id else '❌'}
 - API_HASH: {'✅' if self.api_hash else '❌'}
 - Session: {self.session_name}
+- Дополнительных сессий: {len(self.extra_session_names) + len(self.extra_session_string_files)}
+- Процессов обработки: {self.pipeline_processes or 'основной процесс'}
 - Prefix: {self.cmd_prefix}
 
 📤 **Пересылка:**
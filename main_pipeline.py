@@ -8,12 +8,17 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
+from telethon.sessions import StringSession
 from telethon.errors import FloodWaitError, ChatAdminRequiredError
 
 # Импорт модулей
 from config import Config
 from modules.pipeline_manager import PipelineManager
 from modules.pipeline_commands import PipelineCommands
+from modules.rate_limiter import RateLimiter
+from modules.client_pool import ClientPool
+from modules.process_workers import ProcessSupervisor
+from modules.media_downloader import configure_media_downloads
 from safety_manager import SafetyManager
 
 # Настройка логирования
@@ -38,8 +43,14 @@ class TelegramUserbot:
         
         # Инициализация переменных
         self.client = None
+        self.client_pool = None
         self.pipeline_manager = None
+        self.process_supervisor = None
         self.pipeline_commands = None
+        self.monitoring = None
+        
+        # Общий ограничитель запросов для пайплайнов, пересылки и команд
+        self.rate_limiter = RateLimiter()
         
         # Статистика
         self.stats = {
@@ -70,35 +81,11 @@ class TelegramUserbot:
             
             if session_string:
                 # Используем строку сессии для автоматического входа
-                from telethon.sessions import StringSession
                 logger.info(f"🔐 Используем строку сессии длиной {len(session_string)} символов")
-                self.client = TelegramClient(
-                    StringSession(session_string),
-                    self.config.api_id,
-                    self.config.api_hash,
-                    system_version="4.16.30-vxCUSTOM",
-                    device_model="Samsung Galaxy S23",
-                    app_version="9.4.2"
-                )
+                self.client = self._create_client(StringSession(session_string))
             else:
                 # Обычный клиент с файловой сессией
-                self.client = TelegramClient(
-                    self.config.session_name,
-                    self.config.api_id,
-                    self.config.api_hash,
-                    system_version="4.16.30-vxCUSTOM",
-                    device_model="Samsung Galaxy S23",
-                    app_version="9.4.2"
-                )
-            
-            # Инициализация менеджера пайплайнов
-            self.pipeline_manager = PipelineManager(self.client)
-            
-            # Инициализация команд
-            self.pipeline_commands = PipelineCommands(self.client, self.pipeline_manager)
-            
-            # Инициализация менеджера безопасности
-            self.safety_manager = SafetyManager()
+                self.client = self._create_client(self.config.session_name)
             
             # Подключение к Telegram
             try:
@@ -118,6 +105,46 @@ class TelegramUserbot:
                 logger.error(f"❌ Ошибка при подключении: {e}")
                 raise
             
+            # Дополнительные сессии для распределения источников
+            clients = {'primary': self.client}
+            clients.update(await self.connect_extra_sessions())
+            self.client_pool = ClientPool(clients, {'primary': self.rate_limiter})
+            if len(clients) > 1:
+                logger.info(f"👥 Источники распределяются между {len(clients)} сессиями")
+            
+            # Общие лимиты загрузки медиа для шагов media
+            configure_media_downloads(
+                cache_size_mb=self.config.cache_size_mb,
+                max_concurrent=self.config.media_max_downloads,
+                bandwidth_kbps=self.config.media_bandwidth_kbps,
+                rate_limiters={session.client: session.rate_limiter for session in self.client_pool.sessions.values()},
+            )
+            
+            # Инициализация менеджера пайплайнов
+            self.pipeline_manager = PipelineManager(self.client, rate_limiter=self.rate_limiter, client_pool=self.client_pool)
+            
+            # Сессии без доступа к источнику не получают его при распределении
+            await self.client_pool.check_access({
+                name: source.id for name, source in self.pipeline_manager.sources.items() if source.enabled
+            })
+            
+            # Процессы-воркеры для обработки пайплайнов
+            if self.config.pipeline_processes > 0:
+                self.process_supervisor = ProcessSupervisor(
+                    self.config.pipeline_processes, self.client, self.rate_limiter,
+                    str(self.pipeline_manager.config_path), str(self.pipeline_manager.data_path),
+                    monitor=self.pipeline_manager.monitor
+                )
+                await self.process_supervisor.start()
+                self.pipeline_manager.process_supervisor = self.process_supervisor
+                logger.info(f"⚙️ Обработка пайплайнов в {self.config.pipeline_processes} процессах")
+            
+            # Инициализация команд
+            self.pipeline_commands = PipelineCommands(self.client, self.pipeline_manager)
+            
+            # Инициализация менеджера безопасности
+            self.safety_manager = SafetyManager(self.rate_limiter)
+            
             # Настройка команд
             await self.pipeline_commands.setup_commands()
             logger.info("✅ Команды пайплайнов настроены")
@@ -129,8 +156,12 @@ class TelegramUserbot:
             # Запуск всех активных пайплайнов
             await self.start_active_pipelines()
             
+            # Получение обновлений, пропущенных за время отключения
+            for session in self.client_pool.sessions.values():
+                await session.client.catch_up()
+            
             # Запуск мониторинга
-            asyncio.create_task(self.monitoring_task())
+            self.monitoring = asyncio.create_task(self.monitoring_task())
             
             self.stats['start_time'] = asyncio.get_event_loop().time()
             logger.info("🎉 Telegram Userbot успешно запущен!")
@@ -146,6 +177,47 @@ class TelegramUserbot:
             logger.error(f"❌ Критическая ошибка при запуске: {e}")
             raise
     
+    def _create_client(self, session) -> TelegramClient:
+        """Создание клиента с кастомными параметрами для обхода ограничений"""
+        return TelegramClient(
+            session,
+            self.config.api_id,
+            self.config.api_hash,
+            system_version="4.16.30-vxCUSTOM",
+            device_model="Samsung Galaxy S23",
+            app_version="9.4.2",
+            catch_up=True,
+            # FloodWait обрабатывается общим ограничителем, а не сном внутри Telethon
+            flood_sleep_threshold=0
+        )
+    
+    async def connect_extra_sessions(self) -> dict:
+        """Подключение дополнительных сессий; неавторизованные пропускаются"""
+        sessions = {}
+        for path in self.config.extra_session_string_files:
+            try:
+                with open(path, "r") as f:
+                    sessions[Path(path).stem] = StringSession(f.read().strip())
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось прочитать строку сессии {path}: {e}")
+        for name in self.config.extra_session_names:
+            sessions[name] = name
+        
+        clients = {}
+        for name, session in sessions.items():
+            client = self._create_client(session)
+            try:
+                await client.connect()
+                if not await client.is_user_authorized():
+                    logger.warning(f"⚠️ Сессия {name} не авторизована и не будет использована")
+                    await client.disconnect()
+                    continue
+                clients[name] = client
+                logger.info(f"✅ Подключена дополнительная сессия {name}")
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка подключения сессии {name}: {e}")
+        return clients
+    
     async def setup_basic_commands(self):
         """Настройка базовых команд"""
         
@@ -282,7 +354,7 @@ class TelegramUserbot:
                 
                 # Отправка отчета в указанный чат
                 if hasattr(self.config, 'admin_chat_id') and self.config.admin_chat_id:
-                    await self.client.send_message(self.config.admin_chat_id, report)
+                    await self.rate_limiter.call('send', self.client.send_message, self.config.admin_chat_id, report)
         
         except Exception as e:
             logger.error(f"❌ Ошибка отправки периодического отчета: {e}")
@@ -298,13 +370,17 @@ class TelegramUserbot:
             notification += f"• Активных пайплайнов: {self.stats['pipelines_active']}"
             
             if hasattr(self.config, 'admin_chat_id') and self.config.admin_chat_id:
-                await self.client.send_message(self.config.admin_chat_id, notification)
+                await self.rate_limiter.call('send', self.client.send_message, self.config.admin_chat_id, notification)
         
         except Exception as e:
             logger.error(f"❌ Ошибка отправки уведомления о запуске: {e}")
     
     # Обработчики базовых команд
     
+    async def _respond(self, event, text: str):
+        """Ответ на команду через общий ограничитель запросов"""
+        return await self.rate_limiter.call('send', event.respond, text)
+    
     async def ping_command_handler(self, event):
         """Обработчик команды .ping"""
         try:
@@ -313,19 +389,19 @@ class TelegramUserbot:
             response += f"📊 Сообщений обработано: {self.stats['messages_processed']}\n"
             response += f"🔄 Активных пайплайнов: {self.stats['pipelines_active']}"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка: {e}")
+            await self._respond(event, f"❌ Ошибка: {e}")
     
     async def info_command_handler(self, event):
         """Обработчик команды .info"""
         try:
             config_info = self.config.get_config_info()
-            await event.respond(config_info)
+            await self._respond(event, config_info)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения информации: {e}")
+            await self._respond(event, f"❌ Ошибка получения информации: {e}")
     
     async def help_command_handler(self, event):
         """Обработчик команды .help"""
@@ -358,16 +434,18 @@ class TelegramUserbot:
 
 📊 **Статистика и экспорт:**
 • `.stats_export all_pipelines` - Экспорт статистики
+• `.trends <name> [N]` - Тренды источника пайплайна
+• `.engagement <name> [N]` - Вовлеченность и обсуждения по окнам
 
 🔧 **Примеры использования:**
 • `.source_add news_channel -1001234567890`
 • `.destination_add telegram_dest telegram {"chat_id": -100111222333}`
 • `.pipeline_create news_analytics news_channel telegram_dest,export_file`
 """
-            await event.respond(help_text)
+            await self._respond(event, help_text)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка отображения справки: {e}")
+            await self._respond(event, f"❌ Ошибка отображения справки: {e}")
     
     async def status_command_handler(self, event):
         """Обработчик команды .status"""
@@ -387,6 +465,14 @@ class TelegramUserbot:
             status_text += f"• Всего: {stats['destinations_count']}\n"
             status_text += f"• Активных: {stats['active_destinations']}\n\n"
             
+            status_text += f"👥 **Сессии:**\n"
+            for name, session in self.client_pool.get_status().items():
+                state = "⏸️ ограничена" if session['limited'] else "✅"
+                status_text += f"• {name} {state}: источников {len(session['sources'])}, FloodWait: {session['flood_waits']}\n"
+                if session['no_access']:
+                    status_text += f"  нет доступа: {', '.join(session['no_access'])}\n"
+            status_text += "\n"
+            
             if stats['report']:
                 report = stats['report']
                 status_text += f"📈 **Статистика обработки:**\n"
@@ -394,19 +480,19 @@ class TelegramUserbot:
                 status_text += f"• Ошибок: {report['summary']['total_errors']}\n"
                 status_text += f"• Активных пайплайнов: {report['summary']['active_pipelines']}"
             
-            await event.respond(status_text)
+            await self._respond(event, status_text)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения статуса: {e}")
+            await self._respond(event, f"❌ Ошибка получения статуса: {e}")
     
     async def safety_command_handler(self, event):
         """Обработчик команды .safety"""
         try:
             safety_report = self.safety_manager.get_safety_report()
-            await event.respond(safety_report)
+            await self._respond(event, safety_report)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения отчета безопасности: {e}")
+            await self._respond(event, f"❌ Ошибка получения отчета безопасности: {e}")
     
     async def config_command_handler(self, event):
         """Обработчик команды .config"""
@@ -421,10 +507,10 @@ class TelegramUserbot:
             config_info += f"🎤 Голосовые: {'Да' if self.config.forward_voice else 'Нет'}\n"
             config_info += f"📄 Документы: {'Да' if self.config.forward_documents else 'Нет'}\n"
             
-            await event.respond(config_info)
+            await self._respond(event, config_info)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения конфигурации: {e}")
+            await self._respond(event, f"❌ Ошибка получения конфигурации: {e}")
     
     async def test_access_command_handler(self, event):
         """Обработчик команды .test_access"""
@@ -433,7 +519,7 @@ class TelegramUserbot:
             
             # Проверяем доступ к исходной группе
             try:
-                source_chat = await self.client.get_entity(self.config.source_group_id)
+                source_chat = await self.rate_limiter.call('entity', self.client.get_entity, self.config.source_group_id)
                 access_info += f"✅ Источник ({self.config.source_group_id}): Доступ есть\n"
                 access_info += f"   Название: {getattr(source_chat, 'title', 'Неизвестно')}\n"
             except Exception as e:
@@ -441,21 +527,21 @@ class TelegramUserbot:
             
             # Проверяем доступ к целевой группе
             try:
-                target_chat = await self.client.get_entity(self.config.target_group_id)
+                target_chat = await self.rate_limiter.call('entity', self.client.get_entity, self.config.target_group_id)
                 access_info += f"✅ Назначение ({self.config.target_group_id}): Доступ есть\n"
                 access_info += f"   Название: {getattr(target_chat, 'title', 'Неизвестно')}\n"
             except Exception as e:
                 access_info += f"❌ Назначение ({self.config.target_group_id}): Нет доступа - {e}\n"
             
-            await event.respond(access_info)
+            await self._respond(event, access_info)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка проверки доступа: {e}")
+            await self._respond(event, f"❌ Ошибка проверки доступа: {e}")
     
     async def test_media_command_handler(self, event):
         """Обработчик команды .test_media"""
         try:
-            await event.respond("🔄 Тестирование пересылки медиа...")
+            await self._respond(event, "🔄 Тестирование пересылки медиа...")
             
             # Проверяем настройки медиа
             media_info = f"📋 **Настройки медиа:**\n\n"
@@ -468,10 +554,10 @@ class TelegramUserbot:
             media_info += f"📤 Назначение: {self.config.target_group_id}\n\n"
             media_info += f"✅ Отправьте картинку в группу для тестирования!"
             
-            await event.respond(media_info)
+            await self._respond(event, media_info)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка тестирования медиа: {e}")
+            await self._respond(event, f"❌ Ошибка тестирования медиа: {e}")
     
     async def forward_message_handler(self, event):
         """Обработчик пересылки сообщений"""
@@ -571,12 +657,23 @@ class TelegramUserbot:
         try:
             logger.info("🛑 Остановка Telegram Userbot...")
             
-            # Остановка всех пайплайнов
-            for pipeline_name in self.pipeline_manager.pipelines:
-                await self.pipeline_manager.stop_pipeline(pipeline_name)
+            if self.monitoring:
+                self.monitoring.cancel()
+            
+            # Остановка всех пайплайнов с дообработкой очередей и сохранением контрольных точек
+            if self.pipeline_manager:
+                await self.pipeline_manager.stop_all()
+            
+            # Остановка процессов-воркеров после дообработки очередей
+            if self.process_supervisor:
+                await self.process_supervisor.stop()
             
             # Отключение от Telegram
-            await self.client.disconnect()
+            if self.client_pool:
+                for session in self.client_pool.sessions.values():
+                    await session.client.disconnect()
+            elif self.client:
+                await self.client.disconnect()
             
             logger.info("✅ Telegram Userbot остановлен")
         
@@ -4,6 +4,16 @@
 
 from .pipeline_manager import PipelineManager, Source, Destination, Pipeline, PipelineStats, PipelineMonitor
 from .pipeline_commands import PipelineCommands
+from .source_reader import SourceReader
+from .source_filters import SourceFilter
+from .checkpoints import CheckpointStore
+from .pipeline_workers import PipelineWorkerPool
+from .process_workers import ProcessSupervisor
+from .processing_steps import ExecutionPlan, register_step
+from .nlp_analysis import AnalyzerPool
+from .message_record import MessageRecord, MessageView
+from .media_downloader import MediaDownloader
+from .destination_writers import DestinationWriter, register_writer
 
 __all__ = [
     'PipelineManager',
@@ -12,5 +22,18 @@ __all__ = [
     'Pipeline', 
     'PipelineStats', 
     'PipelineMonitor',
-    'PipelineCommands'
+    'PipelineCommands',
+    'SourceReader',
+    'SourceFilter',
+    'CheckpointStore',
+    'PipelineWorkerPool',
+    'ProcessSupervisor',
+    'ExecutionPlan',
+    'register_step',
+    'AnalyzerPool',
+    'MessageRecord',
+    'MessageView',
+    'MediaDownloader',
+    'DestinationWriter',
+    'register_writer'
 ] 
\ No newline at end of file
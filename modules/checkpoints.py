@@ -0,0 +1,96 @@
+"""
+Контрольные точки пайплайнов: последний обработанный ID сообщения по каждому источнику
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Optional
+from pathlib import Path
+
+class CheckpointStore:
+    """Хранилище контрольных точек с пакетной атомарной записью на диск"""
+
+    def __init__(self, path: str = "./data/checkpoints.json", flush_interval: float = 5.0, flush_every: int = 500):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.checkpoints: Dict[str, Dict[str, int]] = {}
+        self.pending_updates = 0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.logger = logging.getLogger(__name__)
+
+        self.load()
+
+    def load(self):
+        """Загрузка контрольных точек с диска"""
+        try:
+            if self.path.exists():
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.checkpoints = json.load(f).get('checkpoints', {})
+                self.logger.info(f"Загружены контрольные точки для {len(self.checkpoints)} пайплайнов")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки контрольных точек {self.path}: {e}")
+
+    def get(self, pipeline_name: str, source_name: str) -> int:
+        """Последний обработанный ID сообщения пайплайна в источнике"""
+        return self.checkpoints.get(pipeline_name, {}).get(source_name, 0)
+
+    def update(self, pipeline_name: str, source_name: str, message_id: int):
+        """Обновление контрольной точки (запись на диск выполняется пакетно)"""
+        pipeline_checkpoints = self.checkpoints.setdefault(pipeline_name, {})
+        if message_id <= pipeline_checkpoints.get(source_name, 0):
+            return
+
+        pipeline_checkpoints[source_name] = message_id
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_every:
+            self.flush()
+
+    def reset(self, pipeline_name: str, source_name: Optional[str] = None):
+        """Сброс контрольных точек пайплайна"""
+        if source_name is None:
+            self.checkpoints.pop(pipeline_name, None)
+        else:
+            self.checkpoints.get(pipeline_name, {}).pop(source_name, None)
+        self.pending_updates += 1
+        self.flush()
+
+    def flush(self):
+        """Атомарная запись контрольных точек: временный файл и замена"""
+        if not self.pending_updates:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'checkpoints': self.checkpoints}, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.pending_updates = 0
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения контрольных точек {self.path}: {e}")
+
+    def start(self):
+        """Запуск периодической записи контрольных точек"""
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Периодическая запись накопленных изменений"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def close(self):
+        """Остановка периодической записи и финальное сохранение"""
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+        self.flush()
@@ -0,0 +1,249 @@
+"""
+Пул Telegram-сессий: распределение источников по аккаунтам и переключение при ограничениях
+"""
+
+import math
+import bisect
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from telethon import TelegramClient
+from telethon.errors import (
+    FloodWaitError, ChannelPrivateError, ChannelInvalidError, ChatForbiddenError,
+    ChatIdInvalidError, PeerIdInvalidError, UserBannedInChannelError
+)
+
+from .rate_limiter import RateLimiter
+
+# Ошибки сессии без доступа к источнику. ValueError - Telethon не может найти источник
+# среди известных сессии чатов (сессия не состоит в чате)
+ACCESS_ERRORS = (
+    ValueError, ChannelPrivateError, ChannelInvalidError, ChatForbiddenError,
+    ChatIdInvalidError, PeerIdInvalidError, UserBannedInChannelError
+)
+
+class Session:
+    """Одна Telegram-сессия пула со своим ограничителем запросов"""
+
+    def __init__(self, name: str, client: TelegramClient, rate_limiter: RateLimiter):
+        self.name = name
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.sources: set = set()
+
+    @property
+    def is_limited(self) -> bool:
+        """Сессия приостановлена после FloodWait на чтение истории"""
+        return self.rate_limiter.is_paused('history')
+
+class ClientPool:
+    """Распределение источников по сессиям через согласованное хеширование с учетом нагрузки"""
+
+    def __init__(self, clients: Dict[str, TelegramClient], rate_limiters: Optional[Dict[str, RateLimiter]] = None,
+                 virtual_nodes: int = 64, load_factor: float = 1.25, failover_threshold: float = 30.0):
+        if not clients:
+            raise ValueError("Пул сессий не может быть пустым")
+
+        rate_limiters = rate_limiters or {}
+        self.sessions: Dict[str, Session] = {
+            name: Session(name, client, rate_limiters.get(name) or RateLimiter())
+            for name, client in clients.items()
+        }
+        self.load_factor = load_factor
+        self.failover_threshold = failover_threshold
+        self.assignments: Dict[str, str] = {}
+        # Источник -> сессии без доступа к нему; такие сессии источнику не назначаются
+        self.no_access: Dict[str, Set[str]] = {}
+        self.event_handlers: Dict[str, List[Tuple[Callable, Any]]] = {}
+        self.logger = logging.getLogger(__name__)
+
+        # Кольцо согласованного хеширования с виртуальными узлами
+        self.ring: List[Tuple[int, str]] = sorted(
+            (self._hash(f"{name}#{i}"), name)
+            for name in self.sessions
+            for i in range(virtual_nodes)
+        )
+        self.ring_keys = [key for key, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    @property
+    def primary(self) -> Session:
+        """Основная сессия (первая в конфигурации)"""
+        return next(iter(self.sessions.values()))
+
+    def _candidates(self, source_name: str) -> List[str]:
+        """Сессии в порядке обхода кольца от хеша источника"""
+        start = bisect.bisect(self.ring_keys, self._hash(source_name))
+        order: List[str] = []
+        for i in range(len(self.ring)):
+            name = self.ring[(start + i) % len(self.ring)][1]
+            if name not in order:
+                order.append(name)
+                if len(order) == len(self.sessions):
+                    break
+        return order
+
+    def _pick(self, source_name: str, exclude: Optional[str] = None) -> Session:
+        """Выбор сессии: первая по кольцу с доступом к источнику, не ограниченная и не перегруженная"""
+        no_access = self.no_access.get(source_name, set())
+        candidates = [
+            name for name in self._candidates(source_name) if name != exclude and name not in no_access
+        ] or [exclude or self._candidates(source_name)[0]]
+        assigned = sum(len(session.sources) for session in self.sessions.values())
+        max_load = math.ceil(self.load_factor * (assigned + 1) / len(self.sessions))
+
+        for name in candidates:
+            session = self.sessions[name]
+            if not session.is_limited and len(session.sources) < max_load:
+                return session
+        for name in candidates:
+            if not self.sessions[name].is_limited:
+                return self.sessions[name]
+        return self.sessions[candidates[0]]
+
+    def session_for(self, source_name: str) -> Session:
+        """Сессия, закрепленная за источником"""
+        name = self.assignments.get(source_name)
+        if name is None:
+            session = self._pick(source_name)
+            self._assign(source_name, session)
+            return session
+        return self.sessions[name]
+
+    def _assign(self, source_name: str, session: Session):
+        previous = self.assignments.get(source_name)
+        if previous:
+            self.sessions[previous].sources.discard(source_name)
+        self.assignments[source_name] = session.name
+        session.sources.add(source_name)
+        self.logger.info(f"Источник {source_name} закреплен за сессией {session.name}")
+
+    def release(self, source_name: str):
+        """Освобождение источника"""
+        name = self.assignments.pop(source_name, None)
+        if name:
+            self.sessions[name].sources.discard(source_name)
+
+    def mark_no_access(self, source_name: str, session_name: str):
+        """Сессия не может читать источник: больше не назначается ему"""
+        self.no_access.setdefault(source_name, set()).add(session_name)
+        self.logger.warning(f"Сессия {session_name} не имеет доступа к источнику {source_name}")
+
+    def failover(self, source_name: str, no_access: bool = False) -> Session:
+        """Перенос источника на другую сессию вместе с обработчиками событий
+
+        no_access - текущая сессия не имеет доступа к источнику и больше не назначается ему.
+        """
+        current = self.session_for(source_name)
+        if no_access:
+            self.mark_no_access(source_name, current.name)
+        target = self._pick(source_name, exclude=current.name)
+        if target is current or target.name in self.no_access.get(source_name, set()):
+            return current
+
+        for handler, event in self.event_handlers.get(source_name, []):
+            current.client.remove_event_handler(handler, event)
+            target.client.add_event_handler(handler, event)
+        self._assign(source_name, target)
+        self.logger.warning(f"Источник {source_name} переключен с сессии {current.name} на {target.name}")
+        return target
+
+    def add_event_handler(self, source_name: str, handler: Callable, event):
+        """Регистрация обработчика событий источника на его сессии"""
+        self.session_for(source_name).client.add_event_handler(handler, event)
+        self.event_handlers.setdefault(source_name, []).append((handler, event))
+
+    def remove_event_handler(self, source_name: str, handler: Callable, event):
+        """Удаление обработчика событий источника"""
+        handlers = self.event_handlers.get(source_name, [])
+        if (handler, event) in handlers:
+            handlers.remove((handler, event))
+            self.session_for(source_name).client.remove_event_handler(handler, event)
+
+    async def call(self, source_name: str, request_type: str, method: str, *args, **kwargs) -> Any:
+        """Вызов метода клиента источника с переключением сессии при долгом FloodWait или без доступа"""
+        while True:
+            session = self.session_for(source_name)
+            try:
+                return await session.rate_limiter.call(
+                    request_type, getattr(session.client, method), *args,
+                    max_flood_wait=self._failover_limit(), **kwargs
+                )
+            except FloodWaitError:
+                if self.failover(source_name) is session:
+                    raise
+            except ACCESS_ERRORS:
+                if self.failover(source_name, no_access=True) is session:
+                    raise
+
+    async def iter_messages(self, source_name: str, entity, **kwargs):
+        """iter_messages источника с продолжением на другой сессии при долгом FloodWait или без доступа"""
+        while True:
+            session = self.session_for(source_name)
+            try:
+                async for message in session.rate_limiter.iter_messages(
+                    session.client, entity, max_flood_wait=self._failover_limit(), **kwargs
+                ):
+                    # Продолжение на другой сессии начнется со следующего сообщения
+                    if kwargs.get('reverse'):
+                        kwargs['min_id'] = message.id
+                    else:
+                        kwargs['offset_id'] = message.id
+                    if kwargs.get('limit') is not None:
+                        kwargs['limit'] -= 1
+                    yield message
+                return
+            except FloodWaitError:
+                if self.failover(source_name) is session:
+                    raise
+            except ACCESS_ERRORS:
+                if self.failover(source_name, no_access=True) is session:
+                    raise
+
+    async def check_access(self, sources: Dict[str, int]):
+        """Проверка доступа сессий к источникам (ID) до их назначения
+
+        Сессии без доступа запоминаются и не получают источник. Если источник не найден
+        среди известных сессии чатов, перед повторной проверкой загружается список диалогов.
+        """
+        if len(self.sessions) < 2:
+            return
+        for session in self.sessions.values():
+            dialogs_loaded = False
+            for source_name, source_id in sources.items():
+                while True:
+                    try:
+                        await session.rate_limiter.call('entity', session.client.get_entity, source_id)
+                    except ValueError:
+                        if not dialogs_loaded:
+                            dialogs_loaded = True
+                            try:
+                                await session.client.get_dialogs()
+                                continue
+                            except Exception as e:
+                                self.logger.warning(f"Не удалось загрузить диалоги сессии {session.name}: {e}")
+                        self.mark_no_access(source_name, session.name)
+                    except ACCESS_ERRORS:
+                        self.mark_no_access(source_name, session.name)
+                    except Exception as e:
+                        self.logger.warning(f"Ошибка проверки доступа сессии {session.name} к {source_name}: {e}")
+                    break
+
+    def _failover_limit(self) -> Optional[float]:
+        # С одной сессией переключаться некуда, FloodWait просто пережидается
+        return self.failover_threshold if len(self.sessions) > 1 else None
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние сессий пула"""
+        return {
+            name: {
+                'sources': sorted(session.sources),
+                'limited': session.is_limited,
+                'flood_waits': sum(session.rate_limiter.flood_waits.values()),
+                'no_access': sorted(name for name, sessions in self.no_access.items() if session.name in sessions),
+            }
+            for name, session in self.sessions.items()
+        }
@@ -0,0 +1,197 @@
+"""
+Удаление дубликатов сообщений: отпечаток текста и медиа, LRU с TTL и вращаемый фильтр Блума
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from pathlib import Path
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+def message_fingerprint(text: str, media: Optional[Dict[str, Any]] = None) -> Optional[bytes]:
+    """Отпечаток сообщения: нормализованный текст и ID медиа; None - сравнивать нечего
+
+    media - описание медиа из данных сообщения (тип и ID файла): оно есть и у снимков
+    сообщений в процессах-воркерах.
+    """
+    normalized = _NON_WORD.sub(' ', text.lower().replace('ё', 'е')).strip()
+    media_id = f"{media.get('type')}:{media['id']}" if media and media.get('id') is not None else ''
+
+    if not normalized and not media_id:
+        return None
+    key = normalized + '|' + media_id
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+class BloomFilter:
+    """Фильтр Блума фиксированного размера"""
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytearray] = None,
+                 count: int = 0, created_at: Optional[float] = None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None and len(bits) == (self.size + 7) // 8 else bytearray((self.size + 7) // 8)
+        self.count = count
+        self.created_at = created_at or time.time()
+
+    def _positions(self, key: bytes):
+        # Двойное хеширование: позиции из двух половин 128-битного отпечатка
+        h1 = int.from_bytes(key[:8], 'big')
+        h2 = int.from_bytes(key[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class DedupStore:
+    """Множество виденных отпечатков с ограниченной памятью и сохранением между перезапусками
+
+    Недавние отпечатки хранятся в LRU с TTL. Фильтр Блума (два поколения, текущее и
+    предыдущее) помнит отпечатки за пределами LRU; поколение сменяется при заполнении
+    или по истечении TTL, поэтому горизонт фильтра - от одного до двух TTL.
+    Состояние загружается при первом обращении и сохраняется пакетно.
+
+    В LRU вместе с отпечатком хранится владелец - источник и ID сообщения. Сообщение,
+    прочитанное повторно после перезапуска (состояние сохраняется раньше контрольной
+    точки), совпадает со своей же записью и повтором не считается.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: float = 7 * 24 * 3600,
+                 use_bloom: bool = True, bloom_capacity: int = 1000000, bloom_error_rate: float = 0.001,
+                 flush_every: int = 1000):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_bloom = use_bloom
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.flush_every = flush_every
+        # Отпечаток -> (время, владелец)
+        self.recent: "OrderedDict[bytes, Tuple[float, Optional[str]]]" = OrderedDict()
+        self.blooms: list = []
+        self.pending_updates = 0
+        self.loaded = False
+        self.duplicates = 0
+        self.logger = logging.getLogger(__name__)
+
+    def _bloom_path(self, generation: int) -> Path:
+        return self.path.with_suffix(f'.bloom{generation}')
+
+    def load(self):
+        """Загрузка состояния с диска"""
+        self.loaded = True
+        if self.use_bloom:
+            self.blooms = [self._new_bloom()]
+
+        try:
+            if not self.path.exists():
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+
+            now = time.time()
+            for key, seen_at, *owner in state.get('recent', []):
+                if now - seen_at < self.ttl:
+                    self.recent[bytes.fromhex(key)] = (seen_at, owner[0] if owner else None)
+
+            if self.use_bloom:
+                blooms = []
+                for generation, meta in enumerate(state.get('blooms', [])):
+                    bloom_path = self._bloom_path(generation)
+                    if bloom_path.exists() and meta.get('capacity') == self.bloom_capacity:
+                        blooms.append(BloomFilter(
+                            self.bloom_capacity, self.bloom_error_rate,
+                            bytearray(bloom_path.read_bytes()), meta.get('count', 0), meta.get('created_at')
+                        ))
+                self.blooms = blooms or self.blooms
+
+            self.logger.info(f"Загружено состояние дедупликации {self.path}: {len(self.recent)} недавних отпечатков")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки состояния дедупликации {self.path}: {e}")
+
+    def _new_bloom(self) -> BloomFilter:
+        return BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+
+    def check_and_add(self, key: bytes, owner: Optional[str] = None) -> bool:
+        """Проверка отпечатка; True - сообщение уже встречалось. Новый отпечаток запоминается
+
+        owner - источник и ID сообщения: совпадение с записью того же сообщения не повтор.
+        """
+        if not self.loaded:
+            self.load()
+
+        now = time.time()
+        seen_at, seen_owner = self.recent.get(key, (None, None))
+        if seen_at is not None and now - seen_at < self.ttl:
+            self.recent.move_to_end(key)
+            if owner is not None and seen_owner == owner:
+                return False
+            self.duplicates += 1
+            return True
+
+        if self.use_bloom and any(key in bloom for bloom in self.blooms):
+            self.duplicates += 1
+            return True
+
+        self.recent[key] = (now, owner)
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.max_entries:
+            self.recent.popitem(last=False)
+
+        if self.use_bloom:
+            current = self.blooms[0]
+            if current.count >= self.bloom_capacity or now - current.created_at >= self.ttl:
+                # Смена поколения: самое старое забывается целиком
+                current = self._new_bloom()
+                self.blooms = [current] + self.blooms[:1]
+            current.add(key)
+
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_every:
+            self.flush()
+        return False
+
+    def flush(self):
+        """Атомарная запись состояния: временные файлы и замена"""
+        if not self.loaded or not self.pending_updates:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.use_bloom:
+                for generation, bloom in enumerate(self.blooms):
+                    self._write_atomic(self._bloom_path(generation), bytes(bloom.bits))
+
+            state: Dict[str, Any] = {
+                'recent': [[key.hex(), seen_at, owner] for key, (seen_at, owner) in self.recent.items()],
+                'blooms': [
+                    {'capacity': bloom.capacity, 'count': bloom.count, 'created_at': bloom.created_at}
+                    for bloom in self.blooms
+                ],
+            }
+            self._write_atomic(self.path, json.dumps(state).encode('utf-8'))
+            self.pending_updates = 0
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения состояния дедупликации {self.path}: {e}")
+
+    @staticmethod
+    def _write_atomic(path: Path, payload: bytes):
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,390 @@
+"""
+Запись в назначения пачками: буфер назначения сбрасывается по размеру пачки, объему или задержке
+"""
+
+import json
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type
+
+class DestinationWriter:
+    """Буфер записей назначения
+
+    Записи копятся до max_batch штук, max_bytes байт или max_latency_ms миллисекунд
+    с первой записи в буфере и передаются в write_batch одним вызовом. Реализации
+    назначений переопределяют prepare (представление записи в буфере) и write_batch.
+    Пока пачка записывается, новые записи копятся в следующую; если и она заполнилась,
+    запись ждет окончания предыдущей.
+
+    Неудачная пачка повторяется max_retries раз с удвоением задержки retry_delay_ms,
+    после этого сохраняется в failed_path. Перед исключением write_batch удаляет из
+    пачки уже записанные элементы: повтор и сохранение затрагивают только остаток.
+    write возвращает future, который завершается после записи пачки с этой записью:
+    True - записана, False - нет.
+    """
+
+    # Обязательные параметры config назначения
+    REQUIRED: Tuple[str, ...] = ()
+
+    DEFAULTS: Dict[str, float] = {
+        'max_batch': 100, 'max_latency_ms': 1000, 'max_bytes': 1024 * 1024,
+        'max_retries': 3, 'retry_delay_ms': 1000,
+    }
+
+    def __init__(self, destination, client=None, rate_limiter=None):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.buffer: List[Any] = []
+        self.buffer_bytes = 0
+        # Future записей буфера, по одному на запись
+        self.futures: List[asyncio.Future] = []
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.logger = logging.getLogger(__name__)
+        self.bind(destination)
+
+    def bind(self, destination):
+        """Назначение и параметры пачек (после перезагрузки конфигурации)"""
+        self.destination = destination
+        config = destination.config
+        self.max_batch = max(1, int(config.get('max_batch', self.DEFAULTS['max_batch'])))
+        self.max_latency = float(config.get('max_latency_ms', self.DEFAULTS['max_latency_ms'])) / 1000
+        self.max_bytes = int(config.get('max_bytes', self.DEFAULTS['max_bytes']))
+        self.max_retries = max(0, int(config.get('max_retries', self.DEFAULTS['max_retries'])))
+        self.retry_delay = float(config.get('retry_delay_ms', self.DEFAULTS['retry_delay_ms'])) / 1000
+        self.failed_path = config.get('failed_path', './data/failed/')
+
+    def prepare(self, record: Dict[str, Any]) -> Any:
+        """Представление записи в буфере (например, строка JSON)"""
+        return record
+
+    def failed_record(self, item: Any) -> Any:
+        """Запись для файла неудачных пачек по элементу буфера"""
+        return item
+
+    def size_of(self, item: Any) -> int:
+        if isinstance(item, (str, bytes)):
+            return len(item)
+        return len(json.dumps(item, ensure_ascii=False, default=str))
+
+    async def write_batch(self, items: List[Any]):
+        """Запись пачки; реализуется в классах назначений"""
+        raise NotImplementedError
+
+    async def write(self, record: Dict[str, Any]) -> asyncio.Future:
+        """Добавление записи в буфер; при заполнении буфера - запись пачки
+
+        Возвращает future, завершающийся после записи пачки с этой записью.
+        """
+        future = asyncio.get_running_loop().create_future()
+        item = self.prepare(record)
+        if item is None:
+            future.set_result(True)
+            return future
+        self.buffer.append(item)
+        self.futures.append(future)
+        self.buffer_bytes += self.size_of(item)
+
+        if len(self.buffer) >= self.max_batch or self.buffer_bytes >= self.max_bytes:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_latency, self._flush_later)
+        return future
+
+    def _flush_later(self):
+        self.timer = None
+        task = asyncio.ensure_future(self.flush())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self):
+        """Запись накопленной пачки"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        async with self.lock:
+            if not self.buffer:
+                return
+            batch, futures = self.buffer, self.futures
+            self.buffer, self.futures, self.buffer_bytes = [], [], 0
+            written = await self._write_with_retries(batch)
+            for future in futures:
+                if not future.done():
+                    future.set_result(written)
+
+    async def _write_with_retries(self, batch: List[Any]) -> bool:
+        """Запись пачки с повторами; неудачный остаток пачки сохраняется в failed_path"""
+        total = len(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.write_batch(batch)
+                self.destination.success_count += total
+                self.destination.last_success = datetime.now()
+                return True
+            except Exception as e:
+                if attempt < self.max_retries:
+                    delay = self.retry_delay * 2 ** attempt
+                    self.logger.warning(
+                        f"Ошибка записи {len(batch)} записей в назначение {self.destination.name}: {e}, "
+                        f"повтор через {delay:.1f}с"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                self.logger.error(f"Ошибка записи {len(batch)} записей в назначение {self.destination.name}: {e}")
+                self.destination.success_count += total - len(batch)
+                self.destination.error_count += len(batch)
+                await self._save_failed(batch)
+                return False
+
+    async def _save_failed(self, batch: List[Any]):
+        """Сохранение неудачной пачки строками JSON, чтобы записи можно было отправить повторно"""
+        import aiofiles
+
+        try:
+            Path(self.failed_path).mkdir(parents=True, exist_ok=True)
+            filename = Path(self.failed_path) / f"{self.destination.name}_{datetime.now().strftime('%Y%m%d')}.jsonl"
+            lines = ''.join(
+                json.dumps(self.failed_record(item), ensure_ascii=False, default=str) + '\n' for item in batch
+            )
+            async with aiofiles.open(filename, 'a', encoding='utf-8') as f:
+                await f.write(lines)
+            self.logger.warning(f"Неудачная пачка назначения {self.destination.name} сохранена в {filename}")
+        except Exception as e:
+            self.logger.error(f"Не удалось сохранить неудачную пачку назначения {self.destination.name}: {e}")
+
+    async def close(self):
+        """Запись остатка буфера и ожидание отложенных записей"""
+        await self.flush()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+# Тип назначения -> класс записи
+WRITER_REGISTRY: Dict[str, Type[DestinationWriter]] = {}
+
+def register_writer(destination_type: str) -> Callable[[Type[DestinationWriter]], Type[DestinationWriter]]:
+    """Регистрация класса записи для типа назначения"""
+    def decorator(writer_class: Type[DestinationWriter]) -> Type[DestinationWriter]:
+        WRITER_REGISTRY[destination_type] = writer_class
+        return writer_class
+    return decorator
+
+def destination_error(destination) -> Optional[str]:
+    """Ошибка конфигурации назначения или None: неизвестный тип, нет обязательных параметров"""
+    writer_class = WRITER_REGISTRY.get(destination.type)
+    if writer_class is None:
+        return f"запись в назначения типа {destination.type} не поддерживается"
+    missing = [key for key in writer_class.REQUIRED if not destination.config.get(key)]
+    if missing:
+        return f"не заданы параметры {', '.join(missing)}"
+    return None
+
+def create_writer(destination, client=None, rate_limiter=None) -> DestinationWriter:
+    """Запись для назначения по его типу; ValueError - тип не поддерживается"""
+    writer_class = WRITER_REGISTRY.get(destination.type)
+    if writer_class is None:
+        raise ValueError(f"Запись в назначения типа {destination.type} не поддерживается")
+    return writer_class(destination, client=client, rate_limiter=rate_limiter)
+
+def record_id(record: Dict[str, Any]) -> Optional[str]:
+    """Постоянный ID записи: повторная запись той же записи заменяет ее, а не дублирует"""
+    message_id = record.get('message_id')
+    if message_id is None:
+        return None
+    parts = [record.get('pipeline'), record.get('source'), message_id, record.get('event')]
+    return ':'.join(str(part) for part in parts if part is not None)
+
+@register_writer('telegram')
+class TelegramWriter(DestinationWriter):
+    """Отправка в чат Telegram: по сообщению на запись через общий ограничитель"""
+
+    # Сообщения отправляются сразу, если пачки не заданы явно
+    DEFAULTS = {**DestinationWriter.DEFAULTS, 'max_batch': 1}
+
+    def prepare(self, record: Dict[str, Any]) -> Optional[str]:
+        text = record.get('text', '')
+        if self.destination.config.get('format') == 'markdown':
+            return f"**Сообщение из {record.get('source')}**\n\n{text}"
+        return f"Сообщение из {record.get('source')}:\n\n{text}"
+
+    async def write_batch(self, items: List[str]):
+        chat_id = self.destination.config.get('chat_id')
+        if not chat_id:
+            return
+        for sent, text in enumerate(items):
+            try:
+                await self.rate_limiter.call('send', self.client.send_message, chat_id, text)
+            except Exception:
+                # Повтор продолжает с первого неотправленного сообщения
+                del items[:sent]
+                raise
+
+@register_writer('file')
+class FileWriter(DestinationWriter):
+    """Экспорт в файл: пачка строк JSON дописывается одной записью"""
+
+    def prepare(self, record: Dict[str, Any]) -> Optional[str]:
+        if self.destination.config.get('format', 'json') != 'json':
+            return None
+        return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+    def failed_record(self, item: str) -> Any:
+        return json.loads(item)
+
+    async def write_batch(self, items: List[str]):
+        import aiofiles
+
+        file_path = self.destination.config.get('path', './data/exports/')
+        Path(file_path).mkdir(parents=True, exist_ok=True)
+        filename = f"{file_path}/export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        async with aiofiles.open(filename, 'a', encoding='utf-8') as f:
+            await f.write(''.join(items))
+
+@register_writer('database')
+class DatabaseWriter(DestinationWriter):
+    """PostgreSQL: пачка вставляется одним запросом INSERT ... VALUES
+
+    Запись хранится целиком в jsonb; постоянный ID записи - первичный ключ,
+    поэтому повтор пачки не создает дубликатов.
+    """
+
+    REQUIRED = ('connection_string',)
+
+    def __init__(self, destination, client=None, rate_limiter=None):
+        super().__init__(destination, client=client, rate_limiter=rate_limiter)
+        self.connection = None
+
+    def prepare(self, record: Dict[str, Any]) -> Tuple[str, Any, Any, str]:
+        return (
+            record_id(record) or uuid.uuid4().hex, record.get('source'), record.get('message_id'),
+            json.dumps(record, ensure_ascii=False, default=str)
+        )
+
+    def size_of(self, item: Tuple[str, Any, Any, str]) -> int:
+        return len(item[3])
+
+    def failed_record(self, item: Tuple[str, Any, Any, str]) -> Any:
+        return json.loads(item[3])
+
+    def _table(self):
+        from psycopg2 import sql
+
+        # Имя таблицы может включать схему: schema.table
+        return sql.Identifier(*self.destination.config.get('table', 'parsed_messages').split('.'))
+
+    def _connect(self):
+        import psycopg2
+        from psycopg2 import sql
+
+        if self.connection is None or self.connection.closed:
+            self.connection = psycopg2.connect(self.destination.config['connection_string'])
+            with self.connection, self.connection.cursor() as cursor:
+                cursor.execute(sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} (id text PRIMARY KEY, source text, message_id bigint, "
+                    "data jsonb NOT NULL, created_at timestamptz NOT NULL DEFAULT now())"
+                ).format(self._table()))
+        return self.connection
+
+    def _insert(self, items: List[Tuple[str, Any, Any, str]]):
+        from psycopg2 import sql
+        from psycopg2.extras import execute_values
+
+        connection = self._connect()
+        query = sql.SQL(
+            "INSERT INTO {} (id, source, message_id, data) VALUES %s ON CONFLICT (id) DO NOTHING"
+        ).format(self._table())
+        try:
+            with connection, connection.cursor() as cursor:
+                execute_values(cursor, query.as_string(connection), items, page_size=len(items))
+        except Exception:
+            # Соединение после сетевой ошибки не переиспользуется
+            connection.close()
+            self.connection = None
+            raise
+
+    async def write_batch(self, items: List[Tuple[str, Any, Any, str]]):
+        await asyncio.to_thread(self._insert, items)
+
+    async def close(self):
+        await super().close()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+@register_writer('webhook')
+class WebhookWriter(DestinationWriter):
+    """Webhook: пачка записей отправляется одним запросом с массивом JSON"""
+
+    REQUIRED = ('url',)
+
+    def bind(self, destination):
+        super().bind(destination)
+        # Повторы webhook задаются в processing_rules
+        rules = destination.processing_rules
+        if 'retry_on_failure' in rules:
+            self.max_retries = int(rules.get('max_retries', self.max_retries)) if rules['retry_on_failure'] else 0
+
+    async def write_batch(self, items: List[Dict[str, Any]]):
+        import requests
+
+        config = self.destination.config
+        timeout = float(self.destination.processing_rules.get('timeout', 30))
+        body = json.dumps(items, ensure_ascii=False, default=str).encode('utf-8')
+
+        def send():
+            response = requests.request(
+                config.get('method', 'POST'), config['url'], data=body,
+                headers={'Content-Type': 'application/json', **config.get('headers', {})},
+                timeout=timeout
+            )
+            response.raise_for_status()
+
+        await asyncio.to_thread(send)
+
+@register_writer('elasticsearch')
+class ElasticsearchWriter(DestinationWriter):
+    """Elasticsearch: пачка индексируется одним запросом _bulk
+
+    У документа постоянный _id, поэтому повторная индексация заменяет документ.
+    Повторяются только документы, которые Elasticsearch не проиндексировал.
+    """
+
+    def prepare(self, record: Dict[str, Any]) -> str:
+        action: Dict[str, Any] = {'_index': self.destination.config.get('index', 'telegram_messages')}
+        document_id = record_id(record)
+        if document_id is not None:
+            action['_id'] = document_id
+        return json.dumps({'index': action}) + '\n' + json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+    def failed_record(self, item: str) -> Any:
+        return json.loads(item.split('\n')[1])
+
+    async def write_batch(self, items: List[str]):
+        import requests
+
+        config = self.destination.config
+        host = (config.get('hosts') or ['localhost:9200'])[0]
+        url = f"{host if '://' in host else 'http://' + host}/_bulk"
+        auth = (config['username'], config.get('password', '')) if config.get('username') else None
+
+        def send() -> Dict[str, Any]:
+            response = requests.post(
+                url, data=''.join(items).encode('utf-8'), auth=auth,
+                headers={'Content-Type': 'application/x-ndjson'},
+                timeout=float(self.destination.processing_rules.get('timeout', 30))
+            )
+            response.raise_for_status()
+            return response.json()
+
+        result = await asyncio.to_thread(send)
+        if result.get('errors'):
+            # Ответ _bulk содержит результаты в порядке запроса: остаются только неудачные
+            failed = [
+                item for item, outcome in zip(items, result.get('items', []))
+                if next(iter(outcome.values()), {}).get('status', 500) >= 300
+            ]
+            items[:] = failed
+            raise RuntimeError(f"не проиндексировано {len(failed)} документов пачки")
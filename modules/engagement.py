@@ -0,0 +1,340 @@
+"""
+Вовлеченность и обсуждения: граф ответов по чатам и сводки по временным окнам без пересчета истории
+"""
+
+import os
+import json
+import math
+import time
+import logging
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from .response_tracker import reply_ids
+
+# Корзины распределения задержки ответа: [0, 1), [1, 3), [3, 7) ... секунд (по степеням двойки)
+LATENCY_BUCKETS = 24
+
+MessageKey = Tuple[int, int]
+
+def message_counts(message) -> Dict[str, int]:
+    """Просмотры, пересылки, реакции и ответы сообщения (Telethon или снимок из процесса-воркера)"""
+    reactions = getattr(message, 'reaction_count', None)
+    if reactions is None:
+        results = getattr(getattr(message, 'reactions', None), 'results', None) or []
+        reactions = sum(getattr(result, 'count', 0) for result in results)
+
+    replies = getattr(message, 'reply_count', None)
+    if replies is None:
+        replies = getattr(getattr(message, 'replies', None), 'replies', None) or 0
+
+    return {
+        'views': getattr(message, 'views', None) or 0,
+        'forwards': getattr(message, 'forwards', None) or 0,
+        'reactions': reactions,
+        'replies': replies,
+    }
+
+def latency_bucket(seconds: float) -> int:
+    return min(LATENCY_BUCKETS - 1, int(math.log2(max(0.0, seconds) + 1)))
+
+class MessageNode:
+    """Сообщение в графе ответов: корень ветки, глубина, время и автор"""
+
+    __slots__ = ('root', 'depth', 'sent_at', 'sender_id')
+
+    def __init__(self, root: int, depth: int, sent_at: float, sender_id: Optional[int]):
+        self.root = root
+        self.depth = depth
+        self.sent_at = sent_at
+        self.sender_id = sender_id
+
+class ThreadStats:
+    """Накопленная статистика ветки обсуждения"""
+
+    __slots__ = ('size', 'participants', 'max_depth', 'started_at', 'last_at', 'first_response')
+
+    def __init__(self, started_at: float):
+        self.size = 0
+        self.participants: Set[int] = set()
+        self.max_depth = 0
+        self.started_at = started_at
+        self.last_at = started_at
+        self.first_response: Optional[float] = None
+
+class WindowSummary:
+    """Сводка одного временного окна"""
+
+    __slots__ = ('start', 'messages', 'replies', 'threads_started', 'participants', 'max_depth',
+                 'latency', 'views', 'forwards', 'reactions')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.messages = 0
+        self.replies = 0
+        self.threads_started = 0
+        self.participants: Set[int] = set()
+        self.max_depth = 0
+        self.latency = [0] * LATENCY_BUCKETS
+        self.views = 0
+        self.forwards = 0
+        self.reactions = 0
+
+    def latency_percentile(self, fraction: float) -> Optional[float]:
+        """Оценка перцентиля задержки ответа по корзинам (верхняя граница корзины)"""
+        total = sum(self.latency)
+        if not total:
+            return None
+        rank = fraction * total
+        seen = 0
+        for bucket, count in enumerate(self.latency):
+            seen += count
+            if seen >= rank:
+                return float(2 ** (bucket + 1) - 1)
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'start': self.start,
+            'messages': self.messages,
+            'replies': self.replies,
+            'threads_started': self.threads_started,
+            'participants': len(self.participants),
+            'max_depth': self.max_depth,
+            'latency_p50': self.latency_percentile(0.5),
+            'latency_p90': self.latency_percentile(0.9),
+            'views': self.views,
+            'forwards': self.forwards,
+            'reactions': self.reactions,
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['participants'] = list(self.participants)
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'WindowSummary':
+        summary = cls(state['start'])
+        for name in cls.__slots__:
+            if name in state:
+                setattr(summary, name, state[name])
+        summary.participants = set(state.get('participants', []))
+        return summary
+
+class EngagementTracker:
+    """Граф ответов и сводки вовлеченности источника, обновляемые по одному сообщению
+
+    Каждое сообщение хранит ссылку сразу на корень своей ветки, поэтому ответ находит
+    ветку и глубину за O(1) без обхода цепочки. Сообщения и ветки старше max_age
+    (или сверх max_messages) вытесняются в порядке поступления; сводки хранятся по
+    окнам длиной window секунд, последние windows окон.
+    """
+
+    def __init__(self, path: str, window: float = 3600, windows: int = 24,
+                 max_messages: int = 200000, max_age: float = 7 * 24 * 3600,
+                 measure_engagement: bool = True, track_discussions: bool = True,
+                 flush_every: int = 50000):
+        self.path = Path(path)
+        self.window = window
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.measure_engagement = measure_engagement
+        self.track_discussions = track_discussions
+        self.flush_every = flush_every
+
+        self.messages: "OrderedDict[MessageKey, MessageNode]" = OrderedDict()
+        # Ветки в порядке последней активности
+        self.threads: "OrderedDict[MessageKey, ThreadStats]" = OrderedDict()
+        self.summaries: Deque[WindowSummary] = deque(maxlen=windows)
+        self.latest = 0.0
+        self.pending_updates = 0
+        self.loaded = False
+        self.logger = logging.getLogger(__name__)
+
+    def _summary(self, sent_at: float) -> Optional[WindowSummary]:
+        """Окно сообщения; сообщения старше хранимых окон в сводки не попадают"""
+        start = sent_at - sent_at % self.window
+        if not self.summaries or start > self.summaries[-1].start:
+            self.summaries.append(WindowSummary(start))
+            return self.summaries[-1]
+        for summary in reversed(self.summaries):
+            if summary.start == start:
+                return summary
+            if summary.start < start:
+                break
+        return None
+
+    def _evict(self):
+        """Вытеснение старых сообщений и неактивных веток"""
+        horizon = self.latest - self.max_age
+        while self.messages:
+            key, node = next(iter(self.messages.items()))
+            if node.sent_at >= horizon and len(self.messages) <= self.max_messages:
+                break
+            self.messages.popitem(last=False)
+        while self.threads:
+            key, thread = next(iter(self.threads.items()))
+            if thread.last_at >= horizon and len(self.threads) <= self.max_messages:
+                break
+            self.threads.popitem(last=False)
+
+    def _link(self, chat_id: int, message, sent_at: float, sender_id: Optional[int],
+              summary: Optional[WindowSummary]) -> Dict[str, Any]:
+        """Добавление сообщения в граф ответов"""
+        reply_to_msg_id, top_id = reply_ids(message)
+        parent = self.messages.get((chat_id, reply_to_msg_id)) if reply_to_msg_id is not None else None
+
+        if parent is not None:
+            root, depth = parent.root, parent.depth + 1
+        elif reply_to_msg_id is not None:
+            # Ответ на сообщение до начала учета: веткой считается начало ветки форума или само сообщение
+            root, depth = top_id or reply_to_msg_id, 1
+        else:
+            root, depth = message.id, 0
+        self.messages[(chat_id, message.id)] = MessageNode(root, depth, sent_at, sender_id)
+
+        thread_key = (chat_id, root)
+        thread = self.threads.get(thread_key)
+        if thread is None:
+            thread = self.threads[thread_key] = ThreadStats(sent_at)
+            if summary is not None and depth == 0:
+                summary.threads_started += 1
+        else:
+            self.threads.move_to_end(thread_key)
+
+        thread.size += 1
+        thread.last_at = max(thread.last_at, sent_at)
+        thread.max_depth = max(thread.max_depth, depth)
+        if sender_id is not None:
+            thread.participants.add(sender_id)
+
+        latency = None
+        if parent is not None:
+            latency = max(0.0, sent_at - parent.sent_at)
+            if depth == 1 and thread.first_response is None:
+                thread.first_response = latency
+            if summary is not None:
+                summary.latency[latency_bucket(latency)] += 1
+
+        if summary is not None:
+            if depth:
+                summary.replies += 1
+            summary.max_depth = max(summary.max_depth, depth)
+
+        return {
+            'thread_id': root,
+            'depth': depth,
+            'thread_size': thread.size,
+            'participants': len(thread.participants),
+            'response_latency': round(latency, 1) if latency is not None else None,
+        }
+
+    def observe(self, message) -> Dict[str, Any]:
+        """Учет сообщения; возвращает поля для данных сообщения"""
+        if not self.loaded:
+            self.load()
+
+        date = getattr(message, 'date', None)
+        sent_at = date.timestamp() if date else time.time()
+        self.latest = max(self.latest, sent_at)
+        chat_id = getattr(message, 'chat_id', None) or 0
+        sender_id = getattr(message, 'sender_id', None)
+
+        summary = self._summary(sent_at)
+        if summary is not None:
+            summary.messages += 1
+            if sender_id is not None:
+                summary.participants.add(sender_id)
+
+        result: Dict[str, Any] = {}
+        if self.measure_engagement:
+            counts = message_counts(message)
+            result['engagement'] = counts
+            if summary is not None:
+                summary.views += counts['views']
+                summary.forwards += counts['forwards']
+                summary.reactions += counts['reactions']
+
+        if self.track_discussions:
+            result['discussion'] = self._link(chat_id, message, sent_at, sender_id, summary)
+            self._evict()
+
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_every:
+            self.flush()
+        return result
+
+    def report(self, windows: int = 24) -> Dict[str, Any]:
+        """Сводки последних окон и крупнейшие активные ветки"""
+        if not self.loaded:
+            self.load()
+        largest = sorted(self.threads.items(), key=lambda item: item[1].size, reverse=True)[:5]
+        return {
+            'windows': [summary.to_dict() for summary in list(self.summaries)[-windows:]],
+            'top_threads': [
+                {
+                    'chat_id': chat_id,
+                    'thread_id': root,
+                    'size': thread.size,
+                    'participants': len(thread.participants),
+                    'max_depth': thread.max_depth,
+                    'first_response': thread.first_response,
+                }
+                for (chat_id, root), thread in largest
+            ],
+        }
+
+    def load(self):
+        """Загрузка графа и сводок с диска"""
+        self.loaded = True
+        try:
+            if not self.path.exists():
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+
+            self.latest = state.get('latest', 0.0)
+            for summary_state in state.get('summaries', []):
+                self.summaries.append(WindowSummary.from_state(summary_state))
+            for chat_id, message_id, root, depth, sent_at, sender_id in state.get('messages', []):
+                self.messages[(chat_id, message_id)] = MessageNode(root, depth, sent_at, sender_id)
+            for chat_id, root, size, participants, max_depth, started_at, last_at, first_response in state.get('threads', []):
+                thread = ThreadStats(started_at)
+                thread.size, thread.participants, thread.max_depth = size, set(participants), max_depth
+                thread.last_at, thread.first_response = last_at, first_response
+                self.threads[(chat_id, root)] = thread
+            self.logger.info(f"Загружен граф обсуждений {self.path}: {len(self.messages)} сообщений, {len(self.threads)} веток")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки графа обсуждений {self.path}: {e}")
+
+    def flush(self):
+        """Атомарная запись графа и сводок: временный файл и замена"""
+        if not self.loaded or not self.pending_updates:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            state = {
+                'latest': self.latest,
+                'summaries': [summary.to_state() for summary in self.summaries],
+                'messages': [
+                    [chat_id, message_id, node.root, node.depth, node.sent_at, node.sender_id]
+                    for (chat_id, message_id), node in self.messages.items()
+                ],
+                'threads': [
+                    [chat_id, root, thread.size, list(thread.participants), thread.max_depth,
+                     thread.started_at, thread.last_at, thread.first_response]
+                    for (chat_id, root), thread in self.threads.items()
+                ],
+            }
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.pending_updates = 0
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения графа обсуждений {self.path}: {e}")
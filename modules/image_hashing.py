@@ -0,0 +1,82 @@
+"""
+Похожие изображения: перцептивный хеш миниатюры и поиск близких хешей по расстоянию Хэмминга
+"""
+
+import io
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from telethon import utils
+from telethon.tl import types
+
+from .near_duplicates import SimHashIndex
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен: хеши изображений не считаются
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Хеш 8x8 = 64 бита, как SimHash: для поиска используется тот же индекс по полосам
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+def media_thumbs(message) -> List[Any]:
+    """Размеры фото или миниатюры документа сообщения"""
+    photo = getattr(message, 'photo', None)
+    if photo is not None:
+        return list(getattr(photo, 'sizes', None) or [])
+    document = getattr(message, 'document', None)
+    return list(getattr(document, 'thumbs', None) or [])
+
+def inline_thumbnail(thumbs: List[Any]) -> Optional[bytes]:
+    """JPEG миниатюры, переданной вместе с сообщением (без запроса к Telegram)"""
+    for thumb in thumbs:
+        if isinstance(thumb, types.PhotoStrippedSize):
+            return utils.stripped_photo_to_jpg(thumb.bytes)
+    for thumb in thumbs:
+        if isinstance(thumb, types.PhotoCachedSize):
+            return thumb.bytes
+    return None
+
+def smallest_thumbnail(thumbs: List[Any]) -> Optional[Any]:
+    """Самый маленький размер, который можно загрузить"""
+    def byte_count(thumb) -> int:
+        if isinstance(thumb, types.PhotoSizeProgressive):
+            return max(thumb.sizes)
+        return getattr(thumb, 'size', 0)
+
+    downloadable = [thumb for thumb in thumbs if isinstance(thumb, (types.PhotoSize, types.PhotoSizeProgressive))]
+    return min(downloadable, key=byte_count, default=None)
+
+def dhash(image_bytes: bytes) -> Optional[int]:
+    """Разностный хеш изображения: знаки разностей соседних пикселей уменьшенной копии 9x8
+
+    Хеш почти не меняется при пересжатии и изменении размера. None - Pillow не
+    установлен или изображение не читается.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+            pixels = np.asarray(small, dtype=np.int16)
+    except Exception as e:
+        logger.debug(f"Не удалось прочитать изображение: {e}")
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+_indexes: Dict[str, SimHashIndex] = {}
+
+def get_image_index(name: str, max_distance: int = 6, window: float = 24 * 3600,
+                    max_entries: int = 50000) -> SimHashIndex:
+    """Общий индекс хешей изображений по имени (параметры задает первый запрос)
+
+    Поиск по полосам хеша: записи индекса - (ID сообщения, источник).
+    """
+    if name not in _indexes:
+        _indexes[name] = SimHashIndex(window=window, max_entries=max_entries, max_distance=max_distance)
+    return _indexes[name]
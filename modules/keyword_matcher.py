@@ -0,0 +1,126 @@
+"""
+Поиск множества ключевых слов за один проход по тексту (алгоритм Ахо-Корасик)
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Совпадение: (группа, исходное ключевое слово, длина, только целые слова)
+Hit = Tuple[str, str, int, bool]
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+class KeywordMatcher:
+    """Автомат Ахо-Корасик для групп ключевых слов с одним способом нормализации текста"""
+
+    def __init__(self, case_sensitive: bool = False, fold_yo: bool = True):
+        self.case_sensitive = case_sensitive
+        self.fold_yo = fold_yo
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[Hit]] = [[]]
+        self.built = False
+
+    def normalize(self, text: str) -> str:
+        """Приведение текста к виду, в котором хранятся ключевые слова"""
+        if not self.case_sensitive:
+            text = text.lower()
+        if self.fold_yo:
+            text = text.replace('ё', 'е').replace('Ё', 'Е')
+        return text
+
+    def add(self, group: str, keyword: str, whole_words: bool = False):
+        """Добавление ключевого слова в группу"""
+        normalized = self.normalize(keyword)
+        if not normalized:
+            return
+
+        state = 0
+        for char in normalized:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append((group, keyword, len(normalized), whole_words))
+        self.built = False
+
+    def build(self):
+        """Построение ссылок неудачи обходом в ширину"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                target = self.goto[fail_state].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                # Совпадения суффиксов наследуются, чтобы не ходить по ссылкам при поиске
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+        self.built = True
+
+    def find(self, text: str, hits: Dict[str, Set[str]]):
+        """Добавление в hits всех найденных ключевых слов по группам"""
+        if not self.built:
+            self.build()
+
+        text = self.normalize(text)
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for group, keyword, length, whole_words in outputs[state]:
+                if whole_words:
+                    start = end - length
+                    if start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if end < len(text) and _is_word_char(text[end]):
+                        continue
+                hits.setdefault(group, set()).add(keyword)
+
+class SharedKeywordMatcher:
+    """Общий поиск ключевых слов пайплайна: все группы всех шагов за один проход
+
+    Группы с разной нормализацией (регистр, ё) попадают в отдельные автоматы,
+    обычно автомат один.
+    """
+
+    def __init__(self):
+        self.matchers: Dict[Tuple[bool, bool], KeywordMatcher] = {}
+        self.groups: Set[str] = set()
+
+    def add_group(self, group: str, keywords: Iterable[str], whole_words: bool = False,
+                  case_sensitive: bool = False, fold_yo: bool = True):
+        """Регистрация группы ключевых слов"""
+        mode = (case_sensitive, fold_yo)
+        if mode not in self.matchers:
+            self.matchers[mode] = KeywordMatcher(case_sensitive, fold_yo)
+        for keyword in keywords:
+            self.matchers[mode].add(group, keyword, whole_words)
+        self.groups.add(group)
+
+    def build(self):
+        """Построение автоматов"""
+        for matcher in self.matchers.values():
+            matcher.build()
+
+    def find(self, text: str) -> Dict[str, Set[str]]:
+        """Найденные ключевые слова по группам"""
+        hits: Dict[str, Set[str]] = {}
+        for matcher in self.matchers.values():
+            matcher.find(text, hits)
+        return hits
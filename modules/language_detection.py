@@ -0,0 +1,141 @@
+"""
+Определение языка по символьным n-граммам и кеш языка источников
+"""
+
+import re
+import json
+import math
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (1, 2, 3)
+UNKNOWN = 'unknown'
+
+_LETTERS = re.compile(r'[^\W\d_]+')
+
+def ngrams(text: str, max_chars: Optional[int] = 300) -> List[str]:
+    """Буквенные n-граммы текста; слова разделены пробелом, цифры и знаки отбрасываются"""
+    letters = ' '.join(_LETTERS.findall(text.lower()))
+    if max_chars is not None:
+        letters = letters[:max_chars]
+    padded = f" {letters} "
+    return [
+        padded[i:i + size]
+        for size in NGRAM_SIZES
+        for i in range(len(padded) - size + 1)
+        if padded[i:i + size] != ' '
+    ]
+
+def train_profile(text: str, size: int = 1000) -> Dict[str, int]:
+    """Профиль языка: size самых частых n-грамм текста с их количеством"""
+    return dict(Counter(ngrams(text, max_chars=None)).most_common(size))
+
+class LanguageDetector:
+    """Наивный байесовский классификатор по n-граммам профилей языков
+
+    Файл профилей (JSON): {"ngram_sizes": [1, 2, 3], "languages": {язык: {n-грамма: количество}}}. Профили
+    сводятся в матрицу логарифмов вероятностей (n-грамма x язык), и оценка текста -
+    сумма строк его n-грамм.
+    """
+
+    def __init__(self, profiles: Dict[str, Dict[str, int]], max_chars: int = 300, min_ngrams: int = 8):
+        if not profiles:
+            raise ValueError("Нет профилей языков")
+        self.languages = sorted(profiles)
+        self.max_chars = max_chars
+        self.min_ngrams = min_ngrams
+
+        vocabulary = sorted({ngram for profile in profiles.values() for ngram in profile})
+        self.index = {ngram: row for row, ngram in enumerate(vocabulary)}
+        self.matrix = np.empty((len(vocabulary), len(self.languages)), dtype=np.float32)
+        for column, language in enumerate(self.languages):
+            profile = profiles[language]
+            # Сглаживание Лапласа: n-граммы вне профиля получают вероятность одного вхождения
+            total = sum(profile.values()) + len(vocabulary)
+            counts = np.array([profile.get(ngram, 0) for ngram in vocabulary], dtype=np.float32)
+            self.matrix[:, column] = np.log((counts + 1) / total)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'LanguageDetector':
+        """Загрузка профилей из файла"""
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if tuple(data.get('ngram_sizes', NGRAM_SIZES)) != NGRAM_SIZES:
+            raise ValueError(f"Профили {path} построены для n-грамм {data['ngram_sizes']}, нужны {list(NGRAM_SIZES)}")
+        return cls(data.get('languages', {}), **kwargs)
+
+    def detect(self, text: str) -> Tuple[str, float]:
+        """Язык текста и уверенность (0.5-1 для двух ближайших языков); 'unknown' для коротких текстов"""
+        rows = [self.index[ngram] for ngram in ngrams(text, self.max_chars) if ngram in self.index]
+        if len(rows) < self.min_ngrams:
+            return UNKNOWN, 0.0
+        if len(self.languages) == 1:
+            return self.languages[0], 1.0
+
+        scores = self.matrix[rows].sum(axis=0)
+        second, best = np.argpartition(scores, -2)[-2:]
+        gap = float(scores[best] - scores[second])
+        return self.languages[best], 1 / (1 + math.exp(-min(gap, 50.0)))
+
+@dataclass
+class _SourceLanguage:
+    language: str
+    streak: int = 1
+    skipped: int = 0
+
+class SourceLanguageCache:
+    """Язык источников: после stable_after подряд одинаковых уверенных определений
+    язык источника возвращается без анализа текста
+
+    Каждое recheck_every-е сообщение стабильного источника все равно проверяется
+    детектором; при расхождении серия начинается заново.
+    """
+
+    def __init__(self, stable_after: int = 20, recheck_every: int = 100, min_confidence: float = 0.99):
+        self.stable_after = stable_after
+        self.recheck_every = recheck_every
+        self.min_confidence = min_confidence
+        self.sources: Dict[str, _SourceLanguage] = {}
+        self.hits = 0
+        self.detections = 0
+
+    def detect(self, source: Optional[str], text: str, detector: LanguageDetector) -> str:
+        """Язык сообщения источника"""
+        state = self.sources.get(source)
+        if state is not None and state.streak >= self.stable_after:
+            state.skipped += 1
+            if state.skipped < self.recheck_every:
+                self.hits += 1
+                return state.language
+            state.skipped = 0
+
+        self.detections += 1
+        language, confidence = detector.detect(text)
+        if confidence < self.min_confidence:
+            # Неуверенный ответ не меняет серию: короткий текст стабильного источника
+            # получает язык источника
+            return state.language if state is not None and state.streak >= self.stable_after else language
+
+        if state is not None and state.language == language:
+            state.streak += 1
+        else:
+            if state is not None and state.streak >= self.stable_after:
+                logger.info(f"Язык источника {source} изменился: {state.language} -> {language}")
+            self.sources[source] = _SourceLanguage(language)
+        return language
+
+# Детекторы по файлам профилей: профили загружаются один раз на процесс
+_detectors: Dict[str, LanguageDetector] = {}
+
+def get_language_detector(path: str) -> LanguageDetector:
+    """Общий детектор для файла профилей"""
+    if path not in _detectors:
+        _detectors[path] = LanguageDetector.load(path)
+    return _detectors[path]
@@ -0,0 +1,275 @@
+"""
+Загрузка медиа: общий лимит одновременных загрузок и скорости, потоковая запись на диск и кэш по ID файла
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import aiofiles
+
+from .rate_limiter import RateLimiter, TokenBucket
+
+MB = 1024 * 1024
+# Размер запроса части файла к Telegram (максимум API - 512 КБ)
+REQUEST_SIZE = 512 * 1024
+
+# Общие настройки загрузок процесса; задаются при запуске из Config
+MEDIA_SETTINGS: Dict[str, float] = {
+    'cache_size_mb': 50,
+    'max_concurrent': 4,
+    'bandwidth_kbps': 0,
+}
+# Клиент сессии -> ее ограничитель запросов: части файлов запрашиваются через него
+_rate_limiters: Dict[Any, RateLimiter] = {}
+
+def media_key(message, descriptor: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Ключ кэша: ID фото или документа Telegram, общий для репостов одного файла"""
+    for attribute in ('photo', 'document'):
+        media_id = getattr(getattr(message, attribute, None), 'id', None)
+        if media_id is not None:
+            return f"{attribute}_{media_id}"
+    # Снимок сообщения в процессе-воркере: ключ по описанию медиа из записи
+    if descriptor and descriptor.get('id') is not None:
+        attribute = 'photo' if descriptor.get('type') == 'photo' else 'document'
+        return f"{attribute}_{descriptor['id']}"
+    return None
+
+class MediaCache:
+    """Файлы медиа на диске с вытеснением давно не использованных сверх max_bytes
+
+    Закрепленные ключи (файлы, которые сейчас используют шаги) не вытесняются:
+    кэш может временно превысить max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        # Ключ -> (файл, размер) в порядке последнего использования
+        self.entries: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+        self.total_bytes = 0
+        # Ключ -> число пользователей файла
+        self.pins: Dict[str, int] = {}
+        self.loaded = False
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        """Восстановление кэша по файлам каталога; недокачанные файлы удаляются"""
+        self.loaded = True
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            files = []
+            for entry in os.scandir(self.path):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith('.part'):
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+            for _, name, size in sorted(files):
+                self.entries[name.split('.', 1)[0]] = (self.path / name, size)
+                self.total_bytes += size
+            self.evict(0)
+            self.logger.info(f"Кэш медиа {self.path}: {len(self.entries)} файлов, {self.total_bytes // MB} МБ")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки кэша медиа {self.path}: {e}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Путь к файлу из кэша; использование продлевает жизнь файла"""
+        if not self.loaded:
+            self.load()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        try:
+            # Время изменения хранит порядок использования между перезапусками
+            now = time.time()
+            os.utime(entry[0], (now, now))
+        except FileNotFoundError:
+            self.entries.pop(key)
+            self.total_bytes -= entry[1]
+            return None
+        return str(entry[0])
+
+    def pin(self, key: str):
+        """Закрепление файла на время использования (ключ может быть еще не загружен)"""
+        self.pins[key] = self.pins.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        count = self.pins.get(key, 0) - 1
+        if count > 0:
+            self.pins[key] = count
+        else:
+            self.pins.pop(key, None)
+
+    def evict(self, needed: int):
+        """Освобождение места под needed байт; закрепленные файлы пропускаются"""
+        for key in list(self.entries):
+            if self.total_bytes + needed <= self.max_bytes:
+                break
+            if key in self.pins:
+                continue
+            path, size = self.entries.pop(key)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def part_path(self, key: str) -> Path:
+        if not self.loaded:
+            self.load()
+        return self.path / f"{key}.part"
+
+    def add(self, key: str, part_path: Path, extension: str) -> str:
+        """Перенос загруженного файла в кэш"""
+        path = self.path / f"{key}{extension}"
+        os.replace(part_path, path)
+        size = path.stat().st_size
+        self.evict(size)
+        self.entries[key] = (path, size)
+        self.total_bytes += size
+        return str(path)
+
+class MediaDownloader:
+    """Загрузка медиа сообщений в кэш
+
+    Все пайплайны процесса используют один загрузчик: число одновременных загрузок
+    и суммарная скорость ограничены общими лимитами, а файл, который уже загружается
+    для другого пайплайна или репоста, не запрашивается повторно. Части файла
+    запрашиваются через ограничитель сессии сообщения с продолжением после FloodWait.
+    """
+
+    def __init__(self, cache: MediaCache, max_concurrent: int = 4, bandwidth_kbps: float = 0):
+        self.cache = cache
+        # Ограничитель для клиентов, не переданных в configure_media_downloads
+        self.rate_limiter = RateLimiter()
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        # Скорость в байтах в секунду, запас - одна секунда
+        self.bandwidth = TokenBucket(bandwidth_kbps * 1024, bandwidth_kbps * 1024) if bandwidth_kbps > 0 else None
+        self.downloads: Dict[str, asyncio.Task] = {}
+        self.logger = logging.getLogger(__name__)
+
+    async def fetch(self, message, descriptor: Optional[Dict[str, Any]] = None,
+                    max_bytes: Optional[int] = None) -> Optional[str]:
+        """Путь к файлу медиа сообщения (из кэша или после загрузки); None - загрузка невозможна
+
+        Полученный файл закреплен в кэше до вызова release(path).
+        """
+        key = media_key(message, descriptor)
+        if key is None:
+            return None
+        # Закрепление до загрузки: файл не вытесняется, пока ожидающий его получает
+        self.cache.pin(key)
+        path = None
+        try:
+            path = self.cache.get(key)
+            if path is not None:
+                return path
+
+            task = self.downloads.get(key)
+            if task is None:
+                # Снимок сообщения в процессе-воркере не может загружать файлы
+                client = getattr(message, 'client', None)
+                if client is None or not getattr(message, 'media', None):
+                    return None
+                size = getattr(getattr(message, 'file', None), 'size', None) or 0
+                if size > self.cache.max_bytes or (max_bytes is not None and size > max_bytes):
+                    return None
+                task = asyncio.ensure_future(self._download(key, client, message, size))
+                self.downloads[key] = task
+                task.add_done_callback(lambda _: self.downloads.pop(key, None))
+            # Отмена одного ожидающего не прерывает загрузку для остальных
+            path = await asyncio.shield(task)
+            return path
+        finally:
+            if path is None:
+                self.cache.unpin(key)
+
+    def release(self, path: str):
+        """Файл, полученный из fetch, больше не используется"""
+        self.cache.unpin(Path(path).name.split('.', 1)[0])
+
+    async def _download(self, key: str, client, message, size: int) -> Optional[str]:
+        part_path = self.cache.part_path(key)
+        try:
+            async with self.semaphore:
+                self.cache.evict(size)
+                async with aiofiles.open(part_path, 'wb') as f:
+                    rate_limiter = _rate_limiters.get(client, self.rate_limiter)
+                    async for chunk in rate_limiter.iter_download(
+                        client, message.media, request_size=REQUEST_SIZE, file_size=size or None
+                    ):
+                        await f.write(chunk)
+                        if self.bandwidth is not None:
+                            wait = self.bandwidth.consume(len(chunk))
+                            if wait > 0:
+                                await asyncio.sleep(wait)
+                extension = getattr(getattr(message, 'file', None), 'ext', None) or ''
+                return self.cache.add(key, part_path, extension)
+        except asyncio.CancelledError:
+            self._remove_part(part_path)
+            raise
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки медиа {key} из сообщения {message.id}: {e}")
+            self._remove_part(part_path)
+            return None
+
+    async def download_bytes(self, message, thumb=None) -> Optional[bytes]:
+        """Небольшой файл (например, миниатюра thumb) в память под общими лимитами загрузок"""
+        client = getattr(message, 'client', None)
+        if client is None:
+            return None
+        rate_limiter = _rate_limiters.get(client, self.rate_limiter)
+        async with self.semaphore:
+            data = await rate_limiter.call('download', client.download_media, message, file=bytes, thumb=thumb)
+            if data and self.bandwidth is not None:
+                wait = self.bandwidth.consume(len(data))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+        return data
+
+    @staticmethod
+    def _remove_part(part_path: Path):
+        try:
+            os.remove(part_path)
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        """Отмена незавершенных загрузок"""
+        for task in list(self.downloads.values()):
+            task.cancel()
+
+_downloaders: Dict[str, MediaDownloader] = {}
+
+def configure_media_downloads(cache_size_mb: float = 50, max_concurrent: int = 4, bandwidth_kbps: float = 0,
+                              rate_limiters: Optional[Dict[Any, RateLimiter]] = None):
+    """Общие лимиты загрузок процесса (действуют для загрузчиков, созданных после вызова)
+
+    rate_limiters - ограничители сессий по их клиентам.
+    """
+    MEDIA_SETTINGS.update(cache_size_mb=cache_size_mb, max_concurrent=max_concurrent, bandwidth_kbps=bandwidth_kbps)
+    _rate_limiters.update(rate_limiters or {})
+
+def get_media_downloader(cache_path: str) -> MediaDownloader:
+    """Общий загрузчик для каталога кэша"""
+    if cache_path not in _downloaders:
+        _downloaders[cache_path] = MediaDownloader(
+            MediaCache(cache_path, int(MEDIA_SETTINGS['cache_size_mb'] * MB)),
+            max_concurrent=int(MEDIA_SETTINGS['max_concurrent']),
+            bandwidth_kbps=MEDIA_SETTINGS['bandwidth_kbps'],
+        )
+    return _downloaders[cache_path]
+
+def shutdown_media_downloaders():
+    """Остановка загрузок всех загрузчиков"""
+    for downloader in _downloaders.values():
+        downloader.shutdown()
+    _downloaders.clear()
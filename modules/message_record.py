@@ -0,0 +1,269 @@
+"""
+Общая запись сообщения источника: создается один раз и читается всеми пайплайнами без копирования
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
+
+# Флаги правил разбора источника
+PARSE_TEXT = 1
+PARSE_MEDIA = 2
+PARSE_BUTTONS = 4
+PARSE_REACTIONS = 8
+PARSE_ENTITIES = 16
+
+# Правило parsing_rules -> (флаг, значение по умолчанию)
+RULE_FLAGS = {
+    'parse_text': (PARSE_TEXT, True),
+    'parse_media': (PARSE_MEDIA, True),
+    'parse_buttons': (PARSE_BUTTONS, True),
+    'parse_reactions': (PARSE_REACTIONS, False),
+    'parse_entities': (PARSE_ENTITIES, False),
+}
+
+# Атрибуты сообщения Telethon в порядке проверки: частные типы документов раньше общего
+MEDIA_TYPES = ('video_note', 'gif', 'sticker', 'voice', 'audio', 'video', 'photo', 'document',
+               'web_preview', 'poll', 'geo', 'venue', 'contact', 'dice', 'game', 'invoice')
+
+def parsing_flags(parsing_rules: Optional[Dict[str, bool]]) -> int:
+    """Флаги разбора по parsing_rules источника"""
+    rules = parsing_rules or {}
+    flags = 0
+    for rule, (flag, default) in RULE_FLAGS.items():
+        if rules.get(rule, default):
+            flags |= flag
+    return flags
+
+def is_forwarded(message) -> bool:
+    """Пересланное сообщение; у снимка сообщения в процессе-воркере - флаг forwarded"""
+    return bool(getattr(message, 'fwd_from', None) or getattr(message, 'forwarded', False))
+
+def has_media(message) -> bool:
+    """Сообщение с медиа; у снимка сообщения в процессе-воркере - флаг has_media"""
+    return bool(getattr(message, 'media', None) or getattr(message, 'has_media', False))
+
+def extract_text(message) -> Optional[str]:
+    return getattr(message, 'text', None) or ''
+
+def extract_media(message) -> Optional[Dict[str, Any]]:
+    """Описание медиа: тип, ID файла, MIME-тип, размер и имя"""
+    if not getattr(message, 'media', None):
+        return None
+    media_type = next(
+        (name for name in MEDIA_TYPES if getattr(message, name, None)),
+        type(message.media).__name__
+    )
+    descriptor: Dict[str, Any] = {'type': media_type}
+    media_object = getattr(message, 'photo', None) or getattr(message, 'document', None)
+    if media_object is not None:
+        descriptor['id'] = media_object.id
+    file = getattr(message, 'file', None)
+    if file is not None:
+        for name in ('mime_type', 'size', 'name'):
+            value = getattr(file, name, None)
+            if value is not None:
+                descriptor[name] = value
+    return descriptor
+
+def extract_buttons(message) -> Optional[List[List[Dict[str, Any]]]]:
+    """Кнопки сообщения по рядам: текст и ссылка"""
+    rows = getattr(getattr(message, 'reply_markup', None), 'rows', None)
+    if not rows:
+        return None
+    buttons = []
+    for row in rows:
+        row_buttons = []
+        for button in row.buttons:
+            item = {'text': getattr(button, 'text', '')}
+            url = getattr(button, 'url', None)
+            if url:
+                item['url'] = url
+            row_buttons.append(item)
+        buttons.append(row_buttons)
+    return buttons
+
+def extract_reactions(message) -> Optional[List[Dict[str, Any]]]:
+    """Реакции: эмодзи (или ID пользовательского эмодзи) и количество"""
+    results = getattr(getattr(message, 'reactions', None), 'results', None)
+    if not results:
+        return None
+    reactions = []
+    for result in results:
+        reaction = result.reaction
+        emoji = getattr(reaction, 'emoticon', None) or str(getattr(reaction, 'document_id', '') or type(reaction).__name__)
+        reactions.append({'reaction': emoji, 'count': result.count})
+    return reactions
+
+def extract_entities(message) -> Optional[List[Dict[str, Any]]]:
+    """Разметка текста: тип, смещение и длина (в UTF-16 по тексту без разметки), ссылка"""
+    entities = getattr(message, 'entities', None)
+    if not entities:
+        return None
+    result = []
+    for entity in entities:
+        item = {
+            'type': type(entity).__name__.replace('MessageEntity', '').lower(),
+            'offset': entity.offset,
+            'length': entity.length,
+        }
+        url = getattr(entity, 'url', None)
+        if url:
+            item['url'] = url
+        result.append(item)
+    return result
+
+# Ленивые поля: поле -> (слот кэша, флаг разбора, функция извлечения)
+LAZY_FIELDS = {
+    'text': ('_text', PARSE_TEXT, extract_text),
+    'media': ('_media', PARSE_MEDIA, extract_media),
+    'buttons': ('_buttons', PARSE_BUTTONS, extract_buttons),
+    'reactions': ('_reactions', PARSE_REACTIONS, extract_reactions),
+    'entities': ('_entities', PARSE_ENTITIES, extract_entities),
+}
+OPTIONAL_FIELDS = ('media', 'buttons', 'reactions', 'entities')
+BASE_KEYS = ('message_id', 'text', 'sender_id', 'date', 'source', 'pipeline')
+
+_UNSET = object()
+_DELETED = object()
+
+class MessageRecord:
+    """Запись сообщения источника, общая для всех пайплайнов
+
+    Поля извлекаются из сообщения Telethon при первом обращении и только если
+    их разбор включен в parsing_rules источника; результат кэшируется в записи,
+    поэтому каждый пайплайн получает уже извлеченное значение. Остальные атрибуты
+    читаются из исходного сообщения.
+    """
+
+    __slots__ = ('raw', 'flags', 'id', 'chat_id', 'sender_id', 'date', '_preset',
+                 '_date_iso', '_text', '_media', '_buttons', '_reactions', '_entities')
+
+    def __init__(self, message, flags: int, preset: Optional[Dict[str, Any]] = None):
+        self.raw = message
+        self.flags = flags
+        self.id = message.id
+        self.chat_id = getattr(message, 'chat_id', None)
+        self.sender_id = getattr(message, 'sender_id', None)
+        self.date = getattr(message, 'date', None)
+        # Поля, уже извлеченные в другом процессе
+        self._preset = preset
+        self._date_iso = _UNSET
+        self._text = _UNSET
+        self._media = _UNSET
+        self._buttons = _UNSET
+        self._reactions = _UNSET
+        self._entities = _UNSET
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name == 'raw':
+            raise AttributeError(name)
+        return getattr(self.raw, name)
+
+    def _lazy(self, key: str) -> Any:
+        slot, flag, extract = LAZY_FIELDS[key]
+        value = getattr(self, slot)
+        if value is _UNSET:
+            if self._preset is not None:
+                value = self._preset.get(key)
+            elif self.flags & flag:
+                value = extract(self.raw)
+            else:
+                value = None
+            setattr(self, slot, value)
+        return value
+
+    def value(self, key: str) -> Any:
+        """Значение поля данных сообщения; KeyError - поля нет или его разбор отключен"""
+        if key == 'message_id':
+            return self.id
+        if key == 'sender_id':
+            return self.sender_id
+        if key == 'date':
+            if self._date_iso is _UNSET:
+                self._date_iso = self.date.isoformat() if self.date else None
+            return self._date_iso
+        if key == 'text':
+            return self._lazy('text') or ''
+        if key in LAZY_FIELDS:
+            value = self._lazy(key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def optional_keys(self) -> Iterator[str]:
+        """Необязательные поля, присутствующие в сообщении"""
+        for key in OPTIONAL_FIELDS:
+            if self._lazy(key) is not None:
+                yield key
+
+    def extracted(self) -> Dict[str, Any]:
+        """Все включенные поля для передачи в процесс-воркер"""
+        return {key: self._lazy(key) for key in LAZY_FIELDS}
+
+class MessageView(MutableMapping):
+    """Данные сообщения в пайплайне: изменения шагов поверх общей записи
+
+    Запись не копируется: чтение возвращает изменение пайплайна или поле записи,
+    запись и удаление затрагивают только изменения этого пайплайна.
+    """
+
+    __slots__ = ('record', 'source', 'pipeline', 'changes')
+
+    def __init__(self, record: MessageRecord, source: str, pipeline: str):
+        self.record = record
+        self.source = source
+        self.pipeline = pipeline
+        self.changes: Dict[str, Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        changes = self.changes
+        if key in changes:
+            value = changes[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        if key == 'source':
+            return self.source
+        if key == 'pipeline':
+            return self.pipeline
+        return self.record.value(key)
+
+    def __setitem__(self, key: str, value: Any):
+        self.changes[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self.changes[key] = _DELETED
+
+    def _base_keys(self) -> List[str]:
+        return [*BASE_KEYS, *self.record.optional_keys()]
+
+    def __iter__(self) -> Iterator[str]:
+        changes = self.changes
+        base_keys = self._base_keys()
+        for key in base_keys:
+            if changes.get(key) is not _DELETED:
+                yield key
+        for key, value in changes.items():
+            if value is not _DELETED and key not in base_keys:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def copy(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Обычный словарь для сериализации в назначениях"""
+        return dict(self)
+
+    def __repr__(self) -> str:
+        return f"MessageView({self.to_dict()!r})"
@@ -0,0 +1,123 @@
+"""
+Поиск почти повторов: SimHash сообщения и LSH-индекс по скользящему окну
+"""
+
+import re
+import time
+import itertools
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+SIMHASH_BITS = 64
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_MASK = (1 << SIMHASH_BITS) - 1
+
+def simhash(text: str, min_tokens: int = 1) -> Optional[int]:
+    """SimHash текста по словам и парам соседних слов; None - слишком короткий текст
+
+    Хеши признаков - встроенный hash(): он быстрый, но зависит от процесса, поэтому
+    SimHash нельзя сохранять или сравнивать между процессами.
+    """
+    words = _WORD.findall(text.lower().replace('ё', 'е'))
+    if len(words) < min_tokens:
+        return None
+
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    half = len(features) / 2
+    # Биты всех признаков подряд: i-й бит каждого признака - срез [i::64]
+    rows = ''.join(format(hash(feature) & _MASK, '064b') for feature in features)
+    bits = ''.join('1' if rows[i::SIMHASH_BITS].count('1') > half else '0' for i in range(SIMHASH_BITS))
+    return int(bits, 2)
+
+class SimHashIndex:
+    """LSH-индекс SimHash за последние window секунд, не больше max_entries записей
+
+    При пороге сходства threshold допустимо max_distance отличающихся бит (или оно
+    задается явно). Хеш делится на max_distance + 1 полос: у похожих хешей хотя бы одна
+    полоса совпадает целиком, поэтому сравниваются только записи из тех же корзин.
+    Подходит для любых 64-битных хешей, сравниваемых по расстоянию Хэмминга.
+    """
+
+    def __init__(self, threshold: float = 0.9, window: float = 24 * 3600, max_entries: int = 50000,
+                 max_distance: Optional[int] = None):
+        self.threshold = threshold
+        self.window = window
+        self.max_entries = max_entries
+        self.max_distance = max_distance if max_distance is not None else int((1 - threshold) * SIMHASH_BITS)
+
+        bands = self.max_distance + 1
+        widths = [SIMHASH_BITS // bands + (1 if i < SIMHASH_BITS % bands else 0) for i in range(bands)]
+        offsets = [0] + list(itertools.accumulate(widths))[:-1]
+        self.bands: List[Tuple[int, int]] = [(offset, (1 << width) - 1) for offset, width in zip(offsets, widths)]
+
+        # Полоса -> значение полосы -> {ID записи: SimHash}
+        self.buckets: List[Dict[int, Dict[int, int]]] = [{} for _ in self.bands]
+        self.entries: Dict[int, Tuple[int, float, Any]] = {}
+        # Данные записи -> ID последней записи с ними
+        self.entry_by_id: Dict[Any, int] = {}
+        self.order: Deque[int] = deque()
+        self.entry_ids = itertools.count()
+        self.latest = 0.0
+
+    def _keys(self, value: int):
+        return [(value >> offset) & mask for offset, mask in self.bands]
+
+    def _evict(self):
+        """Удаление записей старше окна и сверх max_entries"""
+        horizon = self.latest - self.window
+        while self.order:
+            entry_id = self.order[0]
+            _, seen_at, _ = self.entries[entry_id]
+            if seen_at >= horizon and len(self.order) <= self.max_entries:
+                break
+            self.order.popleft()
+            value, _, message_id = self.entries.pop(entry_id)
+            if self.entry_by_id.get(message_id) == entry_id:
+                del self.entry_by_id[message_id]
+            for bucket, key in zip(self.buckets, self._keys(value)):
+                members = bucket.get(key)
+                if members is not None:
+                    members.pop(entry_id, None)
+                    if not members:
+                        del bucket[key]
+
+    def find(self, value: int, exclude: Any = None) -> Optional[Tuple[Any, float]]:
+        """Самая похожая запись окна: (ID сообщения или данные записи, сходство) или None
+
+        Запись с данными exclude (то же сообщение, обработанное повторно) не учитывается.
+        """
+        excluded = self.entry_by_id.get(exclude) if exclude is not None else None
+        best_id, best_distance = None, self.max_distance + 1
+        for bucket, key in zip(self.buckets, self._keys(value)):
+            members = bucket.get(key)
+            if not members:
+                continue
+            for entry_id, other in members.items():
+                if entry_id == excluded:
+                    continue
+                distance = (value ^ other).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+
+        if best_id is None:
+            return None
+        return self.entries[best_id][2], 1 - best_distance / SIMHASH_BITS
+
+    def add(self, value: int, message_id: Any, seen_at: Optional[float] = None):
+        """Добавление хеша сообщения в окно"""
+        seen_at = seen_at if seen_at is not None else time.time()
+        self.latest = max(self.latest, seen_at)
+        entry_id = next(self.entry_ids)
+        self.entries[entry_id] = (value, seen_at, message_id)
+        self.entry_by_id[message_id] = entry_id
+        self.order.append(entry_id)
+        for bucket, key in zip(self.buckets, self._keys(value)):
+            bucket.setdefault(key, {})[entry_id] = value
+        self._evict()
+
+    def __contains__(self, message_id: Any) -> bool:
+        return message_id in self.entry_by_id
+
+    def __len__(self) -> int:
+        return len(self.entries)
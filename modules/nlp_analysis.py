@@ -0,0 +1,210 @@
+"""
+Анализ текста (сущности, тональность, ключевые слова) в пуле процессов
+"""
+
+import re
+import json
+import asyncio
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Опции шага: имя в конфигурации -> анализ (у некоторых анализов несколько имен).
+# Язык определяется в процессе пайплайна (modules/language_detection.py), остальное - в пуле
+ANALYSES = {
+    'extract_entities': 'entities',
+    'entity_extraction': 'entities',
+    'sentiment_analysis': 'sentiment',
+    'keyword_extraction': 'keywords',
+    'language_detection': 'language',
+}
+
+_URL = re.compile(r'https?://\S+|www\.\S+|t\.me/\S+', re.IGNORECASE)
+_MENTION = re.compile(r'@\w{3,}')
+_HASHTAG = re.compile(r'#\w+')
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.]+')
+_PHONE = re.compile(r'\+?\d[\d\s()-]{8,}\d')
+_NAME = re.compile(r'\b[A-ZА-ЯЁ][a-zа-яё]+(?:\s+[A-ZА-ЯЁ][a-zа-яё]+)*')
+_SENTENCE_END = re.compile(r'(?:^|[.!?])\s*$')
+_WORD = re.compile(r'[a-zа-яё]+', re.IGNORECASE)
+
+# Ресурсы процесса-анализатора: загружаются один раз при запуске процесса
+_lexicon: Dict[str, Any] = {}
+
+def load_lexicon(lexicon_path: str) -> Dict[str, FrozenSet[str]]:
+    """Словари стоп-слов и тональности; при ошибке чтения - пустые"""
+    try:
+        with open(lexicon_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки словаря анализа {lexicon_path}: {e}")
+        data = {}
+    return {
+        'stopwords': frozenset(data.get('stopwords', [])),
+        'positive': frozenset(data.get('positive', [])),
+        'negative': frozenset(data.get('negative', [])),
+    }
+
+def _init_worker(lexicon_path: str):
+    """Загрузка словарей в процессе пула"""
+    global _lexicon
+    _lexicon = load_lexicon(lexicon_path)
+
+def _names(text: str) -> List[str]:
+    """Имена: слова с заглавной буквы подряд
+
+    Одно слово в начале предложения пишется с заглавной буквы и без того, поэтому
+    именем не считается; несколько слов подряд считаются именем и там.
+    """
+    names = set()
+    for match in _NAME.finditer(text):
+        name = match.group()
+        if len(name.split()) == 1 and _SENTENCE_END.search(text, 0, match.start()):
+            continue
+        names.add(' '.join(name.split()))
+    return sorted(names)
+
+def _entities(text: str) -> Dict[str, List[str]]:
+    return {
+        'urls': _URL.findall(text),
+        'mentions': _MENTION.findall(text),
+        'hashtags': _HASHTAG.findall(text),
+        'emails': _EMAIL.findall(text),
+        'phones': [phone.strip() for phone in _PHONE.findall(text)],
+        'names': _names(text),
+    }
+
+def _sentiment(words: List[str]) -> Dict[str, Any]:
+    positive, negative = _lexicon['positive'], _lexicon['negative']
+    score = 0
+    for index, word in enumerate(words):
+        polarity = (word in positive) - (word in negative)
+        # Отрицание перед словом меняет знак
+        if polarity and index and words[index - 1] in ('не', 'not', "don't", 'no'):
+            polarity = -polarity
+        score += polarity
+
+    normalized = max(-1.0, min(1.0, score / max(1, len(words)) * 5))
+    label = 'positive' if normalized > 0.1 else 'negative' if normalized < -0.1 else 'neutral'
+    return {'score': round(normalized, 3), 'label': label}
+
+def _keywords(words: List[str], limit: int) -> List[str]:
+    stopwords = _lexicon['stopwords']
+    counts = Counter(word for word in words if len(word) > 2 and word not in stopwords)
+    return [word for word, _ in counts.most_common(limit)]
+
+def analyze_batch(texts: List[str], analyses: Tuple[str, ...], keyword_limit: int = 10) -> List[Dict[str, Any]]:
+    """Анализ пачки текстов (выполняется в процессе пула)"""
+    results = []
+    for text in texts:
+        words = [word.lower().replace('ё', 'е') for word in _WORD.findall(text)]
+        result: Dict[str, Any] = {}
+        if 'entities' in analyses:
+            result['entities'] = _entities(text)
+        if 'sentiment' in analyses:
+            result['sentiment'] = _sentiment(words)
+        if 'keywords' in analyses:
+            result['keywords'] = _keywords(words, keyword_limit)
+        results.append(result)
+    return results
+
+class AnalyzerPool:
+    """Пул процессов анализа с объединением одновременных запросов в пачки
+
+    Запросы копятся до max_batch текстов или max_delay секунд и уходят в пул одной
+    задачей, поэтому цикл событий не блокируется, а накладные расходы на передачу
+    между процессами делятся на всю пачку.
+    """
+
+    def __init__(self, lexicon_path: str, processes: int = 2, max_batch: int = 64, max_delay: float = 0.01):
+        self.lexicon_path = lexicon_path
+        self.processes = processes
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.executor: Optional[Executor] = None
+        self.pending: Dict[Tuple[Tuple[str, ...], int], List[Tuple[str, asyncio.Future]]] = {}
+        self.flush_handles: Dict[Tuple[Tuple[str, ...], int], asyncio.TimerHandle] = {}
+        self.tasks: set = set()
+
+    def _get_executor(self) -> Executor:
+        if self.executor is None:
+            if multiprocessing.current_process().daemon:
+                # Процесс-воркер пайплайнов не может порождать процессы и сам не обслуживает
+                # Telegram, поэтому анализ выполняется в его потоке
+                self.executor = ThreadPoolExecutor(1, initializer=_init_worker, initargs=(self.lexicon_path,))
+                logger.info("Запущен анализ текста в потоке процесса-воркера")
+            else:
+                self.executor = ProcessPoolExecutor(
+                    self.processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.lexicon_path,)
+                )
+                logger.info(f"Запущен пул анализа текста: {self.processes} процессов")
+        return self.executor
+
+    async def analyze(self, texts: List[str], analyses: Tuple[str, ...], keyword_limit: int = 10) -> List[Dict[str, Any]]:
+        """Анализ текстов; одновременные запросы объединяются в общие пачки"""
+        loop = asyncio.get_running_loop()
+        key = (analyses, keyword_limit)
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.pending.setdefault(key, []).append((text, future))
+            futures.append(future)
+
+        if len(self.pending[key]) >= self.max_batch:
+            self._flush(key)
+        elif key not in self.flush_handles:
+            self.flush_handles[key] = loop.call_later(self.max_delay, self._flush, key)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self, key: Tuple[Tuple[str, ...], int]):
+        """Отправка накопленных текстов в пул"""
+        handle = self.flush_handles.pop(key, None)
+        if handle:
+            handle.cancel()
+        batch = self.pending.pop(key, [])
+        if batch:
+            task = asyncio.ensure_future(self._run(key, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, key: Tuple[Tuple[str, ...], int], batch: List[Tuple[str, asyncio.Future]]):
+        analyses, keyword_limit = key
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), analyze_batch, [text for text, _ in batch], analyses, keyword_limit
+            )
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+# Общий пул анализа: процессы и загруженные словари используются всеми пайплайнами
+_pools: Dict[str, AnalyzerPool] = {}
+
+def get_analyzer_pool(lexicon_path: str, processes: int = 2) -> AnalyzerPool:
+    """Общий пул анализа для файла словарей (число процессов задает первый запрос)"""
+    if lexicon_path not in _pools:
+        _pools[lexicon_path] = AnalyzerPool(lexicon_path, processes)
+    return _pools[lexicon_path]
+
+def shutdown_analyzer_pools():
+    """Остановка всех пулов анализа"""
+    for pool in _pools.values():
+        pool.shutdown()
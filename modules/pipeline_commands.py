@@ -19,6 +19,10 @@ class PipelineCommands:
         self.pipeline_manager = pipeline_manager
         self.logger = pipeline_manager.logger
     
+    async def _respond(self, event, text: str):
+        """Ответ на команду через общий ограничитель запросов"""
+        return await self.pipeline_manager.rate_limiter.call('send', event.respond, text)
+    
     async def setup_commands(self):
         """Настройка команд"""
         @self.client.on(events.NewMessage(pattern=r'^\.pipelines_start_all$'))
@@ -72,6 +76,14 @@ class PipelineCommands:
         @self.client.on(events.NewMessage(pattern=r'^\.destinations_list$'))
         async def list_destinations(event):
             await self.list_destinations_command(event)
+        
+        @self.client.on(events.NewMessage(pattern=r'^\.trends (\S+)(?: (\d+))?$'))
+        async def trends(event):
+            await self.trends_command(event)
+        
+        @self.client.on(events.NewMessage(pattern=r'^\.engagement (\S+)(?: (\d+))?$'))
+        async def engagement(event):
+            await self.engagement_command(event)
     
     async def start_all_pipelines_command(self, event):
         """Команда .pipelines_start_all"""
@@ -92,10 +104,10 @@ class PipelineCommands:
             response += f"❌ Ошибок: {failed_count}\n"
             response += f"📊 Всего пайплайнов: {len(self.pipeline_manager.pipelines)}"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка запуска пайплайнов: {e}")
+            await self._respond(event, f"❌ Ошибка запуска пайплайнов: {e}")
     
     async def stop_all_pipelines_command(self, event):
         """Команда .pipelines_stop_all"""
@@ -111,10 +123,10 @@ class PipelineCommands:
             response += f"✅ Остановлено: {stopped_count}\n"
             response += f"📊 Всего пайплайнов: {len(self.pipeline_manager.pipelines)}"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка остановки пайплайнов: {e}")
+            await self._respond(event, f"❌ Ошибка остановки пайплайнов: {e}")
     
     async def pipeline_status_command(self, event):
         """Команда .pipeline_status <pipeline_name>"""
@@ -123,11 +135,12 @@ class PipelineCommands:
             status = await self.pipeline_manager.get_pipeline_status(pipeline_name)
             
             if not status:
-                await event.respond(f"❌ Пайплайн '{pipeline_name}' не найден")
+                await self._respond(event, f"❌ Пайплайн '{pipeline_name}' не найден")
                 return
             
             response = f"📊 **Статус пайплайна: {pipeline_name}**\n\n"
             response += f"🔄 Статус: {'✅ Активен' if status['enabled'] else '❌ Отключен'}\n"
+            response += f"⚙️ Выполняется: {'Да' if status['running'] else 'Нет'}, в очереди: {status['queued']}\n"
             response += f"📥 Источник: {status['source']}\n"
             response += f"📤 Назначения: {', '.join(status['destinations'])}\n"
             response += f"📈 Обработано: {status['total_processed']}\n"
@@ -146,10 +159,10 @@ class PipelineCommands:
                 if stats.get('last_activity'):
                     response += f"• Последняя активность: {stats['last_activity']}\n"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения статуса: {e}")
+            await self._respond(event, f"❌ Ошибка получения статуса: {e}")
     
     async def add_source_command(self, event):
         """Команда .source_add <name> <id>"""
@@ -165,14 +178,14 @@ class PipelineCommands:
                 response += f"🆔 ID: {source_id}\n"
                 response += f"📊 Всего источников: {len(self.pipeline_manager.sources)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Ошибка добавления источника '{name}'")
+                await self._respond(event, f"❌ Ошибка добавления источника '{name}'")
         
         except ValueError:
-            await event.respond("❌ Неверный формат ID источника")
+            await self._respond(event, "❌ Неверный формат ID источника")
         except Exception as e:
-            await event.respond(f"❌ Ошибка добавления источника: {e}")
+            await self._respond(event, f"❌ Ошибка добавления источника: {e}")
     
     async def remove_source_command(self, event):
         """Команда .source_remove <name>"""
@@ -185,12 +198,12 @@ class PipelineCommands:
                 response += f"📝 Название: {name}\n"
                 response += f"📊 Осталось источников: {len(self.pipeline_manager.sources)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Источник '{name}' не найден")
+                await self._respond(event, f"❌ Источник '{name}' не найден")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка удаления источника: {e}")
+            await self._respond(event, f"❌ Ошибка удаления источника: {e}")
     
     async def add_destination_command(self, event):
         """Команда .destination_add <name> <type> <config>"""
@@ -203,7 +216,7 @@ class PipelineCommands:
             try:
                 config = json.loads(config_str)
             except json.JSONDecodeError:
-                await event.respond("❌ Неверный формат конфигурации (должен быть JSON)")
+                await self._respond(event, "❌ Неверный формат конфигурации (должен быть JSON)")
                 return
             
             success = await self.pipeline_manager.add_destination(name, dest_type, config)
@@ -215,12 +228,12 @@ class PipelineCommands:
                 response += f"⚙️ Конфигурация: {json.dumps(config, ensure_ascii=False)}\n"
                 response += f"📊 Всего назначений: {len(self.pipeline_manager.destinations)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Ошибка добавления назначения '{name}'")
+                await self._respond(event, f"❌ Ошибка добавления назначения '{name}'")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка добавления назначения: {e}")
+            await self._respond(event, f"❌ Ошибка добавления назначения: {e}")
     
     async def remove_destination_command(self, event):
         """Команда .destination_remove <name>"""
@@ -233,12 +246,12 @@ class PipelineCommands:
                 response += f"📝 Название: {name}\n"
                 response += f"📊 Осталось назначений: {len(self.pipeline_manager.destinations)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Назначение '{name}' не найдено")
+                await self._respond(event, f"❌ Назначение '{name}' не найдено")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка удаления назначения: {e}")
+            await self._respond(event, f"❌ Ошибка удаления назначения: {e}")
     
     async def create_pipeline_command(self, event):
         """Команда .pipeline_create <name> <source> <destinations>"""
@@ -259,12 +272,12 @@ class PipelineCommands:
                 response += f"📤 Назначения: {', '.join(destinations)}\n"
                 response += f"📊 Всего пайплайнов: {len(self.pipeline_manager.pipelines)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Ошибка создания пайплайна '{name}'")
+                await self._respond(event, f"❌ Ошибка создания пайплайна '{name}'")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка создания пайплайна: {e}")
+            await self._respond(event, f"❌ Ошибка создания пайплайна: {e}")
     
     async def remove_pipeline_command(self, event):
         """Команда .pipeline_remove <name>"""
@@ -277,12 +290,12 @@ class PipelineCommands:
                 response += f"📝 Название: {name}\n"
                 response += f"📊 Осталось пайплайнов: {len(self.pipeline_manager.pipelines)}"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             else:
-                await event.respond(f"❌ Пайплайн '{name}' не найден")
+                await self._respond(event, f"❌ Пайплайн '{name}' не найден")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка удаления пайплайна: {e}")
+            await self._respond(event, f"❌ Ошибка удаления пайплайна: {e}")
     
     async def export_stats_command(self, event):
         """Команда .stats_export <type>"""
@@ -309,19 +322,19 @@ class PipelineCommands:
                     response += f"• Ошибок: {report['summary']['total_errors']}\n"
                     response += f"• Активных пайплайнов: {report['summary']['active_pipelines']}\n"
                 
-                await event.respond(response)
+                await self._respond(event, response)
             
             else:
-                await event.respond("❌ Неизвестный тип экспорта. Доступные типы: all_pipelines")
+                await self._respond(event, "❌ Неизвестный тип экспорта. Доступные типы: all_pipelines")
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка экспорта статистики: {e}")
+            await self._respond(event, f"❌ Ошибка экспорта статистики: {e}")
     
     async def list_pipelines_command(self, event):
         """Команда .pipelines_list"""
         try:
             if not self.pipeline_manager.pipelines:
-                await event.respond("📋 Пайплайны не найдены")
+                await self._respond(event, "📋 Пайплайны не найдены")
                 return
             
             response = f"📋 **Список пайплайнов** ({len(self.pipeline_manager.pipelines)})\n\n"
@@ -334,16 +347,16 @@ class PipelineCommands:
                 response += f"   📊 Обработано: {pipeline.total_processed}\n"
                 response += f"   ❌ Ошибок: {pipeline.total_errors}\n\n"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения списка пайплайнов: {e}")
+            await self._respond(event, f"❌ Ошибка получения списка пайплайнов: {e}")
     
     async def list_sources_command(self, event):
         """Команда .sources_list"""
         try:
             if not self.pipeline_manager.sources:
-                await event.respond("📋 Источники не найдены")
+                await self._respond(event, "📋 Источники не найдены")
                 return
             
             response = f"📋 **Список источников** ({len(self.pipeline_manager.sources)})\n\n"
@@ -356,16 +369,16 @@ class PipelineCommands:
                 response += f"   📊 Сообщений: {source.message_count}\n"
                 response += f"   ❌ Ошибок: {source.error_count}\n\n"
             
-            await event.respond(response)
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения списка источников: {e}")
+            await self._respond(event, f"❌ Ошибка получения списка источников: {e}")
     
     async def list_destinations_command(self, event):
         """Команда .destinations_list"""
         try:
             if not self.pipeline_manager.destinations:
-                await event.respond("📋 Назначения не найдены")
+                await self._respond(event, "📋 Назначения не найдены")
                 return
             
             response = f"📋 **Список назначений** ({len(self.pipeline_manager.destinations)})\n\n"
@@ -377,7 +390,71 @@ class PipelineCommands:
                 response += f"   ✅ Успешно: {destination.success_count}\n"
                 response += f"   ❌ Ошибок: {destination.error_count}\n\n"
             
-            await event.respond(response)
+            await self._respond(event, response)
+        
+        except Exception as e:
+            await self._respond(event, f"❌ Ошибка получения списка назначений: {e}") 
+    
+    async def trends_command(self, event):
+        """Команда .trends <pipeline_name> [количество]"""
+        try:
+            pipeline_name = event.pattern_match.group(1)
+            limit = int(event.pattern_match.group(2) or 10)
+            
+            if pipeline_name not in self.pipeline_manager.pipelines:
+                await self._respond(event, f"❌ Пайплайн '{pipeline_name}' не найден")
+                return
+            
+            trends = await self.pipeline_manager.get_trends(pipeline_name, limit)
+            if not trends:
+                await self._respond(event, f"📉 Нет данных о трендах пайплайна '{pipeline_name}' (пайплайн не запущен или без шага трендов)")
+                return
+            
+            response = f"📈 **Тренды: {pipeline_name}**\n\n"
+            for source_name, terms in trends.items():
+                response += f"📥 **{source_name}**\n"
+                if not terms:
+                    response += "   Всплесков нет\n"
+                for index, term in enumerate(terms, 1):
+                    response += f"   {index}. {term['term']} - {term['count']} упоминаний, всплеск {term['score']}\n"
+                response += "\n"
+            
+            await self._respond(event, response)
+        
+        except Exception as e:
+            await self._respond(event, f"❌ Ошибка получения трендов: {e}")
+    
+    async def engagement_command(self, event):
+        """Команда .engagement <pipeline_name> [количество окон]"""
+        try:
+            pipeline_name = event.pattern_match.group(1)
+            windows = int(event.pattern_match.group(2) or 6)
+            
+            if pipeline_name not in self.pipeline_manager.pipelines:
+                await self._respond(event, f"❌ Пайплайн '{pipeline_name}' не найден")
+                return
+            
+            report = await self.pipeline_manager.get_engagement(pipeline_name, windows)
+            if not report:
+                await self._respond(event, f"📉 Нет данных о вовлеченности пайплайна '{pipeline_name}' (пайплайн не запущен или без шага вовлеченности)")
+                return
+            
+            response = f"💬 **Вовлеченность: {pipeline_name}**\n\n"
+            for window in report['windows']:
+                start = datetime.fromtimestamp(window['start']).strftime('%d.%m %H:%M')
+                response += f"🕐 **{start}**: {window['messages']} сообщений, {window['replies']} ответов, "
+                response += f"{window['participants']} участников, новых веток: {window['threads_started']}\n"
+                if window['latency_p50'] is not None:
+                    response += f"   ⏱ Ответ: медиана до {window['latency_p50']:.0f}с, 90% до {window['latency_p90']:.0f}с\n"
+                if window['views'] or window['reactions']:
+                    response += f"   👁 {window['views']} просмотров, {window['reactions']} реакций, {window['forwards']} пересылок\n"
+            
+            if report['top_threads']:
+                response += f"\n🧵 **Крупнейшие ветки:**\n"
+                for thread in report['top_threads']:
+                    response += f"• {thread['thread_id']}: {thread['size']} сообщений, {thread['participants']} участников, глубина {thread['max_depth']}\n"
+            
+            await self._respond(event, response)
         
         except Exception as e:
-            await event.respond(f"❌ Ошибка получения списка назначений: {e}") 
\ No newline at end of file
+            await self._respond(event, f"❌ Ошибка получения вовлеченности: {e}")
@@ -5,13 +5,24 @@
 import json
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
-from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
 from pathlib import Path
-import aiofiles
 from telethon import TelegramClient
-from telethon.errors import FloodWaitError, ChatAdminRequiredError
+
+from .source_reader import SourceReader
+from .checkpoints import CheckpointStore
+from .pipeline_workers import PipelineWorkerPool
+from .rate_limiter import RateLimiter
+from .client_pool import ClientPool
+from .processing_steps import ExecutionPlan, StepContext, compile_steps
+from .nlp_analysis import shutdown_analyzer_pools
+from .media_downloader import shutdown_media_downloaders
+from .destination_writers import DestinationWriter, create_writer, destination_error
+from .trend_detection import TrendTracker
+from .engagement import EngagementTracker
+from .message_record import MessageRecord, MessageView, parsing_flags
 
 @dataclass
 class Source:
@@ -25,6 +36,7 @@ class Source:
     last_activity: Optional[datetime] = None
     message_count: int = 0
     error_count: int = 0
+    backfill: Dict[str, Any] = field(default_factory=dict)  # concurrency, range_size, ordered
 
 @dataclass
 class Destination:
@@ -50,6 +62,10 @@ class Pipeline:
     last_run: Optional[datetime] = None
     total_processed: int = 0
     total_errors: int = 0
+    workers: int = 1
+    queue_size: int = 100
+    ordering_key: Optional[str] = None  # chat, reply_thread, sender
+    batch_size: int = 1  # сообщений в пачке для шагов с пакетной обработкой
 
 @dataclass
 class PipelineStats:
@@ -68,6 +84,8 @@ class PipelineMonitor:
     def __init__(self):
         self.stats: Dict[str, PipelineStats] = {}
         self.alerts: List[Dict[str, Any]] = []
+        # Передача уведомлений дальше (из процесса-воркера в основной процесс)
+        self.on_alert: Optional[Callable[[Dict[str, Any]], None]] = None
         self.logger = logging.getLogger(__name__)
     
     async def track_pipeline(self, pipeline_name: str, data: dict):
@@ -125,18 +143,35 @@ class PipelineMonitor:
         }
         self.alerts.append(alert)
         self.logger.warning(f"Alert [{alert_type}]: {message}")
+        if self.on_alert:
+            self.on_alert(alert)
 
 class PipelineManager:
     """Управление пайплайнами"""
     
-    def __init__(self, client: TelegramClient, config_path: str = "./config"):
-        self.client = client
+    def __init__(self, client: TelegramClient, config_path: str = "./config", data_path: str = "./data",
+                 rate_limiter: Optional[RateLimiter] = None, client_pool: Optional[ClientPool] = None,
+                 in_worker: bool = False):
+        # Источники распределяются по сессиям пула; основная сессия отправляет сообщения
+        self.client_pool = client_pool or ClientPool({'default': client}, {'default': rate_limiter or RateLimiter()})
+        self.client = self.client_pool.primary.client
+        self.rate_limiter = self.client_pool.primary.rate_limiter
         self.config_path = Path(config_path)
         self.config_path.mkdir(exist_ok=True)
+        self.data_path = Path(data_path)
+        # Менеджер процесса-воркера: шаги получают снимки сообщений без клиента Telegram
+        self.in_worker = in_worker
         
         self.sources: Dict[str, Source] = {}
         self.destinations: Dict[str, Destination] = {}
         self.pipelines: Dict[str, Pipeline] = {}
+        self.readers: Dict[str, SourceReader] = {}
+        self.worker_pools: Dict[str, PipelineWorkerPool] = {}
+        self.pipeline_locks: Dict[str, asyncio.Lock] = {}
+        self.plans: Dict[str, ExecutionPlan] = {}
+        self.writers: Dict[str, DestinationWriter] = {}
+        self.process_supervisor = None
+        self.checkpoints = CheckpointStore(str(self.data_path / "checkpoints.json"))
         self.monitor = PipelineMonitor()
         self.logger = logging.getLogger(__name__)
         
@@ -145,6 +180,8 @@ class PipelineManager:
     
     def load_config(self):
         """Загрузка конфигурации из файлов"""
+        # Шаги перекомпилируются по новой конфигурации
+        self.close_plans()
         try:
             # Загрузка источников
             sources_file = self.config_path / "sources.json"
@@ -202,6 +239,10 @@ class PipelineManager:
             with open(self.config_path / "pipelines.json", 'w', encoding='utf-8') as f:
                 json.dump(pipelines_data, f, indent=2, ensure_ascii=False, default=str)
             
+            # Процессы-воркеры перечитывают конфигурацию
+            if self.process_supervisor:
+                await self.process_supervisor.reload_config()
+            
             self.logger.info("Конфигурация сохранена")
         
         except Exception as e:
@@ -212,7 +253,7 @@ class PipelineManager:
         """Добавление нового источника"""
         try:
             # Проверка доступа к источнику
-            entity = await self.client.get_entity(source_id)
+            entity = await self.rate_limiter.call('entity', self.client.get_entity, source_id)
             
             source = Source(
                 id=source_id,
@@ -276,6 +317,9 @@ class PipelineManager:
     async def remove_destination(self, name: str) -> bool:
         """Удаление назначения"""
         if name in self.destinations:
+            writer = self.writers.pop(name, None)
+            if writer:
+                await writer.close()
             del self.destinations[name]
             await self.save_config()
             self.logger.info(f"Удалено назначение: {name}")
@@ -315,12 +359,25 @@ class PipelineManager:
     async def remove_pipeline(self, name: str) -> bool:
         """Удаление пайплайна"""
         if name in self.pipelines:
+            await self.stop_pipeline(name)
             del self.pipelines[name]
+            self.checkpoints.reset(name)
             await self.save_config()
             self.logger.info(f"Удален пайплайн: {name}")
             return True
         return False
     
+    def is_pipeline_running(self, pipeline_name: str) -> bool:
+        """Проверка, запущен ли пайплайн"""
+        pool = self.worker_pools.get(pipeline_name)
+        return pool is not None and pool.is_running
+    
+    def _pipeline_lock(self, pipeline_name: str) -> asyncio.Lock:
+        """Блокировка запуска и остановки одного пайплайна"""
+        if pipeline_name not in self.pipeline_locks:
+            self.pipeline_locks[pipeline_name] = asyncio.Lock()
+        return self.pipeline_locks[pipeline_name]
+    
     async def start_pipeline(self, pipeline_name: str) -> bool:
         """Запуск пайплайна"""
         if pipeline_name not in self.pipelines:
@@ -332,26 +389,131 @@ class PipelineManager:
             self.logger.error(f"Пайплайн {pipeline_name} отключен")
             return False
         
-        try:
-            # Запуск обработки в отдельной задаче
-            asyncio.create_task(self._run_pipeline(pipeline_name))
-            self.logger.info(f"Пайплайн {pipeline_name} запущен")
-            return True
-        
-        except Exception as e:
-            self.logger.error(f"Ошибка запуска пайплайна {pipeline_name}: {e}")
+        if pipeline.source not in self.sources:
+            self.logger.error(f"Источник {pipeline.source} пайплайна {pipeline_name} не найден")
             return False
+
+        # Назначение, в которое нельзя записать, не запускается: иначе контрольная точка
+        # сдвигалась бы через несохраненные записи
+        for dest_name in pipeline.destinations:
+            destination = self.destinations.get(dest_name)
+            if destination is None:
+                error = "не найдено"
+            else:
+                error = destination_error(destination) if destination.enabled else None
+            if error:
+                self.logger.error(f"Назначение {dest_name} пайплайна {pipeline_name}: {error}")
+                return False
+
+        async with self._pipeline_lock(pipeline_name):
+            # Повторный запуск не создает второй экземпляр
+            if self.is_pipeline_running(pipeline_name):
+                self.logger.info(f"Пайплайн {pipeline_name} уже запущен")
+                return True
+            
+            # Шаги обработки компилируются один раз при запуске и только в процессе,
+            # который их выполняет: ресурсы шагов (индексы, анализаторы) не дублируются
+            if self.process_supervisor:
+                error = await self.process_supervisor.compile_pipeline(pipeline_name)
+            else:
+                error = self.compile_pipeline(pipeline_name)
+            if error:
+                self.logger.error(f"Ошибка конфигурации пайплайна {pipeline_name}: {error}")
+                return False
+            
+            try:
+                # Подписка на общий читатель источника, одно чтение на источник
+                # Продолжение с контрольной точки вместо повторного чтения всей истории
+                last_id = self.checkpoints.get(pipeline_name, pipeline.source)
+                
+                # Чтение и обработка разделены ограниченной очередью пула воркеров
+                pool = self._get_worker_pool(pipeline_name)
+                pool.start()
+                
+                reader = self._get_reader(pipeline.source)
+                reader.subscribe(
+                    pipeline_name, pool.put, after_id=last_id,
+                    ordered=pipeline.ordering_key is not None, on_skip=pool.skip
+                )
+                reader.start()
+                self.checkpoints.start()
+                self.logger.info(f"Пайплайн {pipeline_name} запущен с ID {last_id + 1}")
+                return True
+            
+            except Exception as e:
+                self.logger.error(f"Ошибка запуска пайплайна {pipeline_name}: {e}")
+                return False
     
-    async def stop_pipeline(self, pipeline_name: str) -> bool:
-        """Остановка пайплайна"""
-        # В реальной реализации здесь нужно остановить задачу
-        self.logger.info(f"Пайплайн {pipeline_name} остановлен")
-        return True
+    async def stop_pipeline(self, pipeline_name: str, timeout: float = 30.0) -> bool:
+        """Остановка пайплайна с дообработкой уже полученных сообщений в пределах timeout"""
+        async with self._pipeline_lock(pipeline_name):
+            pool = self.worker_pools.get(pipeline_name)
+            if pool is None:
+                self.logger.info(f"Пайплайн {pipeline_name} не запущен")
+                return False
+            
+            try:
+                # Прекращение приема новых сообщений
+                pipeline = self.pipelines.get(pipeline_name)
+                source_name = pipeline.source if pipeline else None
+                reader = self.readers.get(source_name)
+                if reader:
+                    reader.unsubscribe(pipeline_name)
+                
+                # Дообработка сообщений из очереди и остановка воркеров
+                drained = await pool.drain(timeout)
+                if not drained:
+                    self.logger.warning(f"Пайплайн {pipeline_name}: не обработано {pool.queued} сообщений за {timeout}с")
+                
+                # Запись накопленных пачек (в воркере - вместе с сохранением состояния шагов)
+                # и ожидание записи результатов до фиксации контрольной точки
+                await self.flush_destinations(pipeline_name)
+                if self.process_supervisor:
+                    await self.process_supervisor.close_pipeline(pipeline_name)
+                if not await pool.wait_written(timeout):
+                    self.logger.warning(f"Пайплайн {pipeline_name}: результаты не записаны в назначения за {timeout}с")
+                
+                # Фиксация контрольной точки по фактически записанным сообщениям
+                if source_name:
+                    self._commit_checkpoints(source_name)
+                self.checkpoints.flush()
+                
+                # Сохранение состояния шагов (дедупликация и т.п.)
+                self._close_plan(pipeline_name)
+                
+                # Чтение источника останавливается, когда у него не остается подписчиков
+                if reader and not reader.subscribers:
+                    await reader.stop()
+                    self.client_pool.release(source_name)
+                
+                self.logger.info(f"Пайплайн {pipeline_name} остановлен")
+                return True
+            
+            except Exception as e:
+                self.logger.error(f"Ошибка остановки пайплайна {pipeline_name}: {e}")
+                return False
+            
+            finally:
+                self.worker_pools.pop(pipeline_name, None)
+    
+    async def stop_all(self, timeout: float = 30.0):
+        """Остановка всех запущенных пайплайнов и сохранение состояния"""
+        running = list(self.worker_pools)
+        if running:
+            self.logger.info(f"Остановка {len(running)} пайплайнов...")
+            await asyncio.gather(*(self.stop_pipeline(name, timeout) for name in running))
+        
+        for reader in self.readers.values():
+            await reader.stop()
+        
+        await self.close_writers()
+        await self.checkpoints.close()
+        shutdown_analyzer_pools()
+        shutdown_media_downloaders()
     
     async def restart_pipeline(self, pipeline_name: str) -> bool:
         """Перезапуск пайплайна"""
         await self.stop_pipeline(pipeline_name)
-        await asyncio.sleep(1)
         return await self.start_pipeline(pipeline_name)
     
     async def get_pipeline_status(self, pipeline_name: str) -> Optional[Dict[str, Any]]:
@@ -365,6 +527,8 @@ class PipelineManager:
         return {
             'name': pipeline.name,
             'enabled': pipeline.enabled,
+            'running': self.is_pipeline_running(pipeline_name),
+            'queued': self.worker_pools[pipeline_name].queued if pipeline_name in self.worker_pools else 0,
             'source': pipeline.source,
             'destinations': pipeline.destinations,
             'total_processed': pipeline.total_processed,
@@ -374,194 +538,302 @@ class PipelineManager:
             'stats': asdict(stats)
         }
     
-    async def _run_pipeline(self, pipeline_name: str):
-        """Выполнение пайплайна"""
-        pipeline = self.pipelines[pipeline_name]
-        source = self.sources[pipeline.source]
-        
-        self.logger.info(f"Запуск пайплайна {pipeline_name} для источника {pipeline.source}")
-        
-        try:
-            async for message in self.client.iter_messages(source.id, reverse=True):
-                if not pipeline.enabled:
-                    break
-                
-                start_time = datetime.now()
-                
-                try:
-                    # Обработка сообщения через пайплайн
-                    processed_data = await self._process_message(message, pipeline)
-                    
-                    # Отправка в назначения
-                    for dest_name in pipeline.destinations:
-                        destination = self.destinations[dest_name]
-                        if destination.enabled:
-                            await self._send_to_destination(processed_data, destination)
-                    
-                    # Обновление статистики
-                    processing_time = (datetime.now() - start_time).total_seconds()
-                    await self.monitor.track_pipeline(pipeline_name, {
-                        'processed': 1,
-                        'errors': 0,
-                        'processing_time': processing_time
-                    })
-                    
-                    pipeline.total_processed += 1
-                    pipeline.last_run = datetime.now()
-                
-                except Exception as e:
-                    self.logger.error(f"Ошибка обработки сообщения в пайплайне {pipeline_name}: {e}")
-                    pipeline.total_errors += 1
-                    await self.monitor.track_pipeline(pipeline_name, {
-                        'processed': 0,
-                        'errors': 1,
-                        'processing_time': 0
-                    })
-                
-                await asyncio.sleep(0.1)  # Небольшая задержка
-        
-        except Exception as e:
-            self.logger.error(f"Критическая ошибка в пайплайне {pipeline_name}: {e}")
-            await self.monitor.send_alert("pipeline_error", f"Ошибка пайплайна {pipeline_name}: {e}", pipeline_name)
-    
-    async def _process_message(self, message, pipeline: Pipeline) -> Dict[str, Any]:
-        """Обработка сообщения через пайплайн"""
-        processed_data = {
-            'message_id': message.id,
-            'text': message.text or "",
-            'sender_id': message.sender_id,
-            'date': message.date.isoformat(),
-            'source': pipeline.source,
-            'pipeline': pipeline.name
-        }
-        
-        # Применение шагов обработки
-        for step in pipeline.processing_steps:
-            step_type = step.get('type')
-            step_config = step.get('config', {})
-            
-            if step_type == 'filter':
-                if not await self._apply_filter(processed_data, step_config):
-                    return None  # Сообщение отфильтровано
-            
-            elif step_type == 'formatter':
-                processed_data = await self._apply_formatter(processed_data, step_config)
-            
-            elif step_type == 'classifier':
-                processed_data = await self._apply_classifier(processed_data, step_config)
-        
-        return processed_data
+    def trends(self, pipeline_name: str, limit: int = 10) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Тренды источников пайплайна в этом процессе; None - пайплайн не запущен"""
+        plan = self.plans.get(pipeline_name)
+        if plan is None:
+            return None
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for resource in plan.resources:
+            if isinstance(resource, TrendTracker):
+                result.update(resource.top(limit))
+        return result
     
-    async def _apply_filter(self, data: Dict[str, Any], config: Dict[str, Any]) -> bool:
-        """Применение фильтра"""
-        text = data.get('text', '').lower()
-        
-        # Фильтр по ключевым словам
-        if 'keywords' in config:
-            keywords = config['keywords']
-            if keywords and not any(keyword in text for keyword in keywords):
-                return False
-        
-        # Фильтр по исключающим словам
-        if 'exclude_keywords' in config:
-            exclude_keywords = config['exclude_keywords']
-            if any(keyword in text for keyword in exclude_keywords):
-                return False
+    def engagement(self, pipeline_name: str, windows: int = 24) -> Optional[Dict[str, Any]]:
+        """Сводки вовлеченности пайплайна в этом процессе; None - пайплайн не запущен"""
+        plan = self.plans.get(pipeline_name)
+        if plan is None:
+            return None
+        for resource in plan.resources:
+            if isinstance(resource, EngagementTracker):
+                return resource.report(windows)
+        return {}
+    
+    async def get_engagement(self, pipeline_name: str, windows: int = 24) -> Optional[Dict[str, Any]]:
+        """Сводки вовлеченности пайплайна (в многопроцессном режиме - из процесса-воркера)"""
+        if self.process_supervisor:
+            return await self.process_supervisor.query(pipeline_name, 'engagement', windows)
+        return self.engagement(pipeline_name, windows)
+    
+    async def get_trends(self, pipeline_name: str, limit: int = 10) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Тренды источников пайплайна (в многопроцессном режиме - из процесса-воркера)"""
+        if self.process_supervisor:
+            return await self.process_supervisor.query(pipeline_name, 'trends', limit)
+        return self.trends(pipeline_name, limit)
+    
+    def _get_reader(self, source_name: str) -> SourceReader:
+        """Получение общего читателя источника"""
+        reader = self.readers.get(source_name)
+        if reader is None:
+            reader = SourceReader(self.client_pool, source_name, self.sources[source_name], self.monitor)
+            reader.on_safe_checkpoint = lambda: self._commit_checkpoints(source_name)
+            self.readers[source_name] = reader
+        return reader
+    
+    def _commit_checkpoints(self, source_name: str):
+        """Фиксация контрольных точек пайплайнов источника по уже обработанным сообщениям"""
+        reader = self.readers[source_name]
+        for pipeline_name, pool in self.worker_pools.items():
+            pipeline = self.pipelines.get(pipeline_name)
+            if pipeline and pipeline.source == source_name and pool.tracker.watermark:
+                self.checkpoints.update(pipeline_name, source_name, reader.checkpoint_limit(pool.tracker.watermark))
+    
+    def _get_worker_pool(self, pipeline_name: str) -> PipelineWorkerPool:
+        """Получение пула воркеров пайплайна"""
+        pool = self.worker_pools.get(pipeline_name)
+        if pool is None:
+            pipeline = self.pipelines[pipeline_name]
+            source_name = pipeline.source
+            pool = PipelineWorkerPool(
+                pipeline_name,
+                lambda message: self._handle_message(pipeline_name, message),
+                workers=pipeline.workers,
+                queue_size=pipeline.queue_size,
+                ordering_key=pipeline.ordering_key,
+                on_progress=lambda message_id: self.checkpoints.update(
+                    pipeline_name, source_name, self._get_reader(source_name).checkpoint_limit(message_id)
+                ),
+                batch_handler=lambda messages: self._handle_batch(pipeline_name, messages),
+                batch_size=pipeline.batch_size
+            )
+            self.worker_pools[pipeline_name] = pool
+        return pool
+    
+    async def _handle_message(self, pipeline_name: str, message) -> Optional[Awaitable]:
+        """Обработка одного сообщения источника в пайплайне
+
+        Возвращает awaitable, завершающийся после записи результата в назначения.
+        """
+        pipeline = self.pipelines.get(pipeline_name)
+        if pipeline is None or not pipeline.enabled:
+            return None
         
-        # Фильтр по длине
-        if 'min_length' in config and len(text) < config['min_length']:
-            return False
+        # В многопроцессном режиме обработка выполняется в процессе-воркере
+        writes: List[asyncio.Future] = []
+        if self.process_supervisor:
+            result = await self.process_supervisor.submit(pipeline_name, message, writes)
+        else:
+            result = await self.execute_message(pipeline_name, message, writes)
         
-        return True
+        await self._track_result(pipeline_name, pipeline, result)
+        return asyncio.gather(*writes) if writes else None
     
-    async def _apply_formatter(self, data: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
-        """Применение форматирования"""
-        if config.get('add_timestamps'):
-            data['processed_at'] = datetime.now().isoformat()
-        
-        if config.get('add_source_info'):
-            data['source_info'] = {
-                'pipeline': data.get('pipeline'),
-                'source': data.get('source')
-            }
+    async def _handle_batch(self, pipeline_name: str, messages: List[Any]) -> Optional[Awaitable]:
+        """Обработка пачки сообщений источника в пайплайне; возвращает ожидание записи результатов"""
+        pipeline = self.pipelines.get(pipeline_name)
+        if pipeline is None or not pipeline.enabled:
+            return None
         
-        if config.get('normalize_text'):
-            data['text'] = data.get('text', '').strip()
+        writes: List[asyncio.Future] = []
+        if self.process_supervisor:
+            results = await asyncio.gather(*(
+                self.process_supervisor.submit(pipeline_name, message, writes) for message in messages
+            ))
+        else:
+            results = await self.execute_batch(pipeline_name, messages, writes)
         
-        return data
+        for result in results:
+            await self._track_result(pipeline_name, pipeline, result)
+        return asyncio.gather(*writes) if writes else None
     
-    async def _apply_classifier(self, data: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
-        """Применение классификации"""
-        text = data.get('text', '').lower()
+    async def _track_result(self, pipeline_name: str, pipeline: Pipeline, result: Dict[str, Any]):
+        """Обновление статистики по результату обработки сообщения"""
+        await self.monitor.track_pipeline(pipeline_name, result)
+        if result['errors']:
+            pipeline.total_errors += 1
+        else:
+            pipeline.total_processed += 1
+            pipeline.last_run = datetime.now()
+    
+    async def execute_message(self, pipeline_name: str, message,
+                              writes: Optional[List[asyncio.Future]] = None) -> Dict[str, Any]:
+        """Обработка сообщения и отправка в назначения; возвращает статистику
+
+        В writes добавляются future записи результата в буферы назначений.
+        """
+        pipeline = self.pipelines[pipeline_name]
+        start_time = datetime.now()
         
-        if 'urgency_keywords' in config:
-            urgency_keywords = config['urgency_keywords']
-            priority_levels = config.get('priority_levels', ['low', 'medium', 'high', 'critical'])
+        try:
+            # Обработка сообщения через пайплайн
+            processed_data = await self._process_message(message, pipeline_name)
             
-            urgency_count = sum(1 for keyword in urgency_keywords if keyword in text)
+            # Отправка в назначения
+            futures = await self._deliver(pipeline, processed_data)
+            if writes is not None:
+                writes.extend(futures)
             
-            if urgency_count >= 3:
-                data['priority'] = priority_levels[3]  # critical
-            elif urgency_count >= 2:
-                data['priority'] = priority_levels[2]  # high
-            elif urgency_count >= 1:
-                data['priority'] = priority_levels[1]  # medium
-            else:
-                data['priority'] = priority_levels[0]  # low
+            return {
+                'processed': 1,
+                'errors': 0,
+                'processing_time': (datetime.now() - start_time).total_seconds()
+            }
         
-        return data
+        except Exception as e:
+            self.logger.error(f"Ошибка обработки сообщения в пайплайне {pipeline_name}: {e}")
+            return {
+                'processed': 0,
+                'errors': 1,
+                'processing_time': 0
+            }
     
-    async def _send_to_destination(self, data: Dict[str, Any], destination: Destination):
-        """Отправка данных в назначение"""
-        try:
-            if destination.type == 'telegram':
-                await self._send_to_telegram(data, destination)
-            elif destination.type == 'file':
-                await self._send_to_file(data, destination)
-            elif destination.type == 'database':
-                await self._send_to_database(data, destination)
-            
-            destination.success_count += 1
-            destination.last_success = datetime.now()
+    async def execute_batch(self, pipeline_name: str, messages: List[Any],
+                            writes: Optional[List[asyncio.Future]] = None) -> List[Dict[str, Any]]:
+        """Обработка пачки сообщений и отправка в назначения; возвращает статистику по каждому"""
+        pipeline = self.pipelines[pipeline_name]
+        start_time = datetime.now()
         
+        try:
+            processed = await self.process_batch(pipeline_name, messages)
         except Exception as e:
-            self.logger.error(f"Ошибка отправки в назначение {destination.name}: {e}")
-            destination.error_count += 1
+            self.logger.error(f"Ошибка обработки пачки сообщений в пайплайне {pipeline_name}: {e}")
+            return [{'processed': 0, 'errors': 1, 'processing_time': 0} for _ in messages]
+        
+        # Время шагов делится поровну между сообщениями пачки
+        step_time = (datetime.now() - start_time).total_seconds() / len(messages)
+        results = []
+        for processed_data in processed:
+            send_start = datetime.now()
+            try:
+                futures = await self._deliver(pipeline, processed_data)
+                if writes is not None:
+                    writes.extend(futures)
+                results.append({
+                    'processed': 1,
+                    'errors': 0,
+                    'processing_time': step_time + (datetime.now() - send_start).total_seconds()
+                })
+            except Exception as e:
+                self.logger.error(f"Ошибка отправки сообщения пайплайна {pipeline_name}: {e}")
+                results.append({'processed': 0, 'errors': 1, 'processing_time': 0})
+        return results
+    
+    async def _deliver(self, pipeline: Pipeline, processed_data: Optional[Dict[str, Any]]) -> List[asyncio.Future]:
+        """Отправка обработанного сообщения во все назначения пайплайна; возвращает future записи"""
+        if processed_data is None:
+            return []
+        record = dict(processed_data)
+        futures = []
+        for dest_name in pipeline.destinations:
+            destination = self.destinations[dest_name]
+            if destination.enabled:
+                futures.append(await self._get_writer(dest_name).write(record))
+        return futures
+    
+    def _get_writer(self, dest_name: str) -> DestinationWriter:
+        """Буфер записи назначения (создается при первой отправке)"""
+        destination = self.destinations[dest_name]
+        writer = self.writers.get(dest_name)
+        if writer is None:
+            writer = create_writer(destination, client=self.client, rate_limiter=self.rate_limiter)
+            self.writers[dest_name] = writer
+        elif writer.destination is not destination:
+            # Назначение заменено (перезагрузка конфигурации): новые параметры пачек
+            writer.bind(destination)
+        return writer
+    
+    async def flush_destinations(self, pipeline_name: str):
+        """Запись накопленных пачек назначений пайплайна"""
+        pipeline = self.pipelines.get(pipeline_name)
+        if pipeline is None:
+            return
+        for dest_name in pipeline.destinations:
+            writer = self.writers.get(dest_name)
+            if writer:
+                await writer.close()
+    
+    async def close_writers(self):
+        """Запись накопленных пачек всех назначений"""
+        for writer in list(self.writers.values()):
+            await writer.close()
+    
+    def compile_pipeline(self, pipeline_name: str) -> Optional[str]:
+        """Компиляция шагов пайплайна заново; возвращает ошибку конфигурации или None"""
+        try:
+            plan = self._compile_plan(pipeline_name)
+        except ValueError as e:
+            return str(e)
+        self._close_plan(pipeline_name)
+        self.plans[pipeline_name] = plan
+        return None
+    
+    def _get_plan(self, pipeline_name: str) -> ExecutionPlan:
+        """Скомпилированные шаги пайплайна (компиляция при первом обращении)"""
+        if pipeline_name not in self.plans:
+            self.plans[pipeline_name] = self._compile_plan(pipeline_name)
+        return self.plans[pipeline_name]
+    
+    def _compile_plan(self, pipeline_name: str) -> ExecutionPlan:
+        """Компиляция шагов пайплайна с подпиской на их события"""
+        pipeline = self.pipelines[pipeline_name]
+        plan = compile_steps(
+            pipeline_name, pipeline.processing_steps, str(self.data_path), str(self.config_path), self.in_worker
+        )
+        plan.on_event(lambda event: self._handle_step_event(pipeline_name, event))
+        return plan
     
-    async def _send_to_telegram(self, data: Dict[str, Any], destination: Destination):
-        """Отправка в Telegram"""
-        chat_id = destination.config.get('chat_id')
-        if not chat_id:
+    async def _handle_step_event(self, pipeline_name: str, event: Dict[str, Any]):
+        """Событие шага вне потока сообщений: оповещение и отправка в назначения пайплайна"""
+        pipeline = self.pipelines.get(pipeline_name)
+        if pipeline is None:
             return
         
-        text = data.get('text', '')
-        if destination.config.get('format') == 'markdown':
-            # Форматирование для markdown
-            formatted_text = f"**Сообщение из {data.get('source')}**\n\n{text}"
+        if event.get('event') == 'unanswered':
+            text = f"⏰ Нет ответа на сообщение {event['message_id']} дольше {int(event['timeout'])} с"
         else:
-            formatted_text = f"Сообщение из {data.get('source')}:\n\n{text}"
+            text = f"Событие шага {event.get('step')}: {event.get('event')}"
+        await self.monitor.send_alert(event.get('event', 'step_event'), text, pipeline_name)
         
-        await self.client.send_message(chat_id, formatted_text)
+        try:
+            await self._deliver(pipeline, dict(event, text=text, source=pipeline.source))
+        except Exception as e:
+            self.logger.error(f"Ошибка отправки события пайплайна {pipeline_name}: {e}")
     
-    async def _send_to_file(self, data: Dict[str, Any], destination: Destination):
-        """Отправка в файл"""
-        import aiofiles
-        
-        file_path = destination.config.get('path', './data/exports/')
-        file_format = destination.config.get('format', 'json')
-        
-        Path(file_path).mkdir(parents=True, exist_ok=True)
-        
-        if file_format == 'json':
-            filename = f"{file_path}/export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            async with aiofiles.open(filename, 'a', encoding='utf-8') as f:
-                await f.write(json.dumps(data, ensure_ascii=False) + '\n')
-    
-    async def _send_to_database(self, data: Dict[str, Any], destination: Destination):
-        """Отправка в базу данных"""
-        # Здесь должна быть реализация для конкретной БД
-        # Например, PostgreSQL, MySQL, SQLite
-        pass
+    def _close_plan(self, pipeline_name: str):
+        """Сохранение состояния шагов пайплайна и сброс скомпилированного плана"""
+        plan = self.plans.pop(pipeline_name, None)
+        if plan:
+            plan.close()
+    
+    def close_plans(self):
+        """Сохранение состояния шагов всех пайплайнов"""
+        for pipeline_name in list(self.plans):
+            self._close_plan(pipeline_name)
+    
+    def _prepare_message(self, message, pipeline_name: str) -> Tuple[MessageView, StepContext]:
+        """Исходные данные сообщения и контекст шагов
+
+        Данные - изменения пайплайна поверх общей записи сообщения источника;
+        отдельное сообщение (не от читателя источника) оборачивается в запись здесь.
+        """
+        pipeline = self.pipelines[pipeline_name]
+        if isinstance(message, MessageRecord):
+            record = message
+        else:
+            source = self.sources.get(pipeline.source)
+            record = MessageRecord(message, parsing_flags(source.parsing_rules if source else None))
+        data = MessageView(record, pipeline.source, pipeline.name)
+        return data, StepContext(record.raw, pipeline_name, pipeline.source)
+    
+    async def _process_message(self, message, pipeline_name: str) -> Optional[Dict[str, Any]]:
+        """Обработка сообщения через скомпилированные шаги пайплайна"""
+        data, ctx = self._prepare_message(message, pipeline_name)
+        return await self._get_plan(pipeline_name).run(data, ctx)
+    
+    async def process_batch(self, pipeline_name: str, messages: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """Обработка пачки сообщений; шаги с пакетной реализацией получают всю пачку сразу"""
+        items = [self._prepare_message(message, pipeline_name) for message in messages]
+        return await self._get_plan(pipeline_name).run_batch(items)
     
     async def get_all_statuses(self) -> Dict[str, Any]:
         """Получение статуса всех пайплайнов"""
@@ -0,0 +1,195 @@
+"""
+Пул обработчиков пайплайна: ограниченные очереди, параллельные воркеры и упорядочивание по ключу
+"""
+
+import heapq
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+# Обработчик может вернуть awaitable, завершающийся после записи результатов в назначения
+MessageHandler = Callable[[Any], Awaitable[Optional[Awaitable]]]
+BatchHandler = Callable[[List[Any]], Awaitable[Optional[Awaitable]]]
+
+def _chat_key(message) -> Any:
+    return message.chat_id
+
+def _reply_thread_key(message) -> Any:
+    reply_to = getattr(message, 'reply_to', None)
+    top_id = getattr(reply_to, 'reply_to_top_id', None) if reply_to else None
+    return top_id or getattr(message, 'reply_to_msg_id', None) or message.id
+
+def _sender_key(message) -> Any:
+    return message.sender_id
+
+# Поддерживаемые ключи упорядочивания сообщений внутри пайплайна
+ORDERING_KEYS = {
+    'chat': _chat_key,
+    'reply_thread': _reply_thread_key,
+    'sender': _sender_key,
+}
+
+class WatermarkTracker:
+    """Отслеживание ID, до которого все сообщения гарантированно обработаны"""
+
+    def __init__(self):
+        self.pending: List[int] = []
+        self.completed: Set[int] = set()
+        self.watermark = 0
+
+    def add(self, message_id: int):
+        """Сообщение поставлено в обработку"""
+        heapq.heappush(self.pending, message_id)
+
+    def done(self, message_id: int) -> int:
+        """Сообщение обработано; возвращает текущую границу"""
+        self.completed.add(message_id)
+        while self.pending and self.pending[0] in self.completed:
+            finished_id = heapq.heappop(self.pending)
+            self.completed.discard(finished_id)
+            self.watermark = max(self.watermark, finished_id)
+        return self.watermark
+
+class PipelineWorkerPool:
+    """Ограниченная очередь и набор воркеров одного пайплайна
+
+    Сообщение считается обработанным (и граница контрольной точки проходит через него)
+    только после записи его результатов: если обработчик вернул awaitable, воркер
+    не ждет его, а отмечает сообщения по его завершении. Отмененный awaitable -
+    результаты не записаны, граница на этих сообщениях останавливается.
+    """
+
+    def __init__(self, pipeline_name: str, handler: MessageHandler, workers: int = 1,
+                 queue_size: int = 100, ordering_key: Optional[str] = None,
+                 on_progress: Optional[Callable[[int], None]] = None,
+                 batch_handler: Optional[BatchHandler] = None, batch_size: int = 1):
+        if ordering_key and ordering_key not in ORDERING_KEYS:
+            raise ValueError(f"Неизвестный ключ упорядочивания: {ordering_key}")
+
+        self.pipeline_name = pipeline_name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.ordering_key = ordering_key
+        self.on_progress = on_progress
+        self.batch_handler = batch_handler
+        self.batch_size = max(1, batch_size) if batch_handler else 1
+        self.tracker = WatermarkTracker()
+        self.tasks: List[asyncio.Task] = []
+        # Ожидание записи результатов обработанных сообщений
+        self.writes: Set[asyncio.Future] = set()
+        self.logger = logging.getLogger(__name__)
+
+        # С упорядочиванием у каждого воркера своя очередь: сообщения с одним ключом
+        # всегда попадают к одному воркеру и обрабатываются последовательно
+        queue_count = self.workers if ordering_key else 1
+        per_queue_size = max(1, queue_size // queue_count)
+        self.queues: List[asyncio.Queue] = [asyncio.Queue(maxsize=per_queue_size) for _ in range(queue_count)]
+
+    @property
+    def is_running(self) -> bool:
+        """Проверка, работают ли воркеры"""
+        return any(not task.done() for task in self.tasks)
+
+    @property
+    def queued(self) -> int:
+        """Количество сообщений в очередях"""
+        return sum(queue.qsize() for queue in self.queues)
+
+    def start(self):
+        """Запуск воркеров"""
+        if self.is_running:
+            return
+        self.tasks = [
+            asyncio.create_task(self._worker(self.queues[i % len(self.queues)]))
+            for i in range(self.workers)
+        ]
+        self.logger.info(
+            f"Пайплайн {self.pipeline_name}: {self.workers} воркеров, "
+            f"упорядочивание: {self.ordering_key or 'нет'}"
+        )
+
+    async def put(self, message):
+        """Постановка сообщения в очередь; при заполнении ожидает (обратное давление на чтение)"""
+        if self.ordering_key:
+            key = ORDERING_KEYS[self.ordering_key](message)
+            queue = self.queues[hash(key) % len(self.queues)]
+        else:
+            queue = self.queues[0]
+
+        self.tracker.add(message.id)
+        await queue.put(message)
+
+    def skip(self, message_id: int):
+        """Учет сообщения, отклоненного до очереди: контрольная точка сдвигается и через него"""
+        self.tracker.add(message_id)
+        watermark = self.tracker.done(message_id)
+        if self.on_progress:
+            self.on_progress(watermark)
+
+    async def _worker(self, queue: asyncio.Queue):
+        """Воркер: обработка сообщений своей очереди; накопившиеся сообщения забираются пачкой"""
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            written = None
+            try:
+                if len(batch) > 1:
+                    written = await self.batch_handler(batch)
+                else:
+                    written = await self.handler(batch[0])
+            except Exception as e:
+                self.logger.error(f"Ошибка воркера пайплайна {self.pipeline_name}: {e}")
+            finally:
+                for message in batch:
+                    queue.task_done()
+
+            message_ids = [message.id for message in batch]
+            if inspect.isawaitable(written):
+                future = asyncio.ensure_future(written)
+                self.writes.add(future)
+                future.add_done_callback(lambda done, ids=message_ids: self._written(ids, done))
+            else:
+                self._complete(message_ids)
+
+    def _written(self, message_ids: List[int], future: asyncio.Future):
+        self.writes.discard(future)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Ошибка записи результатов пайплайна {self.pipeline_name}: {future.exception()}")
+        self._complete(message_ids)
+
+    def _complete(self, message_ids: List[int]):
+        for message_id in message_ids:
+            watermark = self.tracker.done(message_id)
+        if self.on_progress:
+            self.on_progress(watermark)
+
+    async def wait_written(self, timeout: float) -> bool:
+        """Ожидание записи результатов уже обработанных сообщений; False - не дождались"""
+        if not self.writes:
+            return True
+        _, pending = await asyncio.wait(set(self.writes), timeout=timeout)
+        return not pending
+
+    async def drain(self, timeout: float) -> bool:
+        """Дообработка очередей в пределах timeout и остановка воркеров"""
+        drained = True
+        if self.is_running:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+            except asyncio.TimeoutError:
+                drained = False
+
+        await self.stop()
+        return drained
+
+    async def stop(self):
+        """Немедленная остановка воркеров"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
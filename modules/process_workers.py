@@ -0,0 +1,424 @@
+"""
+Многопроцессная обработка пайплайнов: супервизор с подключением к Telegram и процессы-воркеры
+"""
+
+import os
+import pickle
+import socket
+import struct
+import asyncio
+import logging
+import itertools
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+from .rate_limiter import RateLimiter
+from .engagement import message_counts
+from .message_record import MessageRecord, has_media, is_forwarded
+from .image_hashing import inline_thumbnail, media_thumbs
+
+# Кадр: 4 байта длины (big-endian) и pickle-представление кортежа
+FRAME_HEADER = struct.Struct('>I')
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[tuple]:
+    """Чтение одного кадра; None при закрытии соединения"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        payload = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return pickle.loads(payload)
+
+def write_frame(writer: asyncio.StreamWriter, frame: tuple):
+    """Запись одного кадра в буфер соединения"""
+    payload = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+class MessageSnapshot:
+    """Сериализуемый снимок сообщения Telethon для передачи между процессами"""
+
+    __slots__ = ('id', 'text', 'sender_id', 'date', 'chat_id', 'reply_to_msg_id', 'reply_to_top_id',
+                 'views', 'forwards', 'reaction_count', 'reply_count', 'forwarded', 'has_media',
+                 'inline_thumb', 'flags', 'fields')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_message(cls, message) -> 'MessageSnapshot':
+        # Запись источника передает уже извлеченные поля и флаги разбора
+        flags = fields = None
+        if isinstance(message, MessageRecord):
+            flags, fields = message.flags, message.extracted()
+            message = message.raw
+        reply_to = getattr(message, 'reply_to', None)
+        counts = message_counts(message)
+        return cls(
+            id=message.id,
+            text=message.text,
+            sender_id=message.sender_id,
+            date=message.date,
+            chat_id=message.chat_id,
+            reply_to_msg_id=getattr(message, 'reply_to_msg_id', None),
+            reply_to_top_id=getattr(reply_to, 'reply_to_top_id', None) if reply_to else None,
+            views=counts['views'],
+            forwards=counts['forwards'],
+            reaction_count=counts['reactions'],
+            reply_count=counts['replies'],
+            # Признаки для шагов, которые в процессе читают их из сообщения Telethon
+            forwarded=is_forwarded(message),
+            has_media=has_media(message),
+            # Миниатюра из самого сообщения: по ней шаг image_dedup сравнивает изображения в воркере
+            inline_thumb=inline_thumbnail(media_thumbs(message)),
+            flags=flags,
+            fields=fields,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_message(self):
+        """Сообщение для обработки в воркере: запись с полями из супервизора или сам снимок"""
+        if self.fields is None:
+            return self
+        return MessageRecord(self, self.flags, self.fields)
+
+class RemoteClient:
+    """Клиент процесса-воркера: запросы к Telegram выполняет супервизор"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.request_ids = itertools.count(1)
+
+    async def _request(self, method: str, *args, **kwargs) -> Any:
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        write_frame(self.writer, ('call', request_id, method, args, kwargs))
+        await self.writer.drain()
+        return await future
+
+    def resolve(self, request_id: int, error: Optional[str]):
+        future = self.pending.pop(request_id, None)
+        if future and not future.done():
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(None)
+
+    async def send_message(self, *args, **kwargs):
+        return await self._request('send_message', *args, **kwargs)
+
+class WorkerProcess:
+    """Процесс-воркер глазами супервизора"""
+
+    def __init__(self, index: int, process, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.index = index
+        self.process = process
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        # Ожидание записи результатов сообщений в назначения воркера
+        self.written: Dict[int, asyncio.Future] = {}
+        self.queries: Dict[int, asyncio.Future] = {}
+        self.read_task: Optional[asyncio.Task] = None
+
+class ProcessSupervisor:
+    """Распределение пайплайнов по процессам-воркерам и обмен кадрами через socketpair"""
+
+    # Запросы к Telegram, которые воркеры могут выполнять через супервизор
+    REMOTE_METHODS = {'send_message': 'send'}
+    # Методы PipelineManager воркера, доступные супервизору: состояние шагов и компиляция плана
+    QUERY_METHODS = {'trends', 'engagement', 'compile_pipeline'}
+
+    def __init__(self, processes: int, client, rate_limiter: RateLimiter,
+                 config_path: str = "./config", data_path: str = "./data", monitor=None):
+        self.processes = max(1, processes)
+        self.client = client
+        self.rate_limiter = rate_limiter
+        # Мониторинг основного процесса получает уведомления воркеров (события шагов, ошибки)
+        self.monitor = monitor
+        self.config_path = config_path
+        self.data_path = data_path
+        self.workers: List[WorkerProcess] = []
+        self.assignments: Dict[str, int] = {}
+        self.request_ids = itertools.count(1)
+        self.stopping = False
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self):
+        """Запуск процессов-воркеров"""
+        context = multiprocessing.get_context('spawn')
+        for index in range(self.processes):
+            parent_sock, child_sock = socket.socketpair()
+            process = context.Process(
+                target=worker_main,
+                args=(child_sock, self.config_path, self.data_path),
+                name=f"pipeline-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            child_sock.close()
+
+            reader, writer = await asyncio.open_connection(sock=parent_sock)
+            worker = WorkerProcess(index, process, reader, writer)
+            worker.read_task = asyncio.create_task(self._read_loop(worker))
+            self.workers.append(worker)
+
+        self.logger.info(f"Запущено {len(self.workers)} процессов-воркеров")
+
+    def _worker_for(self, pipeline_name: str) -> WorkerProcess:
+        """Закрепление пайплайна за воркером по кругу"""
+        if pipeline_name not in self.assignments:
+            self.assignments[pipeline_name] = len(self.assignments) % len(self.workers)
+            self.logger.info(f"Пайплайн {pipeline_name} закреплен за процессом {self.assignments[pipeline_name]}")
+        return self.workers[self.assignments[pipeline_name]]
+
+    async def submit(self, pipeline_name: str, message,
+                     writes: Optional[List[asyncio.Future]] = None) -> Dict[str, Any]:
+        """Передача сообщения воркеру и ожидание статистики обработки
+
+        В writes добавляется future, который завершается после записи результата
+        в назначения воркера.
+        """
+        worker = self._worker_for(pipeline_name)
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        written = asyncio.get_running_loop().create_future()
+        worker.written[request_id] = written
+        if writes is not None:
+            writes.append(written)
+
+        snapshot = MessageSnapshot.from_message(message).to_dict()
+        write_frame(worker.writer, ('message', request_id, pipeline_name, snapshot))
+        await worker.writer.drain()
+        return await future
+
+    async def reload_config(self):
+        """Перечитывание конфигурации пайплайнов во всех воркерах"""
+        for worker in self.workers:
+            write_frame(worker.writer, ('reload',))
+            await worker.writer.drain()
+
+    async def close_pipeline(self, pipeline_name: str):
+        """Сохранение состояния шагов пайплайна в его воркере"""
+        if pipeline_name in self.assignments and self.workers:
+            worker = self.workers[self.assignments[pipeline_name]]
+            write_frame(worker.writer, ('close', pipeline_name))
+            await worker.writer.drain()
+
+    async def compile_pipeline(self, pipeline_name: str) -> Optional[str]:
+        """Компиляция шагов пайплайна в его воркере; возвращает ошибку конфигурации или None"""
+        self._worker_for(pipeline_name)
+        return await self.query(pipeline_name, 'compile_pipeline')
+
+    async def query(self, pipeline_name: str, method: str, *args) -> Any:
+        """Запрос состояния шагов пайплайна у его воркера; None - пайплайн не обрабатывался"""
+        if method not in self.QUERY_METHODS:
+            raise ValueError(f"Метод {method} недоступен для запроса")
+        if pipeline_name not in self.assignments or not self.workers:
+            return None
+
+        worker = self.workers[self.assignments[pipeline_name]]
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.queries[request_id] = future
+        write_frame(worker.writer, ('query', request_id, pipeline_name, method, args))
+        await worker.writer.drain()
+        return await future
+
+    async def _read_loop(self, worker: WorkerProcess):
+        """Обработка кадров от воркера: результаты и запросы к Telegram"""
+        while True:
+            frame = await read_frame(worker.reader)
+            if frame is None:
+                break
+
+            if frame[0] == 'done':
+                _, request_id, result = frame
+                future = worker.pending.pop(request_id, None)
+                if future and not future.done():
+                    future.set_result(result)
+
+            elif frame[0] == 'written':
+                future = worker.written.pop(frame[1], None)
+                if future and not future.done():
+                    future.set_result(True)
+
+            elif frame[0] == 'result':
+                _, request_id, result = frame
+                future = worker.queries.pop(request_id, None)
+                if future and not future.done():
+                    future.set_result(result)
+
+            elif frame[0] == 'call':
+                asyncio.create_task(self._remote_call(worker, *frame[1:]))
+
+            elif frame[0] == 'alert':
+                alert = frame[1]
+                if self.monitor:
+                    await self.monitor.send_alert(alert['type'], alert['message'], alert['pipeline_name'])
+
+        # Воркер завершился: ожидающие сообщения считаются ошибками
+        if not self.stopping:
+            self.logger.warning(f"Соединение с процессом-воркером {worker.index} закрыто")
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_result({'processed': 0, 'errors': 1, 'processing_time': 0})
+        worker.pending.clear()
+        # Результаты в буферах воркера потеряны: граница контрольной точки на них останавливается
+        for future in worker.written.values():
+            future.cancel()
+        worker.written.clear()
+        for future in worker.queries.values():
+            if not future.done():
+                future.set_result(None)
+        worker.queries.clear()
+
+    async def _remote_call(self, worker: WorkerProcess, request_id: int, method: str, args: tuple, kwargs: dict):
+        """Выполнение запроса воркера через общий ограничитель"""
+        error = None
+        try:
+            if method not in self.REMOTE_METHODS:
+                raise ValueError(f"Метод {method} недоступен воркерам")
+            await self.rate_limiter.call(self.REMOTE_METHODS[method], getattr(self.client, method), *args, **kwargs)
+        except Exception as e:
+            error = str(e)
+        write_frame(worker.writer, ('reply', request_id, error))
+        await worker.writer.drain()
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка процессов-воркеров"""
+        self.stopping = True
+        for worker in self.workers:
+            try:
+                write_frame(worker.writer, ('stop',))
+                await worker.writer.drain()
+            except Exception:
+                pass
+
+        for worker in self.workers:
+            await asyncio.to_thread(worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.writer.close()
+            if worker.read_task:
+                worker.read_task.cancel()
+
+        self.logger.info("Процессы-воркеры остановлены")
+        self.workers = []
+
+def worker_main(sock: socket.socket, config_path: str, data_path: str):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{os.getpid()} - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_worker_loop(sock, config_path, data_path))
+
+async def _worker_loop(sock: socket.socket, config_path: str, data_path: str):
+    """Цикл процесса-воркера: обработка сообщений своих пайплайнов"""
+    from .pipeline_manager import PipelineManager
+
+    reader, writer = await asyncio.open_connection(sock=sock)
+    remote_client = RemoteClient(writer)
+    # Лимиты соблюдает супервизор, в воркере ограничения не нужны
+    unlimited = RateLimiter({request_type: (1000.0, 1000) for request_type in RateLimiter.DEFAULT_LIMITS})
+    manager = PipelineManager(remote_client, config_path, data_path, rate_limiter=unlimited, in_worker=True)
+    # Уведомления шагов и ошибок воркера видит мониторинг основного процесса
+    manager.monitor.on_alert = lambda alert: write_frame(writer, ('alert', alert))
+    tasks = set()
+    # Сообщения, которые сейчас проходят шаги: перезагрузка ждет их завершения
+    executing = 0
+    idle = asyncio.Event()
+    idle.set()
+    ready = asyncio.Event()
+    ready.set()
+
+    async def handle(request_id: int, pipeline_name: str, snapshot: Dict[str, Any]):
+        nonlocal executing
+        await ready.wait()
+        executing += 1
+        idle.clear()
+        writes: List[asyncio.Future] = []
+        try:
+            result = await manager.execute_message(pipeline_name, MessageSnapshot(**snapshot).to_message(), writes)
+        finally:
+            executing -= 1
+            if not executing:
+                idle.set()
+        write_frame(writer, ('done', request_id, result))
+        await writer.drain()
+        # Отдельный кадр после записи пачек: супервизор сдвигает контрольную точку только по нему
+        await asyncio.gather(*writes)
+        write_frame(writer, ('written', request_id))
+        await writer.drain()
+
+    async def reload():
+        # Планы пересобираются после сообщений, уже проходящих шаги; новые ждут перезагрузки
+        ready.clear()
+        await idle.wait()
+        manager.load_config()
+        ready.set()
+
+    async def shutdown():
+        # Пачки назначений дописываются, пока цикл отвечает на вызовы клиента супервизора
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await manager.close_writers()
+        reader.feed_eof()
+
+    stopping = None
+    while True:
+        frame = await read_frame(reader)
+        if frame is None:
+            break
+
+        if frame[0] == 'stop':
+            if stopping is None:
+                stopping = asyncio.create_task(shutdown())
+
+        elif frame[0] == 'message':
+            task = asyncio.create_task(handle(*frame[1:]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        elif frame[0] == 'reply':
+            remote_client.resolve(*frame[1:])
+
+        elif frame[0] == 'reload':
+            task = asyncio.create_task(reload())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        elif frame[0] == 'close':
+            manager._close_plan(frame[1])
+            task = asyncio.create_task(manager.flush_destinations(frame[1]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        elif frame[0] == 'query':
+            _, request_id, pipeline_name, method, args = frame
+            try:
+                result = getattr(manager, method)(pipeline_name, *args) if method in ProcessSupervisor.QUERY_METHODS else None
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Ошибка запроса {method} пайплайна {pipeline_name}: {e}")
+                result = None
+            write_frame(writer, ('result', request_id, result))
+            await writer.drain()
+
+    if stopping is not None:
+        await stopping
+    else:
+        # Соединение с супервизором потеряно: отправка в Telegram невозможна, остальные назначения дописываются
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.wait_for(manager.close_writers(), 30)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Ошибка записи пачек назначений: {e}")
+    manager.close_plans()
+    writer.close()
@@ -0,0 +1,666 @@
+"""
+Реестр шагов обработки: компиляция processing_steps пайплайна в готовую цепочку функций
+"""
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from datetime import datetime
+from pathlib import Path
+
+from .keyword_matcher import SharedKeywordMatcher
+from .deduplication import DedupStore, message_fingerprint
+from .near_duplicates import SimHashIndex, simhash
+from .quality_scoring import QualityModel, extract_features
+from .nlp_analysis import ANALYSES, get_analyzer_pool, load_lexicon
+from .language_detection import SourceLanguageCache, get_language_detector
+from .trend_detection import TrendTracker, extract_terms
+from .response_tracker import ResponseTracker
+from .engagement import EngagementTracker
+from .media_downloader import MB, get_media_downloader
+from .message_record import has_media
+from .image_hashing import HASH_BITS, Image, dhash, get_image_index, inline_thumbnail, media_thumbs, smallest_thumbnail
+
+logger = logging.getLogger(__name__)
+
+StepResult = Optional[Dict[str, Any]]
+EventHandler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+StepFunc = Callable[[Dict[str, Any], 'StepContext'], Union[StepResult, Awaitable[StepResult]]]
+BatchFunc = Callable[[List[Tuple[Dict[str, Any], 'StepContext']]], Union[List[StepResult], Awaitable[List[StepResult]]]]
+
+class StepContext:
+    """Контекст обработки одного сообщения: исходное сообщение и общие данные шагов"""
+
+    __slots__ = ('message', 'pipeline_name', 'source_name', 'cache', 'finalizers')
+
+    def __init__(self, message, pipeline_name: str, source_name: str):
+        self.message = message
+        self.pipeline_name = pipeline_name
+        self.source_name = source_name
+        # Промежуточные результаты, которые шаги передают друг другу
+        self.cache: Dict[str, Any] = {}
+        self.finalizers: List[Callable[[], None]] = []
+
+    def on_finish(self, callback: Callable[[], None]):
+        """Вызов callback после прохода сообщения по всем шагам (например, освобождение файла)"""
+        self.finalizers.append(callback)
+
+    def finish(self):
+        for callback in self.finalizers:
+            callback()
+        self.finalizers.clear()
+
+class CompiledStep:
+    """Шаг обработки с заранее разобранной конфигурацией
+
+    func возвращает данные сообщения или None, если сообщение отфильтровано.
+    batch (необязательно) обрабатывает список сообщений за один вызов.
+    """
+
+    def __init__(self, name: Optional[str], step_type: str, func: StepFunc, batch: Optional[BatchFunc] = None):
+        self.name = name
+        self.type = step_type
+        self.func = func
+        self.batch = batch
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.batch_is_async = inspect.iscoroutinefunction(batch) if batch else False
+
+class PlanBuilder:
+    """Состояние компиляции пайплайна, общее для всех его шагов"""
+
+    def __init__(self, pipeline_name: str, data_path: str = "./data", config_path: str = "./config",
+                 in_worker: bool = False):
+        self.pipeline_name = pipeline_name
+        self.data_path = Path(data_path)
+        self.config_path = Path(config_path)
+        # План выполняется в процессе-воркере: сообщения - снимки без клиента Telegram
+        self.in_worker = in_worker
+        self.step_name = ''
+        # Ключевые слова всех шагов ищутся одним автоматом за один проход по тексту
+        self.matcher = SharedKeywordMatcher()
+        # Состояние шагов, которое нужно сохранять (метод flush, при наличии - close)
+        self.resources: List[Any] = []
+        # Обработчики событий шагов, не связанных с текущим сообщением (например, таймаутов)
+        self.event_handlers: List[EventHandler] = []
+        self.pending_events: Set[asyncio.Task] = set()
+
+    def resource_path(self, kind: str, suffix: str = '.json') -> Path:
+        """Путь к файлу состояния шага пайплайна"""
+        return self.data_path / kind / f"{self.pipeline_name}_{self.step_name}{suffix}"
+
+    def add_resource(self, resource: Any) -> Any:
+        """Регистрация состояния шага для сохранения при остановке пайплайна"""
+        self.resources.append(resource)
+        return resource
+
+    def emit(self, event: Dict[str, Any]):
+        """Передача события шага обработчикам плана"""
+        event.setdefault('pipeline', self.pipeline_name)
+        event.setdefault('step', self.step_name)
+        for handler in self.event_handlers:
+            result = handler(event)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self.pending_events.add(task)
+                task.add_done_callback(self.pending_events.discard)
+
+    def keyword_group(self, config: Dict[str, Any], key: str) -> Optional[str]:
+        """Регистрация списка ключевых слов шага; возвращает имя группы или None, если список пуст"""
+        keywords = config.get(key) or []
+        if isinstance(keywords, str) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError(f"{key} должен быть списком строк")
+        if not keywords:
+            return None
+
+        group = f"{self.step_name}:{key}"
+        self.matcher.add_group(
+            group, keywords,
+            whole_words=bool(config.get('whole_words', False)),
+            case_sensitive=bool(config.get('case_sensitive', False)),
+            fold_yo=bool(config.get('fold_yo', True))
+        )
+        return group
+
+    def keyword_hits(self, data: Dict[str, Any], ctx: 'StepContext') -> Dict[str, Set[str]]:
+        """Найденные ключевые слова текста; результат кешируется в контексте сообщения"""
+        text = data.get('text', '')
+        cached = ctx.cache.get('keyword_hits')
+        if cached is None or cached[0] != text:
+            cached = (text, self.matcher.find(text))
+            ctx.cache['keyword_hits'] = cached
+        return cached[1]
+
+# Тип шага -> функция компиляции: (config, builder) -> CompiledStep или список шагов
+StepCompiler = Callable[[Dict[str, Any], PlanBuilder], Union[CompiledStep, List[CompiledStep]]]
+
+STEP_REGISTRY: Dict[str, StepCompiler] = {}
+
+def register_step(step_type: str):
+    """Регистрация компилятора для типа шага"""
+    def decorator(compiler: StepCompiler) -> StepCompiler:
+        STEP_REGISTRY[step_type] = compiler
+        return compiler
+    return decorator
+
+class ExecutionPlan:
+    """Скомпилированная цепочка шагов пайплайна"""
+
+    def __init__(self, pipeline_name: str, steps: List[CompiledStep], resources: Optional[List[Any]] = None,
+                 event_handlers: Optional[List[EventHandler]] = None):
+        self.pipeline_name = pipeline_name
+        self.steps = steps
+        self.resources = resources or []
+        self.event_handlers = event_handlers if event_handlers is not None else []
+
+    def on_event(self, handler: EventHandler):
+        """Подписка на события шагов (например, вопрос без ответа)"""
+        self.event_handlers.append(handler)
+
+    def close(self):
+        """Сохранение состояния шагов и остановка их фоновых задач"""
+        for resource in self.resources:
+            getattr(resource, 'close', resource.flush)()
+
+    async def run(self, data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        """Прогон одного сообщения через цепочку; None - сообщение отфильтровано"""
+        try:
+            for step in self.steps:
+                data = await step.func(data, ctx) if step.is_async else step.func(data, ctx)
+                if data is None:
+                    return None
+            return data
+        finally:
+            ctx.finish()
+
+    async def run_batch(self, items: List[Tuple[Dict[str, Any], StepContext]]) -> List[StepResult]:
+        """Прогон пачки сообщений: шаги с пакетной обработкой получают всю пачку сразу"""
+        results: List[StepResult] = [data for data, _ in items]
+        alive = list(range(len(items)))
+
+        try:
+            for step in self.steps:
+                if not alive:
+                    break
+
+                if step.batch:
+                    batch_items = [(results[i], items[i][1]) for i in alive]
+                    outputs = await step.batch(batch_items) if step.batch_is_async else step.batch(batch_items)
+                else:
+                    outputs = []
+                    for i in alive:
+                        output = step.func(results[i], items[i][1])
+                        outputs.append(await output if step.is_async else output)
+
+                for i, output in zip(alive, outputs):
+                    results[i] = output
+                alive = [i for i in alive if results[i] is not None]
+        finally:
+            for _, ctx in items:
+                ctx.finish()
+
+        return results
+
+def compile_steps(pipeline_name: str, processing_steps: List[Dict[str, Any]],
+                  data_path: str = "./data", config_path: str = "./config", in_worker: bool = False) -> ExecutionPlan:
+    """Компиляция processing_steps пайплайна; ошибки конфигурации вызывают ValueError"""
+    builder = PlanBuilder(pipeline_name, data_path, config_path, in_worker)
+    steps: List[CompiledStep] = []
+
+    for index, step in enumerate(processing_steps):
+        step_type = step.get('type')
+        step_name = step.get('name') or f"{step_type}_{index}"
+        compiler = STEP_REGISTRY.get(step_type)
+
+        if compiler is None:
+            logger.warning(f"Пайплайн {pipeline_name}: неизвестный тип шага {step_type} ({step_name}), шаг пропущен")
+            continue
+
+        builder.step_name = step_name
+        try:
+            compiled = compiler(step.get('config') or {}, builder)
+        except (TypeError, ValueError, KeyError, OSError) as e:
+            raise ValueError(f"шаг {step_name} ({step_type}): {e}") from e
+
+        for compiled_step in compiled if isinstance(compiled, list) else [compiled]:
+            compiled_step.name = compiled_step.name or step_name
+            steps.append(compiled_step)
+
+    builder.matcher.build()
+    return ExecutionPlan(pipeline_name, steps, builder.resources, builder.event_handlers)
+
+@register_step('filter')
+def compile_filter(config: Dict[str, Any], builder: PlanBuilder) -> List[CompiledStep]:
+    """Фильтр по ключевым словам, исключающим словам и длине; дополнительные проверки - отдельными шагами"""
+    keywords_group = builder.keyword_group(config, 'keywords')
+    exclude_group = builder.keyword_group(config, 'exclude_keywords')
+    min_length = int(config.get('min_length', 0))
+
+    def apply_filter(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        hits = builder.keyword_hits(data, ctx)
+
+        # Фильтр по ключевым словам
+        if keywords_group and keywords_group not in hits:
+            return None
+
+        # Фильтр по исключающим словам
+        if exclude_group and exclude_group in hits:
+            return None
+
+        # Фильтр по длине
+        if len(data.get('text', '')) < min_length:
+            return None
+
+        return data
+
+    steps = [CompiledStep(None, 'filter', apply_filter)]
+    if config.get('remove_duplicates'):
+        steps.append(compile_dedup(config, builder))
+    if config.get('spam_detection') or config.get('quality_score') is not None:
+        steps.append(compile_quality(config, builder))
+    return steps
+
+def compile_dedup(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Отбрасывание повторов: тот же нормализованный текст и те же медиа"""
+    store = builder.add_resource(DedupStore(
+        str(builder.resource_path('dedup')),
+        max_entries=int(config.get('dedup_max_entries', 100000)),
+        ttl=float(config.get('dedup_ttl', 7 * 24 * 3600)),
+        use_bloom=bool(config.get('dedup_bloom', True)),
+        bloom_capacity=int(config.get('dedup_bloom_capacity', 1000000)),
+    ))
+
+    def apply_dedup(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        key = message_fingerprint(data.get('text', ''), data.get('media'))
+        if key is not None and store.check_and_add(key, f"{ctx.source_name}:{data.get('message_id')}"):
+            return None
+        return data
+
+    return CompiledStep(f"{builder.step_name}:dedup", 'dedup', apply_dedup)
+
+@register_step('quality')
+def compile_quality(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Оценка спама и качества линейной моделью; пачка сообщений оценивается одним умножением матриц"""
+    model = QualityModel.load(config.get('model_path') or str(builder.config_path / 'quality_model.json'))
+    spam_detection = bool(config.get('spam_detection'))
+    spam_threshold = float(config.get('spam_threshold', 0.5))
+    min_quality = config.get('quality_score')
+    min_quality = float(min_quality) if min_quality is not None else None
+
+    def decide(data: Dict[str, Any], spam: float, quality: float) -> StepResult:
+        data['spam_score'] = round(float(spam), 3)
+        data['quality_score'] = round(float(quality), 3)
+        if spam_detection and spam >= spam_threshold:
+            return None
+        if min_quality is not None and quality < min_quality:
+            return None
+        return data
+
+    def apply_quality(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        spam, quality = model.score([extract_features(data.get('text', ''), ctx.message)])[0]
+        return decide(data, spam, quality)
+
+    def apply_quality_batch(items: List[Tuple[Dict[str, Any], StepContext]]) -> List[StepResult]:
+        scores = model.score([extract_features(data.get('text', ''), ctx.message) for data, ctx in items])
+        return [decide(data, spam, quality) for (data, _), (spam, quality) in zip(items, scores.tolist())]
+
+    return CompiledStep(f"{builder.step_name}:quality", 'quality', apply_quality, apply_quality_batch)
+
+# Опции анализатора, которые выполняются отдельными шагами
+STEP_OPTIONS = {'identify_trends', 'measure_engagement', 'track_discussions'}
+
+@register_step('nlp')
+@register_step('analyzer')
+def compile_analyzer(config: Dict[str, Any], builder: PlanBuilder) -> List[CompiledStep]:
+    """Анализ текста: сущности, тональность, ключевые слова в пуле процессов, язык - на месте"""
+    analyses = {ANALYSES[option] for option in ANALYSES if config.get(option)}
+    unsupported = [
+        option for option, enabled in config.items()
+        if enabled is True and option not in ANALYSES and option not in STEP_OPTIONS
+    ]
+    if unsupported:
+        logger.warning(
+            f"Пайплайн {builder.pipeline_name}, шаг {builder.step_name}: "
+            f"опции не поддерживаются: {', '.join(unsupported)}"
+        )
+    steps = []
+    if config.get('identify_trends'):
+        steps.append(compile_trends(config, builder))
+    if config.get('measure_engagement') or config.get('track_discussions'):
+        # В анализаторе учитываются только явно включенные опции
+        steps.append(compile_engagement(dict(
+            config,
+            measure_engagement=bool(config.get('measure_engagement')),
+            track_discussions=bool(config.get('track_discussions'))
+        ), builder))
+    if not analyses:
+        return steps
+
+    languages = None
+    if 'language' in analyses:
+        analyses.discard('language')
+        detector = get_language_detector(
+            config.get('language_profiles') or str(builder.config_path / 'language_profiles.json')
+        )
+        languages = SourceLanguageCache(
+            stable_after=int(config.get('language_stable_after', 20)),
+            recheck_every=int(config.get('language_recheck', 100))
+        )
+
+    pool = None
+    if analyses:
+        pool = get_analyzer_pool(
+            config.get('lexicon_path') or str(builder.config_path / 'nlp_lexicon.json'),
+            int(config.get('processes', 2))
+        )
+    pool_analyses = tuple(sorted(analyses))
+    keyword_limit = int(config.get('keyword_limit', 10))
+
+    async def apply_analyzer_batch(items: List[Tuple[Dict[str, Any], StepContext]]) -> List[StepResult]:
+        if pool is not None:
+            results = await pool.analyze([data.get('text', '') for data, _ in items], pool_analyses, keyword_limit)
+            for (data, _), result in zip(items, results):
+                data.update(result)
+        if languages is not None:
+            for data, ctx in items:
+                data['language'] = languages.detect(ctx.source_name, data.get('text', ''), detector)
+        return [data for data, _ in items]
+
+    async def apply_analyzer(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        return (await apply_analyzer_batch([(data, ctx)]))[0]
+
+    return [CompiledStep(None, 'analyzer', apply_analyzer, apply_analyzer_batch)] + steps
+
+@register_step('trends')
+def compile_trends(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Тренды источника: всплески слов и хештегов в текущем окне относительно базового уровня"""
+    tracker = builder.add_resource(TrendTracker(
+        str(builder.resource_path('trends')),
+        bucket_seconds=float(config.get('trend_bucket', 300)),
+        window=float(config.get('trend_window', 3600)),
+        baseline=float(config.get('trend_baseline', 24 * 3600)),
+        min_count=int(config.get('trend_min_count', 3)),
+    ))
+    stopwords = load_lexicon(config.get('lexicon_path') or str(builder.config_path / 'nlp_lexicon.json'))['stopwords']
+    top_k = int(config.get('trend_top_k', 10))
+    burst_threshold = float(config.get('trend_threshold', 3.0))
+
+    def apply_trends(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        terms = extract_terms(data.get('text', ''), stopwords)
+        date = getattr(ctx.message, 'date', None)
+        window = tracker.add(ctx.source_name, terms, date.timestamp() if date else None)
+        data['trending_terms'] = window.trending(terms, burst_threshold)
+        data['trends'] = window.top(top_k)
+        return data
+
+    return CompiledStep(f"{builder.step_name}:trends", 'trends', apply_trends)
+
+@register_step('near_dedup')
+def compile_near_dedup(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Почти повторы: SimHash текста и поиск похожих сообщений за скользящее окно"""
+    threshold = float(config.get('threshold', 0.9))
+    if not 0.5 <= threshold <= 1:
+        raise ValueError("threshold должен быть от 0.5 до 1")
+    action = config.get('action', 'drop')
+    if action not in ('drop', 'flag'):
+        raise ValueError("action должен быть drop или flag")
+    min_tokens = int(config.get('min_tokens', 5))
+    index = SimHashIndex(
+        threshold=threshold,
+        window=float(config.get('window', 24 * 3600)),
+        max_entries=int(config.get('max_entries', 50000))
+    )
+
+    def apply_near_dedup(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        value = simhash(data.get('text', ''), min_tokens)
+        if value is None:
+            return data
+
+        match = index.find(value)
+        if match is not None:
+            if action == 'drop':
+                return None
+            data['near_duplicate_of'] = {'message_id': match[0], 'similarity': round(match[1], 3)}
+
+        date = getattr(ctx.message, 'date', None)
+        index.add(value, data.get('message_id'), date.timestamp() if date else None)
+        return data
+
+    return CompiledStep(None, 'near_dedup', apply_near_dedup)
+
+@register_step('formatter')
+def compile_formatter(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Форматирование: метки времени, информация об источнике, нормализация текста"""
+    add_timestamps = bool(config.get('add_timestamps'))
+    add_source_info = bool(config.get('add_source_info'))
+    normalize_text = bool(config.get('normalize_text'))
+
+    def apply_formatter(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        if add_timestamps:
+            data['processed_at'] = datetime.now().isoformat()
+
+        if add_source_info:
+            data['source_info'] = {
+                'pipeline': data.get('pipeline'),
+                'source': data.get('source')
+            }
+
+        if normalize_text:
+            data['text'] = data.get('text', '').strip()
+
+        return data
+
+    return CompiledStep(None, 'formatter', apply_formatter)
+
+@register_step('classifier')
+def compile_classifier(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Классификация срочности по количеству ключевых слов и отметка технических тем"""
+    urgency_group = builder.keyword_group(config, 'urgency_keywords')
+    has_urgency = 'urgency_keywords' in config
+    tech_group = builder.keyword_group(config, 'tech_keywords')
+    priority_levels = list(config.get('priority_levels', ['low', 'medium', 'high', 'critical']))
+    if has_urgency and len(priority_levels) < 4:
+        raise ValueError("priority_levels должен содержать 4 уровня")
+
+    def apply_classifier(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        hits = builder.keyword_hits(data, ctx)
+        if has_urgency:
+            urgency_count = len(hits.get(urgency_group, ()))
+            data['priority'] = priority_levels[min(urgency_count, 3)]
+        if tech_group:
+            data['tech_keywords'] = sorted(hits.get(tech_group, ()))
+        return data
+
+    return CompiledStep(None, 'classifier', apply_classifier)
+
+@register_step('enricher')
+def compile_enricher(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Обогащение: метаданные сообщения, метки времени и сведения об обработке"""
+    add_metadata = bool(config.get('add_metadata'))
+    add_timestamps = bool(config.get('add_timestamps'))
+    add_source_info = bool(config.get('add_source_info'))
+    add_processing_info = bool(config.get('add_processing_info'))
+
+    def apply_enricher(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        message = ctx.message
+        if add_metadata:
+            data['metadata'] = {
+                'chat_id': getattr(message, 'chat_id', None),
+                'reply_to_msg_id': getattr(message, 'reply_to_msg_id', None),
+                'has_media': has_media(message),
+                'length': len(data.get('text', '')),
+            }
+
+        if add_timestamps:
+            data['processed_at'] = datetime.now().isoformat()
+
+        if add_source_info:
+            data['source_info'] = {
+                'pipeline': data.get('pipeline'),
+                'source': data.get('source')
+            }
+
+        if add_processing_info:
+            data['processing_info'] = {
+                'pipeline': ctx.pipeline_name,
+                'enriched_at': datetime.now().isoformat(),
+            }
+
+        return data
+
+    return CompiledStep(None, 'enricher', apply_enricher)
+
+@register_step('engagement')
+def compile_engagement(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Вовлеченность и граф обсуждений источника со сводками по окнам"""
+    tracker = builder.add_resource(EngagementTracker(
+        str(builder.resource_path('engagement')),
+        window=float(config.get('engagement_window', 3600)),
+        windows=int(config.get('engagement_windows', 24)),
+        max_messages=int(config.get('engagement_max_messages', 200000)),
+        max_age=float(config.get('engagement_max_age', 7 * 24 * 3600)),
+        measure_engagement=bool(config.get('measure_engagement', True)),
+        track_discussions=bool(config.get('track_discussions', True)),
+    ))
+
+    def apply_engagement(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        data.update(tracker.observe(ctx.message))
+        return data
+
+    return CompiledStep(f"{builder.step_name}:engagement", 'engagement', apply_engagement)
+
+@register_step('tracker')
+def compile_tracker(config: Dict[str, Any], builder: PlanBuilder) -> List[CompiledStep]:
+    """Отслеживание ответов: вопросы, ответы через reply_to и события об ответе, не полученном за response_timeout"""
+    if not config.get('track_responses', True):
+        return []
+    timeout = float(config.get('response_timeout', 3600))
+    if timeout <= 0:
+        raise ValueError("response_timeout должен быть больше 0")
+
+    tracker = builder.add_resource(ResponseTracker(
+        str(builder.resource_path('tracker')),
+        timeout=timeout,
+        questions_only=bool(config.get('questions_only', False)),
+        max_open=int(config.get('max_open', 500000)),
+        on_timeout=builder.emit,
+    ))
+
+    def apply_tracker(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        data.update(tracker.observe(ctx.message, data.get('text', '')))
+        return data
+
+    return [CompiledStep(None, 'tracker', apply_tracker)]
+
+# Типы медиа шага media: атрибуты сообщения Telethon
+MEDIA_ATTRIBUTES = ('photo', 'document', 'video', 'audio', 'voice', 'video_note', 'gif', 'sticker')
+
+@register_step('media')
+def compile_media(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Загрузка фото и документов в общий кэш медиа с общими лимитами загрузок"""
+    media_types = list(config.get('media_types') or ['photo', 'document'])
+    unknown = [media_type for media_type in media_types if media_type not in MEDIA_ATTRIBUTES]
+    if unknown:
+        raise ValueError(f"Неизвестные типы медиа: {', '.join(unknown)}")
+    max_bytes = int(float(config.get('max_file_mb', 20)) * MB)
+    downloader = get_media_downloader(str(builder.data_path / 'media'))
+    if builder.in_worker:
+        logger.warning(
+            f"Пайплайн {builder.pipeline_name}, шаг {builder.step_name}: в процессе-воркере медиа не загружаются, "
+            f"media_path добавляется только для файлов, уже лежащих в кэше"
+        )
+
+    async def apply_media(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        descriptor = data.get('media')
+        if descriptor is None:
+            return data
+        message = ctx.message
+        # Снимок в процессе-воркере не содержит объектов медиа: проверка по описанию из записи
+        if getattr(message, 'media', None):
+            if not any(getattr(message, media_type, None) for media_type in media_types):
+                return data
+        else:
+            media_type = descriptor.get('type')
+            if media_type not in media_types and (media_type == 'photo' or 'document' not in media_types):
+                return data
+        path = await downloader.fetch(message, descriptor, max_bytes)
+        if path is not None:
+            # Файл не вытесняется из кэша, пока сообщение проходит шаги пайплайна
+            ctx.on_finish(lambda: downloader.release(path))
+            data['media_path'] = path
+        return data
+
+    return CompiledStep(None, 'media', apply_media)
+
+@register_step('image_dedup')
+def compile_image_dedup(config: Dict[str, Any], builder: PlanBuilder) -> CompiledStep:
+    """Похожие изображения: перцептивный хеш самой маленькой миниатюры и поиск по полосам хеша"""
+    max_distance = int(config.get('max_distance', 6))
+    if not 0 <= max_distance <= HASH_BITS // 2:
+        raise ValueError(f"max_distance должен быть от 0 до {HASH_BITS // 2}")
+    action = config.get('action', 'drop')
+    if action not in ('drop', 'flag'):
+        raise ValueError("action должен быть drop или flag")
+    download_thumbs = bool(config.get('download_thumbs', True))
+    # Пайплайны разных источников с одинаковым index ищут повторы среди изображений друг друга
+    index = get_image_index(
+        str(config.get('index') or builder.pipeline_name),
+        max_distance=max_distance,
+        window=float(config.get('window', 24 * 3600)),
+        max_entries=int(config.get('max_entries', 50000))
+    )
+    # Миниатюры загружаются под общими лимитами загрузок медиа
+    downloader = get_media_downloader(str(builder.data_path / 'media'))
+    if Image is None:
+        logger.warning(f"Пайплайн {builder.pipeline_name}, шаг {builder.step_name}: Pillow не установлен, изображения не сравниваются")
+    elif builder.in_worker and download_thumbs:
+        logger.warning(
+            f"Пайплайн {builder.pipeline_name}, шаг {builder.step_name}: в процессе-воркере миниатюры не загружаются, "
+            f"сравниваются только изображения с миниатюрой в самом сообщении"
+        )
+
+    async def image_hash(message) -> Optional[int]:
+        thumbs = media_thumbs(message)
+        if not thumbs:
+            # Снимок сообщения в процессе-воркере: миниатюра извлечена основным процессом
+            image_bytes = getattr(message, 'inline_thumb', None)
+            return dhash(image_bytes) if image_bytes else None
+        image_bytes = inline_thumbnail(thumbs)
+        if image_bytes is None and download_thumbs:
+            thumb = smallest_thumbnail(thumbs)
+            if thumb is None:
+                return None
+            try:
+                image_bytes = await downloader.download_bytes(message, thumb)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки миниатюры сообщения {message.id}: {e}")
+                return None
+        return dhash(image_bytes) if image_bytes else None
+
+    async def apply_image_dedup(data: Dict[str, Any], ctx: StepContext) -> StepResult:
+        if Image is None:
+            return data
+        value = await image_hash(ctx.message)
+        if value is None:
+            return data
+        data['image_hash'] = f"{value:0{HASH_BITS // 4}x}"
+
+        # Повторная обработка того же сообщения (догрузка после перезапуска) - не повтор
+        entry = (data.get('message_id'), ctx.source_name)
+        match = index.find(value, exclude=entry)
+        if match is not None:
+            if action == 'drop':
+                return None
+            (message_id, source), similarity = match
+            data['image_duplicate_of'] = {
+                'message_id': message_id,
+                'source': source,
+                'distance': round((1 - similarity) * HASH_BITS),
+            }
+
+        if entry not in index:
+            date = getattr(ctx.message, 'date', None)
+            index.add(value, entry, date.timestamp() if date else None)
+        return data
+
+    return CompiledStep(None, 'image_dedup', apply_image_dedup)
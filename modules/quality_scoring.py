@@ -0,0 +1,86 @@
+"""
+Оценка спама и качества сообщений: дешевые признаки и линейная модель по пачке сообщений
+"""
+
+import re
+import json
+import math
+import logging
+from typing import Any, Dict, List, Sequence
+from pathlib import Path
+
+import numpy as np
+
+from .message_record import is_forwarded
+
+logger = logging.getLogger(__name__)
+
+# Признаки в порядке столбцов матрицы
+FEATURES = (
+    'link_density',       # ссылок на слово
+    'caps_ratio',         # доля заглавных среди букв
+    'emoji_ratio',        # доля эмодзи среди символов
+    'repetition',         # доля повторяющихся слов
+    'log_length',         # log(1 + длина текста)
+    'forwarded',          # пересланное сообщение
+    'mention_density',    # упоминаний на слово
+    'exclamation_ratio',  # восклицательных знаков на слово
+)
+
+_LINK = re.compile(r'https?://|www\.|t\.me/', re.IGNORECASE)
+_MENTION = re.compile(r'@\w+')
+_EMOJI = re.compile('[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F]')
+
+def extract_features(text: str, message=None) -> List[float]:
+    """Признаки одного сообщения"""
+    words = text.split()
+    word_count = max(1, len(words))
+    letters = sum(map(str.isalpha, text))
+    unique_words = len({word.lower() for word in words})
+
+    return [
+        len(_LINK.findall(text)) / word_count,
+        sum(map(str.isupper, text)) / letters if letters else 0.0,
+        len(_EMOJI.findall(text)) / len(text) if text else 0.0,
+        1 - unique_words / word_count if words else 0.0,
+        math.log1p(len(text)),
+        1.0 if is_forwarded(message) else 0.0,
+        len(_MENTION.findall(text)) / word_count,
+        text.count('!') / word_count,
+    ]
+
+class QualityModel:
+    """Две логистические модели над общими признаками: вероятность спама и оценка качества
+
+    Файл модели (JSON): {"spam": {"bias": b, "weights": {признак: вес}}, "quality": {...}}.
+    Отсутствующие признаки имеют вес 0.
+    """
+
+    OUTPUTS = ('spam', 'quality')
+
+    def __init__(self, model: Dict[str, Any]):
+        unknown = {
+            feature for output in self.OUTPUTS
+            for feature in model.get(output, {}).get('weights', {})
+        } - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Неизвестные признаки модели: {', '.join(sorted(unknown))}")
+
+        # Матрица весов: строка на признак, столбец на выход
+        self.weights = np.array(
+            [[float(model.get(output, {}).get('weights', {}).get(feature, 0.0)) for output in self.OUTPUTS]
+             for feature in FEATURES],
+            dtype=np.float32
+        )
+        self.bias = np.array([float(model.get(output, {}).get('bias', 0.0)) for output in self.OUTPUTS], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str) -> 'QualityModel':
+        """Загрузка модели из файла"""
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def score(self, features: Sequence[Sequence[float]]) -> np.ndarray:
+        """Оценки пачки: массив (n, 2) - вероятность спама и качество"""
+        matrix = np.asarray(features, dtype=np.float32).reshape(-1, len(FEATURES))
+        return 1 / (1 + np.exp(-(matrix @ self.weights + self.bias)))
@@ -0,0 +1,188 @@
+"""
+Общий ограничитель запросов к Telegram с учетом FloodWait
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from telethon.errors import FloodWaitError
+
+class TokenBucket:
+    """Ведро токенов с адаптивной скоростью"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Взятие токена; возвращает время ожидания (0 - токен получен)"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> float:
+        """Списание amount токенов в долг (например, байт); возвращает время, за которое долг погасится"""
+        self._refill(time.monotonic())
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def on_flood(self, seconds: float):
+        """Пауза после FloodWait и снижение скорости вдвое"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.rate = max(self.base_rate / 16, self.rate / 2)
+        self.tokens = 0
+
+    def on_success(self):
+        """Постепенное восстановление скорости после успешных запросов"""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 50)
+
+class RateLimiter:
+    """Ограничитель запросов: отдельное ведро токенов на каждый тип запроса"""
+
+    # Тип запроса: (запросов в секунду, размер запаса)
+    DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+        'history': (2.0, 4),   # iter_messages / get_messages, один токен на страницу
+        'send': (1.0, 3),      # send_message / respond
+        'forward': (1.0, 3),   # forward_messages
+        'entity': (2.0, 5),    # get_entity
+        'download': (10.0, 20),  # iter_download / download_media, один токен на часть файла
+    }
+
+    # Сообщений на одну страницу iter_messages
+    HISTORY_PAGE_SIZE = 100
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None, max_retries: int = 5):
+        self.buckets: Dict[str, TokenBucket] = {
+            request_type: TokenBucket(rate, capacity)
+            for request_type, (rate, capacity) in {**self.DEFAULT_LIMITS, **(limits or {})}.items()
+        }
+        self.max_retries = max_retries
+        self.flood_waits: Dict[str, int] = {request_type: 0 for request_type in self.buckets}
+        self.logger = logging.getLogger(__name__)
+
+    def _bucket(self, request_type: str) -> TokenBucket:
+        if request_type not in self.buckets:
+            raise ValueError(f"Неизвестный тип запроса: {request_type}")
+        return self.buckets[request_type]
+
+    def is_paused(self, request_type: str) -> bool:
+        """Проверка, приостановлен ли тип запроса после FloodWait"""
+        return self._bucket(request_type).paused_until > time.monotonic()
+
+    async def acquire(self, request_type: str):
+        """Ожидание разрешения на один запрос"""
+        bucket = self._bucket(request_type)
+        while True:
+            wait = bucket.reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def report_flood(self, request_type: str, seconds: float):
+        """Учет FloodWait: приостановка только этого типа запросов"""
+        self._bucket(request_type).on_flood(seconds)
+        self.flood_waits[request_type] += 1
+        self.logger.warning(f"FloodWait {seconds}с для запросов {request_type}, пауза и снижение скорости")
+
+    async def call(self, request_type: str, func: Callable[..., Awaitable[Any]], *args,
+                   max_flood_wait: Optional[float] = None, **kwargs) -> Any:
+        """Выполнение запроса с ожиданием токена и повтором после FloodWait
+
+        FloodWait длиннее max_flood_wait не пережидается, а пробрасывается вызывающему.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(request_type)
+            try:
+                result = await func(*args, **kwargs)
+                self._bucket(request_type).on_success()
+                return result
+            except FloodWaitError as e:
+                self.report_flood(request_type, e.seconds)
+                if attempt == self.max_retries or (max_flood_wait is not None and e.seconds > max_flood_wait):
+                    raise
+
+    async def iter_messages(self, client, entity, max_flood_wait: Optional[float] = None, **kwargs):
+        """iter_messages с токеном на каждую страницу и продолжением после FloodWait"""
+        reverse = kwargs.get('reverse', False)
+        limit = kwargs.get('limit')
+        received = 0
+        retries = 0
+
+        while True:
+            await self.acquire('history')
+            try:
+                async for message in client.iter_messages(entity, **kwargs):
+                    received += 1
+                    retries = 0
+                    # Продолжение после FloodWait начнется со следующего сообщения
+                    if reverse:
+                        kwargs['min_id'] = message.id
+                    else:
+                        kwargs['offset_id'] = message.id
+                    if limit is not None:
+                        kwargs['limit'] = limit - received
+
+                    yield message
+
+                    if received % self.HISTORY_PAGE_SIZE == 0:
+                        self._bucket('history').on_success()
+                        await self.acquire('history')
+                return
+
+            except FloodWaitError as e:
+                self.report_flood('history', e.seconds)
+                retries += 1
+                if retries > self.max_retries or (max_flood_wait is not None and e.seconds > max_flood_wait):
+                    raise
+
+    async def iter_download(self, client, media, max_flood_wait: Optional[float] = None, **kwargs):
+        """iter_download с токеном на каждую часть файла и продолжением после FloodWait"""
+        offset = kwargs.pop('offset', 0)
+        retries = 0
+
+        while True:
+            await self.acquire('download')
+            try:
+                async for chunk in client.iter_download(media, offset=offset, **kwargs):
+                    # Продолжение после FloodWait начнется со следующей части
+                    offset += len(chunk)
+                    retries = 0
+                    self._bucket('download').on_success()
+                    yield chunk
+                    await self.acquire('download')
+                return
+
+            except FloodWaitError as e:
+                self.report_flood('download', e.seconds)
+                retries += 1
+                if retries > self.max_retries or (max_flood_wait is not None and e.seconds > max_flood_wait):
+                    raise
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """Текущее состояние ограничителя по типам запросов"""
+        now = time.monotonic()
+        return {
+            request_type: {
+                'rate': round(bucket.rate, 3),
+                'base_rate': bucket.base_rate,
+                'paused_for': max(0.0, round(bucket.paused_until - now, 1)),
+                'flood_waits': self.flood_waits[request_type],
+            }
+            for request_type, bucket in self.buckets.items()
+        }
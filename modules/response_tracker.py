@@ -0,0 +1,271 @@
+"""
+Отслеживание ответов: открытые вопросы по (чат, ID сообщения), ответы через reply_to и таймауты без ответа
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .timer_wheel import TimerWheel
+
+QuestionKey = Tuple[int, int]
+
+class OpenQuestion:
+    """Сообщение, ожидающее ответа"""
+
+    __slots__ = ('sender_id', 'asked_at', 'aliases')
+
+    def __init__(self, sender_id: Optional[int], asked_at: float, aliases: Optional[List[int]] = None):
+        self.sender_id = sender_id
+        self.asked_at = asked_at
+        # Уточнения автора в ответ на свой вопрос: ответ на них тоже считается ответом на вопрос
+        self.aliases = aliases or []
+
+def reply_ids(message) -> Tuple[Optional[int], Optional[int]]:
+    """ID сообщения, на которое отвечают, и ID начала ветки (для форумов и комментариев)"""
+    reply_to_msg_id = getattr(message, 'reply_to_msg_id', None)
+    top_id = getattr(message, 'reply_to_top_id', None)
+    if top_id is None:
+        reply_to = getattr(message, 'reply_to', None)
+        top_id = getattr(reply_to, 'reply_to_top_id', None) if reply_to else None
+    return reply_to_msg_id, top_id
+
+class ResponseTracker:
+    """Открытые вопросы источника и таймеры ожидания ответа
+
+    Вопрос и ответ сопоставляются поиском в словаре по (чат, reply_to), таймауты
+    срабатывают по колесу таймеров без перебора открытых вопросов. Время трекера -
+    дата последнего сообщения, поэтому догрузка истории не считает старые вопросы
+    просроченными раньше их ответов. Время трекера догоняет текущее, только если
+    последнее сообщение было свежим (чтение в реальном времени) и новых нет дольше
+    idle_after секунд: пауза догрузки (FloodWait, медленный источник) не закрывает
+    вопросы истории. Состояние периодически сохраняется на диск.
+    """
+
+    def __init__(self, path: str, timeout: float = 3600, questions_only: bool = False,
+                 max_open: int = 500000, tick: float = 1.0, idle_after: float = 60.0,
+                 snapshot_interval: float = 60.0, on_timeout: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.questions_only = questions_only
+        self.max_open = max_open
+        self.tick = tick
+        self.idle_after = idle_after
+        self.snapshot_interval = snapshot_interval
+        self.on_timeout = on_timeout
+
+        self.open: Dict[QuestionKey, OpenQuestion] = {}
+        # Уточнение автора -> вопрос
+        self.aliases: Dict[QuestionKey, QuestionKey] = {}
+        self.wheel: Optional[TimerWheel] = None
+        self.last_message_at = 0.0
+        # Последнее сообщение свежее: источник читается в реальном времени
+        self.live = False
+        self.answered = 0
+        self.unanswered = 0
+        self.total_response_time = 0.0
+        self.dirty = False
+        self.loaded = False
+        self.limit_reported = False
+        self.task: Optional[asyncio.Task] = None
+        # Запись из потока фонового сохранения и из close не должны пересекаться
+        self.write_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _new_wheel(self, start: float) -> TimerWheel:
+        return TimerWheel(tick=self.tick, start=start)
+
+    def load(self):
+        """Загрузка открытых вопросов с диска"""
+        self.loaded = True
+        try:
+            if not self.path.exists():
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+
+            self.answered = state.get('answered', 0)
+            self.unanswered = state.get('unanswered', 0)
+            self.total_response_time = state.get('total_response_time', 0.0)
+            self.wheel = self._new_wheel(state.get('clock') or time.time())
+            for chat_id, message_id, sender_id, asked_at, aliases in state.get('open', []):
+                key = (chat_id, message_id)
+                self.open[key] = OpenQuestion(sender_id, asked_at, aliases)
+                for alias in aliases:
+                    self.aliases[(chat_id, alias)] = key
+                self.wheel.schedule(key, asked_at + self.timeout)
+            self.logger.info(f"Загружено состояние отслеживания ответов {self.path}: {len(self.open)} открытых вопросов")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки состояния отслеживания ответов {self.path}: {e}")
+
+    def _ensure_started(self, now: float):
+        if not self.loaded:
+            self.load()
+        if self.wheel is None:
+            self.wheel = self._new_wheel(now)
+        if self.task is None:
+            try:
+                self.task = asyncio.get_running_loop().create_task(self._tick_loop())
+            except RuntimeError:
+                pass
+
+    def _close_question(self, key: QuestionKey) -> Optional[OpenQuestion]:
+        question = self.open.pop(key, None)
+        if question is not None:
+            self.wheel.cancel(key)
+            for alias in question.aliases:
+                self.aliases.pop((key[0], alias), None)
+            self.dirty = True
+        return question
+
+    def _find(self, chat_id: int, message_id: Optional[int]) -> Optional[QuestionKey]:
+        if message_id is None:
+            return None
+        key = (chat_id, message_id)
+        if key in self.open:
+            return key
+        return self.aliases.get(key)
+
+    def observe(self, message, text: str = '') -> Dict[str, Any]:
+        """Учет сообщения: регистрирует вопрос или закрывает вопрос ответом. Возвращает поля для данных сообщения"""
+        date = getattr(message, 'date', None)
+        sent_at = date.timestamp() if date else time.time()
+        self._ensure_started(sent_at)
+        self.last_message_at = time.monotonic()
+        self.live = time.time() - sent_at < self.idle_after
+        self._fire(self.wheel.advance(max(sent_at, self.wheel.time)))
+
+        chat_id = getattr(message, 'chat_id', None) or 0
+        sender_id = getattr(message, 'sender_id', None)
+        reply_to_msg_id, top_id = reply_ids(message)
+
+        if reply_to_msg_id is not None or top_id is not None:
+            key = self._find(chat_id, reply_to_msg_id) or self._find(chat_id, top_id)
+            if key is None:
+                return {}
+            question = self.open[key]
+            if sender_id is not None and sender_id == question.sender_id:
+                # Уточнение автора вопроса: ответ на него закрывает вопрос
+                question.aliases.append(message.id)
+                self.aliases[(chat_id, message.id)] = key
+                self.dirty = True
+                return {}
+
+            self._close_question(key)
+            response_time = max(0.0, sent_at - question.asked_at)
+            self.answered += 1
+            self.total_response_time += response_time
+            return {'response_to': {'message_id': key[1], 'response_time': round(response_time, 1)}}
+
+        if self.questions_only and '?' not in text:
+            return {}
+        if len(self.open) >= self.max_open:
+            if not self.limit_reported:
+                self.logger.warning(f"Отслеживание ответов {self.path.stem}: достигнут лимит {self.max_open} открытых вопросов")
+                self.limit_reported = True
+            return {}
+        self.limit_reported = False
+
+        key = (chat_id, message.id)
+        self.open[key] = OpenQuestion(sender_id, sent_at)
+        self.wheel.schedule(key, sent_at + self.timeout)
+        self.dirty = True
+        return {'awaiting_response': True}
+
+    def _fire(self, expired: List[Tuple[QuestionKey, Any]]):
+        """Вопросы без ответа за timeout"""
+        for key, _ in expired:
+            question = self.open.pop(key, None)
+            if question is None:
+                continue
+            for alias in question.aliases:
+                self.aliases.pop((key[0], alias), None)
+            self.unanswered += 1
+            self.dirty = True
+            if self.on_timeout:
+                try:
+                    self.on_timeout({
+                        'event': 'unanswered',
+                        'chat_id': key[0],
+                        'message_id': key[1],
+                        'sender_id': question.sender_id,
+                        'asked_at': question.asked_at,
+                        'timeout': self.timeout,
+                    })
+                except Exception as e:
+                    self.logger.error(f"Ошибка обработки таймаута вопроса {key}: {e}")
+
+    async def _tick_loop(self):
+        """Продвижение времени трекера без новых сообщений и периодическое сохранение"""
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick)
+            if self.live and time.monotonic() - self.last_message_at >= self.idle_after:
+                self._fire(self.wheel.advance(time.time()))
+            if time.monotonic() - last_snapshot >= self.snapshot_interval:
+                await self._flush_async()
+                last_snapshot = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'open': len(self.open),
+            'answered': self.answered,
+            'unanswered': self.unanswered,
+            'avg_response_time': round(self.total_response_time / self.answered, 1) if self.answered else None,
+        }
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            'clock': self.wheel.time if self.wheel else None,
+            'answered': self.answered,
+            'unanswered': self.unanswered,
+            'total_response_time': self.total_response_time,
+            'open': [
+                [chat_id, message_id, question.sender_id, question.asked_at, list(question.aliases)]
+                for (chat_id, message_id), question in self.open.items()
+            ],
+        }
+
+    def _write(self, state: Dict[str, Any]) -> bool:
+        """Атомарная запись состояния: временный файл и замена"""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with self.write_lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения состояния отслеживания ответов {self.path}: {e}")
+            return False
+
+    def flush(self):
+        """Сохранение открытых вопросов"""
+        if not self.loaded or not self.dirty:
+            return
+        if self._write(self._snapshot()):
+            self.dirty = False
+
+    async def _flush_async(self):
+        """Сохранение без блокировки цикла событий: снимок в цикле, запись в потоке"""
+        if not self.dirty:
+            return
+        state = self._snapshot()
+        self.dirty = False
+        if not await asyncio.to_thread(self._write, state):
+            self.dirty = True
+
+    def close(self):
+        """Остановка таймера и сохранение состояния"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.flush()
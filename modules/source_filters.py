@@ -0,0 +1,145 @@
+"""
+Фильтры и правила разбора источника, применяемые к исходному сообщению Telethon
+"""
+
+import itertools
+from typing import Any, Dict, List, Optional
+from telethon.tl import types
+
+from .keyword_matcher import KeywordMatcher
+
+# Тип медиа: (фильтр поиска Telegram, атрибуты сообщения Telethon для локальной проверки)
+MEDIA_FILTERS = {
+    'photo': (types.InputMessagesFilterPhotos, ('photo',)),
+    'video': (types.InputMessagesFilterVideo, ('video',)),
+    'photo_video': (types.InputMessagesFilterPhotoVideo, ('photo', 'video')),
+    'document': (types.InputMessagesFilterDocument, ('document',)),
+    'gif': (types.InputMessagesFilterGif, ('gif',)),
+    'voice': (types.InputMessagesFilterVoice, ('voice',)),
+    'music': (types.InputMessagesFilterMusic, ('audio',)),
+    'round_video': (types.InputMessagesFilterRoundVideo, ('video_note',)),
+    'url': (types.InputMessagesFilterUrl, ('web_preview',)),
+}
+
+def is_reply(message) -> bool:
+    """Сообщение - ответ (reply) на другое сообщение"""
+    return bool(getattr(message, 'reply_to_msg_id', None) or getattr(message, 'reply_to', None))
+
+class SourceFilter:
+    """Проверка сообщения по filters и parsing_rules источника до раздачи пайплайнам
+
+    Сначала выполняются дешевые проверки атрибутов и длины, поиск ключевых слов
+    выполняется одним проходом автомата и только для прошедших сообщений.
+    """
+
+    def __init__(self, filters: Dict[str, Any], parsing_rules: Dict[str, bool]):
+        # parse_text / parse_media / parse_buttons отключают только извлечение полей
+        # в MessageRecord. Сообщения ботов по умолчанию не разбираются, как у источников,
+        # добавленных командой
+        self.parse_bots = parsing_rules.get('parse_bots', False)
+
+        self.min_length = int(filters.get('min_length', 0))
+        # Ключевые слова только целыми словами - как ищет Telegram
+        self.whole_words = bool(filters.get('whole_words', False))
+        # Ответы проходят без ключевых слов
+        self.keep_replies = bool(filters.get('keep_replies', True))
+        keywords = self._keywords(filters, 'keywords')
+        exclude_keywords = self._keywords(filters, 'exclude_keywords')
+        self.keywords = list(keywords)
+        self.has_keywords = bool(keywords)
+        self.has_exclude = bool(exclude_keywords)
+
+        self.media_types: List[str] = list(filters.get('media_types') or [])
+        unknown_media = [media_type for media_type in self.media_types if media_type not in MEDIA_FILTERS]
+        if unknown_media:
+            raise ValueError(f"Неизвестные типы медиа: {', '.join(unknown_media)}")
+        self.media_attributes = tuple(
+            attribute for media_type in self.media_types for attribute in MEDIA_FILTERS[media_type][1]
+        )
+        self.from_users: List[int] = [int(user_id) for user_id in filters.get('from_users') or []]
+        self.from_users_set = set(self.from_users)
+
+        self.matcher = KeywordMatcher()
+        for keyword in keywords:
+            self.matcher.add('keywords', keyword, self.whole_words)
+        for keyword in exclude_keywords:
+            self.matcher.add('exclude_keywords', keyword, self.whole_words)
+        self.matcher.build()
+
+        self.is_empty = (
+            self.parse_bots and not self.min_length and not self.has_keywords and not self.has_exclude
+            and not self.media_types and not self.from_users
+        )
+
+    @staticmethod
+    def _keywords(filters: Dict[str, Any], key: str):
+        keywords = filters.get(key) or []
+        if isinstance(keywords, str) or not all(isinstance(keyword, str) for keyword in keywords):
+            raise ValueError(f"{key} должен быть списком строк")
+        return keywords
+
+    def accepts(self, message) -> bool:
+        """Проверка сообщения; отклоненные сообщения не попадают в пайплайны"""
+        if self.is_empty:
+            return True
+
+        # Исходный текст без разметки: форматирование message.text здесь не нужно
+        text = getattr(message, 'message', None) or ''
+
+        if not self.parse_bots:
+            if getattr(message, 'via_bot_id', None):
+                return False
+            # Отправитель проверяется только если он уже получен вместе с сообщением
+            sender = getattr(message, 'sender', None)
+            if getattr(sender, 'bot', False):
+                return False
+
+        if self.media_attributes and not any(getattr(message, attribute, None) for attribute in self.media_attributes):
+            return False
+
+        if self.from_users_set and getattr(message, 'sender_id', None) not in self.from_users_set:
+            return False
+
+        if len(text) < self.min_length:
+            return False
+
+        # Ответы проходят без ключевых слов: иначе отслеживание ответов и граф обсуждений
+        # не видят ответов, в которых редко повторяются слова вопроса
+        need_keywords = self.has_keywords and not (self.keep_replies and is_reply(message))
+        if need_keywords or self.has_exclude:
+            hits: Dict[str, set] = {}
+            self.matcher.find(text, hits)
+            if need_keywords and 'keywords' not in hits:
+                return False
+            if 'exclude_keywords' in hits:
+                return False
+
+        return True
+
+    def search_queries(self) -> Optional[List[Dict[str, Any]]]:
+        """Запросы поиска Telegram, покрывающие все сообщения, которые могут пройти фильтр
+
+        Каждое сочетание ключевого слова, типа медиа и отправителя - отдельный запрос
+        (параметры iter_messages). None - фильтры нельзя выразить поиском на сервере.
+        Telegram ищет слова, а не подстроки, и не умеет искать ответы, поэтому ключевые
+        слова выражаются поиском только при whole_words и без keep_replies: иначе
+        сообщения, пропущенные поиском, были бы отмечены обработанными и потеряны.
+        """
+        if not (self.has_keywords or self.media_types or self.from_users):
+            return None
+        if self.has_keywords and (not self.whole_words or self.keep_replies):
+            return None
+
+        queries = []
+        for keyword, media_type, user_id in itertools.product(
+            self.keywords or [None], self.media_types or [None], self.from_users or [None]
+        ):
+            query: Dict[str, Any] = {}
+            if keyword is not None:
+                query['search'] = keyword
+            if media_type is not None:
+                query['filter'] = MEDIA_FILTERS[media_type][0]
+            if user_id is not None:
+                query['from_user'] = user_id
+            queries.append(query)
+        return queries
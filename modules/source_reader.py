@@ -0,0 +1,435 @@
+"""
+Чтение источников с раздачей сообщений всем подписанным пайплайнам
+"""
+
+import heapq
+import asyncio
+import logging
+from typing import Dict, Callable, Awaitable, Any, List, Optional, Deque, Set, Tuple
+from collections import deque
+from datetime import datetime
+from telethon import events
+
+from .client_pool import ClientPool
+from .source_filters import SourceFilter
+from .message_record import MessageRecord, parsing_flags
+
+MessageHandler = Callable[[Any], Awaitable[None]]
+
+class SourceReader:
+    """Единый читатель источника: каждое сообщение загружается один раз и раздается подписчикам"""
+
+    # Наибольшая задержка повтора догрузки для подписчика, секунды
+    CATCH_UP_MAX_DELAY = 60
+
+    def __init__(self, clients: ClientPool, source_name: str, source, monitor=None):
+        self.clients = clients
+        self.source_name = source_name
+        self.source = source
+        self.monitor = monitor
+        self.subscribers: Dict[str, MessageHandler] = {}
+        self.skip_handlers: Dict[str, Callable[[int], None]] = {}
+        self.start_ids: Dict[str, int] = {}
+        self.ordered_subscribers: Set[str] = set()
+        # Подписчики, которые догружают пропущенное до позиции чтения
+        self.catch_up_tasks: Dict[str, asyncio.Task] = {}
+        self.safe_checkpoint: Optional[int] = None
+        self.on_safe_checkpoint: Optional[Callable[[], None]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.live_queue: asyncio.Queue = asyncio.Queue()
+        self.live = False
+        self.last_message_id = 0
+        self.messages_read = 0
+        self.messages_filtered = 0
+        self.source_filter: Optional[SourceFilter] = None
+        self.parsing_flags = parsing_flags(source.parsing_rules)
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def is_running(self) -> bool:
+        """Проверка, выполняется ли чтение"""
+        return self.task is not None and not self.task.done()
+
+    def subscribe(self, pipeline_name: str, handler: MessageHandler, after_id: int = 0, ordered: bool = False,
+                  on_skip: Optional[Callable[[int], None]] = None):
+        """Подписка пайплайна на сообщения источника с ID больше after_id
+
+        on_skip получает ID сообщений, отклоненных фильтрами источника. Если чтение уже
+        ушло дальше after_id, пропущенные сообщения догружаются отдельно для этого подписчика.
+        """
+        catch_up = pipeline_name not in self.subscribers and self.is_running and after_id < self.last_message_id
+        self.subscribers[pipeline_name] = handler
+        self.start_ids[pipeline_name] = after_id
+        if on_skip:
+            self.skip_handlers[pipeline_name] = on_skip
+        if ordered:
+            self.ordered_subscribers.add(pipeline_name)
+        if catch_up:
+            self.logger.info(
+                f"Пайплайн {pipeline_name} подключен к уже работающему чтению {self.source_name}, "
+                f"догрузка сообщений с ID {after_id + 1} по {self.last_message_id}"
+            )
+            self.catch_up_tasks[pipeline_name] = asyncio.create_task(self._catch_up(pipeline_name, after_id))
+
+    def unsubscribe(self, pipeline_name: str):
+        """Отписка пайплайна от источника"""
+        self.subscribers.pop(pipeline_name, None)
+        self.start_ids.pop(pipeline_name, None)
+        self.skip_handlers.pop(pipeline_name, None)
+        self.ordered_subscribers.discard(pipeline_name)
+        task = self.catch_up_tasks.pop(pipeline_name, None)
+        if task:
+            task.cancel()
+        if not self.subscribers:
+            # Пробуждение ожидания живых сообщений, чтобы чтение завершилось
+            self.live_queue.put_nowait(None)
+
+    def start(self) -> asyncio.Task:
+        """Запуск чтения, если оно еще не запущено"""
+        if not self.is_running:
+            # Новое чтение начинается с контрольных точек текущих подписчиков
+            self.last_message_id = 0
+            self.source_filter = SourceFilter(self.source.filters, self.source.parsing_rules)
+            self.parsing_flags = parsing_flags(self.source.parsing_rules)
+            self.task = asyncio.create_task(self._run())
+        return self.task
+
+    async def stop(self):
+        """Остановка чтения источника"""
+        for task in self.catch_up_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.catch_up_tasks.values(), return_exceptions=True)
+        self.catch_up_tasks.clear()
+        if self.is_running:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.logger.info(f"Чтение источника {self.source_name} остановлено")
+
+    async def _run(self):
+        """Чтение истории источника с последующим переходом в режим живых событий"""
+        # Обработчик регистрируется до чтения истории: сообщения, пришедшие во время
+        # догрузки, накапливаются в очереди, поэтому при переключении нет пропусков
+        live_event = events.NewMessage(chats=self.source.id)
+        self.clients.add_event_handler(self.source_name, self._on_live_message, live_event)
+
+        try:
+            await self._read_history()
+            await self._read_live()
+
+        except Exception as e:
+            self.source.error_count += 1
+            self.logger.error(f"Критическая ошибка чтения источника {self.source_name}: {e}")
+            if self.monitor:
+                for pipeline_name in list(self.subscribers):
+                    await self.monitor.send_alert("pipeline_error", f"Ошибка пайплайна {pipeline_name}: {e}", pipeline_name)
+
+        finally:
+            self.clients.remove_event_handler(self.source_name, self._on_live_message, live_event)
+            self.live = False
+
+    def checkpoint_limit(self, message_id: int) -> int:
+        """Ограничение контрольной точки на время неупорядоченной догрузки"""
+        if self.safe_checkpoint is None:
+            return message_id
+        return min(message_id, self.safe_checkpoint)
+
+    async def _read_history(self):
+        """Догрузка истории источника с контрольной точки"""
+        # Чтение начинается с самой ранней контрольной точки среди подписчиков
+        min_id = min(self.start_ids.values(), default=0)
+        self.logger.info(f"Чтение источника {self.source_name} для {len(self.subscribers)} пайплайнов с ID {min_id + 1}")
+
+        if self.source.backfill.get('mode') == 'search':
+            queries = self.source_filter.search_queries()
+            if queries:
+                await self._read_history_search(min_id, queries)
+                return
+            self.logger.warning(
+                f"Фильтры источника {self.source_name} нельзя точно выразить поиском Telegram "
+                f"(для ключевых слов нужны whole_words: true и keep_replies: false), читается вся история"
+            )
+
+        concurrency = int(self.source.backfill.get('concurrency', 1))
+        if concurrency > 1:
+            await self._read_history_parallel(min_id, concurrency)
+            return
+
+        async for message in self.clients.iter_messages(self.source_name, self.source.id, reverse=True, min_id=min_id):
+            if not self.subscribers:
+                self.logger.info(f"У источника {self.source_name} не осталось подписчиков")
+                return
+
+            await self._accept(message)
+
+        self.logger.info(
+            f"История источника {self.source_name} прочитана, сообщений: {self.messages_read}, "
+            f"отклонено фильтрами источника: {self.messages_filtered}"
+        )
+
+    async def _read_history_parallel(self, min_id: int, concurrency: int):
+        """Параллельная догрузка истории диапазонами ID"""
+        latest = await self.clients.call(self.source_name, 'history', 'get_messages', self.source.id, limit=1)
+        if not latest or latest[0].id <= min_id:
+            return
+        max_id = latest[0].id
+
+        range_size = max(1, int(self.source.backfill.get('range_size', 2000)))
+        ordered = self.source.backfill.get('ordered', True) or bool(self.ordered_subscribers)
+        ranges = [(lo, min(lo + range_size, max_id)) for lo in range(min_id, max_id, range_size)]
+
+        self.logger.info(
+            f"Параллельная догрузка {self.source_name}: ID {min_id + 1}..{max_id}, "
+            f"{len(ranges)} диапазонов, {concurrency} потоков, "
+            f"{'с упорядочиванием' if ordered else 'без упорядочивания'}"
+        )
+
+        # Одновременно загружается не больше concurrency диапазонов, поэтому в памяти
+        # находится не больше concurrency * range_size сообщений
+        shared_queue = None if ordered else asyncio.Queue(maxsize=range_size)
+        if not ordered:
+            # Контрольные точки не сдвигаются за первый незавершенный диапазон
+            self.safe_checkpoint = min_id
+
+        in_flight: Deque[Tuple[int, asyncio.Task, asyncio.Queue]] = deque()
+        next_range = 0
+
+        def launch():
+            nonlocal next_range
+            if next_range >= len(ranges):
+                return
+            lo, hi = ranges[next_range]
+            queue = shared_queue or asyncio.Queue()
+            task = asyncio.create_task(self._fetch_range(next_range, lo, hi, queue))
+            in_flight.append((next_range, task, queue))
+            next_range += 1
+
+        try:
+            for _ in range(concurrency):
+                launch()
+
+            if ordered:
+                # Диапазоны раздаются строго по порядку, следующие загружаются заранее
+                while in_flight:
+                    _, _, queue = in_flight.popleft()
+                    await self._drain_range(queue)
+                    launch()
+            else:
+                finished = [False] * len(ranges)
+                while not all(finished):
+                    index, item = await shared_queue.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is not None:
+                        await self._accept(item)
+                        continue
+
+                    finished[index] = True
+                    launch()
+                    # Граница безопасной контрольной точки: конец непрерывно завершенных диапазонов
+                    for done, (_, hi) in zip(finished, ranges):
+                        if not done:
+                            break
+                        self.safe_checkpoint = hi
+                    self._notify_safe_checkpoint()
+        finally:
+            for _, task, _ in in_flight:
+                task.cancel()
+            await asyncio.gather(*(task for _, task, _ in in_flight), return_exceptions=True)
+            if self.safe_checkpoint is not None:
+                self.safe_checkpoint = None
+                self._notify_safe_checkpoint()
+
+        self.last_message_id = max(self.last_message_id, max_id)
+        self.logger.info(
+            f"История источника {self.source_name} прочитана, сообщений: {self.messages_read}, "
+            f"отклонено фильтрами источника: {self.messages_filtered}"
+        )
+
+    async def _read_history_search(self, min_id: int, queries: List[Dict[str, Any]]):
+        """Догрузка истории поиском на стороне Telegram: загружаются только подходящие сообщения"""
+        latest = await self.clients.call(self.source_name, 'history', 'get_messages', self.source.id, limit=1)
+        if not latest or latest[0].id <= min_id:
+            return
+        max_id = latest[0].id
+
+        self.logger.info(
+            f"Догрузка {self.source_name} поиском Telegram: ID {min_id + 1}..{max_id}, запросов: {len(queries)}"
+        )
+
+        # Результаты запросов идут по возрастанию ID и сливаются с удалением повторов
+        iterators = [
+            self.clients.iter_messages(
+                self.source_name, self.source.id, reverse=True, min_id=min_id, max_id=max_id + 1, **query
+            ).__aiter__()
+            for query in queries
+        ]
+        heap: List[Tuple[int, int, Any]] = []
+
+        async def advance(index: int):
+            try:
+                message = await iterators[index].__anext__()
+            except StopAsyncIteration:
+                return
+            heapq.heappush(heap, (message.id, index, message))
+
+        try:
+            for index in range(len(iterators)):
+                await advance(index)
+
+            while heap:
+                if not self.subscribers:
+                    self.logger.info(f"У источника {self.source_name} не осталось подписчиков")
+                    return
+
+                message_id, index, message = heapq.heappop(heap)
+                await advance(index)
+                if message_id <= self.last_message_id:
+                    continue
+                await self._accept(message)
+        finally:
+            for iterator in iterators:
+                await iterator.aclose()
+
+        # Поиск покрывает все сообщения, которые принимает фильтр (см. search_queries):
+        # не найденные не подходят под фильтры, контрольные точки сдвигаются до конца истории
+        if max_id > self.last_message_id:
+            self.last_message_id = max_id
+            self._skip(max_id)
+
+        self.logger.info(
+            f"История источника {self.source_name} прочитана поиском, сообщений: {self.messages_read}, "
+            f"отклонено фильтрами источника: {self.messages_filtered}"
+        )
+
+    async def _catch_up(self, pipeline_name: str, after_id: int):
+        """Догрузка сообщений (after_id, позиция чтения] для подписчика, подключенного позже
+
+        Основное чтение не передает подписчику сообщения, пока догрузка не дойдет до его
+        текущей позиции; переключение выполняется без ожидания, поэтому сообщения не
+        теряются и не повторяются, а подписчик получает их по возрастанию ID. После ошибки
+        догрузка повторяется с последнего переданного сообщения с растущей задержкой.
+        """
+        handler = self.subscribers[pipeline_name]
+        cursor = after_id
+        failures = 0
+        while True:
+            try:
+                while cursor < self.last_message_id:
+                    target = self.last_message_id
+                    async for message in self.clients.iter_messages(
+                        self.source_name, self.source.id, reverse=True, min_id=cursor, max_id=target + 1
+                    ):
+                        if self.source_filter and not self.source_filter.accepts(message):
+                            on_skip = self.skip_handlers.get(pipeline_name)
+                            if on_skip:
+                                on_skip(message.id)
+                        else:
+                            await handler(MessageRecord(message, self.parsing_flags))
+                        cursor = message.id
+                    cursor = target
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Подписчик не получает сообщений дальше пропуска: контрольная точка не уходит за него
+                failures += 1
+                delay = min(self.CATCH_UP_MAX_DELAY, 2 ** (failures - 1))
+                self.logger.error(
+                    f"Ошибка догрузки {self.source_name} для пайплайна {pipeline_name} на ID {cursor}: {e}; "
+                    f"повтор через {delay}с"
+                )
+                if failures == 1 and self.monitor:
+                    await self.monitor.send_alert(
+                        "pipeline_error", f"Ошибка догрузки пайплайна {pipeline_name}: {e}", pipeline_name
+                    )
+                await asyncio.sleep(delay)
+
+        # Дальше сообщения подписчику передает основное чтение
+        self.start_ids[pipeline_name] = cursor
+        self.catch_up_tasks.pop(pipeline_name, None)
+        self.logger.info(f"Догрузка {self.source_name} для пайплайна {pipeline_name} завершена на ID {cursor}")
+
+    def _notify_safe_checkpoint(self):
+        """Сообщение о сдвиге границы безопасной контрольной точки"""
+        if self.on_safe_checkpoint:
+            self.on_safe_checkpoint()
+
+    async def _fetch_range(self, index: int, lo: int, hi: int, queue: asyncio.Queue):
+        """Загрузка одного диапазона (lo, hi] в очередь"""
+        try:
+            # Все диапазоны делят общий лимит запросов истории
+            async for message in self.clients.iter_messages(
+                self.source_name, self.source.id, reverse=True, min_id=lo, max_id=hi + 1
+            ):
+                await queue.put((index, message))
+            await queue.put((index, None))
+        except Exception as e:
+            await queue.put((index, e))
+
+    async def _drain_range(self, queue: asyncio.Queue):
+        """Раздача сообщений одного диапазона по порядку"""
+        while True:
+            _, item = await queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            await self._accept(item)
+
+    async def _read_live(self):
+        """Обработка новых сообщений из событий Telegram"""
+        self.live = True
+        self.logger.info(f"Источник {self.source_name} переведен в режим живых событий")
+
+        while self.subscribers:
+            message = await self.live_queue.get()
+            # Сообщения, уже полученные из истории, пропускаются
+            if message is None or message.id <= self.last_message_id:
+                continue
+            await self._accept(message)
+
+        self.logger.info(f"У источника {self.source_name} не осталось подписчиков")
+
+    async def _on_live_message(self, event):
+        """Обработчик события нового сообщения в источнике"""
+        self.live_queue.put_nowait(event.message)
+
+    async def _accept(self, message):
+        """Учет сообщения, фильтры источника и раздача подписчикам"""
+        self.last_message_id = max(self.last_message_id, message.id)
+        self.messages_read += 1
+        self.source.message_count += 1
+        self.source.last_activity = datetime.now()
+
+        # Отклоненные фильтрами источника сообщения не доходят до пайплайнов
+        if self.source_filter and not self.source_filter.accepts(message):
+            self.messages_filtered += 1
+            self._skip(message.id)
+            return
+
+        await self._dispatch(message)
+
+    def _skip(self, message_id: int):
+        """Сообщение подписчикам о пропущенном ID для сдвига контрольных точек"""
+        for pipeline_name, on_skip in list(self.skip_handlers.items()):
+            if pipeline_name in self.catch_up_tasks:
+                continue
+            if message_id > self.start_ids.get(pipeline_name, 0):
+                on_skip(message_id)
+
+    async def _dispatch(self, message):
+        """Раздача сообщения всем подписанным пайплайнам
+
+        Пайплайны получают одну общую запись сообщения: поля извлекаются один раз.
+        """
+        record = MessageRecord(message, self.parsing_flags)
+        for pipeline_name, handler in list(self.subscribers.items()):
+            if message.id <= self.start_ids.get(pipeline_name, 0) or pipeline_name in self.catch_up_tasks:
+                continue
+            try:
+                await handler(record)
+            except Exception as e:
+                self.logger.error(f"Ошибка передачи сообщения {message.id} в пайплайн {pipeline_name}: {e}")
@@ -0,0 +1,135 @@
+"""
+Иерархическое колесо таймеров: планирование и отмена за O(1), срабатывание без перебора всех таймеров
+"""
+
+import math
+from typing import Any, Dict, Hashable, List, Tuple
+
+class TimerWheel:
+    """Колесо таймеров из levels уровней по slots ячеек
+
+    Ячейка уровня 0 - один тик, ячейка уровня l - slots^l тиков. Таймер кладется на
+    уровень, соответствующий времени до срабатывания; когда нижний уровень делает
+    полный оборот, ячейка следующего уровня раскладывается по нижним уровням.
+    Таймеры дальше всего колеса ждут на верхнем уровне и раскладываются заново.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, start: float = 0.0):
+        if slots & (slots - 1):
+            raise ValueError("slots должен быть степенью двойки")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.wheels: List[List[Dict[Hashable, Tuple[int, Any]]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        # Ключ таймера -> (уровень, ячейка) для отмены за O(1)
+        self.timers: Dict[Hashable, Tuple[int, int]] = {}
+        self.current = math.floor(start / tick)
+
+    @property
+    def time(self) -> float:
+        """Текущее время колеса"""
+        return self.current * self.tick
+
+    def _place(self, key: Hashable, due: int, value: Any, earliest: int):
+        delta = due - self.current
+        level = 0
+        while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        # Дальше всего колеса: ждет в самой дальней ячейке верхнего уровня
+        position = min(max(due, earliest), self.current + self.slots ** (level + 1) - 1)
+        slot = (position >> (self.bits * level)) & self.mask
+        self.wheels[level][slot][key] = (due, value)
+        self.timers[key] = (level, slot)
+
+    def schedule(self, key: Hashable, deadline: float, value: Any = None):
+        """Таймер key на время deadline; повторное планирование заменяет старый таймер"""
+        self.cancel(key)
+        # Текущий тик уже обработан: просроченный таймер сработает на следующем
+        self._place(key, math.ceil(deadline / self.tick), value, self.current + 1)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Отмена таймера; False - таймера нет"""
+        position = self.timers.pop(key, None)
+        if position is None:
+            return False
+        level, slot = position
+        del self.wheels[level][slot][key]
+        return True
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def _cascade(self, level: int):
+        """Раскладка ячейки уровня level по нижним уровням"""
+        slot = (self.current >> (self.bits * level)) & self.mask
+        timers = self.wheels[level][slot]
+        self.wheels[level][slot] = {}
+        for key, (due, value) in timers.items():
+            self._place(key, due, value, self.current)
+
+    def _next_tick(self, limit: int) -> int:
+        """Ближайший тик после текущего, на котором срабатывает или раскладывается непустая ячейка
+
+        Ищется не дальше limit; тики между текущим и найденным пропускаются без обхода.
+        """
+        best = limit
+        # Уровень 0: ячейки следующего оборота по порядку
+        for step in range(1, min(self.slots, best - self.current) + 1):
+            if self.wheels[0][(self.current + step) & self.mask]:
+                best = self.current + step
+                break
+        # Уровни выше: границы их ячеек, пока граница раньше лучшего найденного тика
+        for level in range(1, self.levels):
+            span = 1 << (self.bits * level)
+            boundary = (self.current // span + 1) * span
+            for _ in range(self.slots):
+                if boundary >= best:
+                    break
+                if self.wheels[level][(boundary >> (self.bits * level)) & self.mask]:
+                    best = boundary
+                    break
+                boundary += span
+        return best
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Продвижение колеса до now; возвращает сработавшие таймеры (ключ, значение)
+
+        Стоимость зависит от числа непустых ячеек на пути, а не от прошедших тиков:
+        большой скачок времени (догрузка истории) не обходит колесо по тику.
+        """
+        target = math.floor(now / self.tick)
+        expired: List[Tuple[Hashable, Any]] = []
+        while self.current < target:
+            if not self.timers:
+                self.current = target
+                break
+            self.current = self._next_tick(target)
+
+            # Полный оборот нижнего уровня: раскладка ячейки следующего уровня
+            level = 1
+            while level < self.levels and (self.current & ((1 << (self.bits * level)) - 1)) == 0:
+                level += 1
+            for upper in range(level - 1, 0, -1):
+                self._cascade(upper)
+
+            slot = self.current & self.mask
+            fired = self.wheels[0][slot]
+            if fired:
+                self.wheels[0][slot] = {}
+                for key, (_, value) in fired.items():
+                    del self.timers[key]
+                    expired.append((key, value))
+        return expired
+
+    def items(self):
+        """Все запланированные таймеры: (ключ, время срабатывания, значение)"""
+        for key, (level, slot) in self.timers.items():
+            due, value = self.wheels[level][slot][key]
+            yield key, due * self.tick, value
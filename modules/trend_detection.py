@@ -0,0 +1,309 @@
+"""
+Поиск трендов: счетчики слов и хештегов по кольцу временных корзин и оценка всплеска
+"""
+
+import os
+import re
+import json
+import math
+import time
+import heapq
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_TERM = re.compile(r'#\w+|[^\W\d_]{3,}')
+
+def extract_terms(text: str, stopwords: FrozenSet[str] = frozenset()) -> Set[str]:
+    """Слова и хештеги сообщения; повтор в одном сообщении считается один раз"""
+    return {
+        term for term in _TERM.findall(text.lower().replace('ё', 'е'))
+        if term not in stopwords
+    }
+
+class TermWindow:
+    """Счетчики терминов одного источника по кольцу корзин
+
+    Последние current_buckets корзин - текущее окно, более старые baseline_buckets -
+    базовый уровень. Суммы окна и базового уровня обновляются на месте, поэтому
+    сообщение стоит O(его терминов), а смена корзины - O(терминов сдвинутых корзин).
+    Оценка всплеска - отклонение текущего количества от ожидаемого по базовому уровню
+    в единицах пуассоновского разброса.
+    """
+
+    TOP_CACHE = 10
+
+    def __init__(self, bucket_seconds: float, current_buckets: int, baseline_buckets: int,
+                 min_count: int = 3, max_terms: int = 50000):
+        self.bucket_seconds = bucket_seconds
+        self.current_buckets = current_buckets
+        self.baseline_buckets = baseline_buckets
+        self.size = current_buckets + baseline_buckets
+        self.min_count = min_count
+        self.max_terms = max_terms
+
+        self.buckets: List[Counter] = [Counter() for _ in range(self.size)]
+        self.epochs: List[Optional[int]] = [None] * self.size
+        self.current: Counter = Counter()
+        self.baseline: Counter = Counter()
+        # Оценки всплеска терминов текущего окна
+        self.scores: Dict[str, float] = {}
+        self.first_epoch: Optional[int] = None
+        self.latest_epoch: Optional[int] = None
+
+        self.top_cache: List[Tuple[float, str]] = []
+        self.top_terms: Set[str] = set()
+        self.top_limit = 0
+        self.top_dirty = True
+
+    def _baseline_filled(self) -> int:
+        """Сколько корзин базового уровня уже накоплено"""
+        if self.first_epoch is None:
+            return 0
+        return max(0, min(self.baseline_buckets, self.latest_epoch - self.first_epoch - self.current_buckets + 1))
+
+    def _score(self, term: str, filled: int) -> float:
+        count = self.current.get(term, 0)
+        expected = self.baseline.get(term, 0) / filled * self.current_buckets if filled else 0.0
+        return (count - expected) / math.sqrt(expected + 1)
+
+    def _rescore(self, terms: Iterable[str], filled: int):
+        """Пересчет оценок измененных терминов; топ пересчитывается, только если мог измениться"""
+        threshold = self.top_cache[-1][0] if len(self.top_cache) >= self.top_limit > 0 else 0.0
+        for term in terms:
+            if term not in self.current:
+                self.scores.pop(term, None)
+                continue
+            score = self._score(term, filled)
+            self.scores[term] = score
+            if score >= threshold or term in self.top_terms:
+                self.top_dirty = True
+
+    @staticmethod
+    def _move(counts: Counter, source: Counter, target: Optional[Counter] = None):
+        """Вычитание счетчиков корзины из суммы (и добавление в другую) за O(терминов корзины)"""
+        for term, count in counts.items():
+            left = source[term] - count
+            if left > 0:
+                source[term] = left
+            else:
+                del source[term]
+            if target is not None:
+                target[term] += count
+
+    def _advance(self, epoch: int):
+        """Сдвиг кольца до корзины epoch"""
+        if self.latest_epoch is not None and epoch - self.latest_epoch >= self.size:
+            # Перерыв дольше всего кольца: история устарела целиком
+            for bucket in self.buckets:
+                bucket.clear()
+            self.epochs = [None] * self.size
+            self.current.clear()
+            self.baseline.clear()
+            self.scores.clear()
+            self.latest_epoch = None
+
+        if self.latest_epoch is None:
+            self.first_epoch = self.latest_epoch = epoch
+            self.epochs[epoch % self.size] = epoch
+            self.top_dirty = True
+            return
+
+        filled_before = self._baseline_filled()
+        changed: Set[str] = set()
+        while self.latest_epoch < epoch:
+            self.latest_epoch += 1
+            # Старейшая корзина выходит из базового уровня
+            slot = self.latest_epoch % self.size
+            if self.epochs[slot] is not None:
+                changed.update(self.buckets[slot])
+                self._move(self.buckets[slot], self.baseline)
+                self.buckets[slot].clear()
+            self.epochs[slot] = self.latest_epoch
+
+            # Корзина на границе окна переходит из текущего окна в базовый уровень
+            moved_slot = (self.latest_epoch - self.current_buckets) % self.size
+            if self.epochs[moved_slot] == self.latest_epoch - self.current_buckets:
+                changed.update(self.buckets[moved_slot])
+                self._move(self.buckets[moved_slot], self.current, self.baseline)
+
+        filled = self._baseline_filled()
+        if filled != filled_before:
+            # Пока базовый уровень копится, ожидаемые значения меняются у всех терминов окна
+            self.scores = {term: self._score(term, filled) for term in self.current}
+        else:
+            self._rescore(changed, filled)
+        self.top_dirty = True
+
+    def add(self, terms: Set[str], timestamp: float) -> bool:
+        """Учет терминов сообщения; False - сообщение старше кольца"""
+        epoch = int(timestamp // self.bucket_seconds)
+        if self.latest_epoch is None or epoch > self.latest_epoch:
+            self._advance(epoch)
+        elif epoch <= self.latest_epoch - self.size:
+            return False
+
+        slot = epoch % self.size
+        bucket = self.buckets[slot]
+        if self.epochs[slot] != epoch:
+            # Корзина до начала учета источника
+            return False
+
+        in_window = epoch > self.latest_epoch - self.current_buckets
+        totals = self.current if in_window else self.baseline
+        for term in terms:
+            if term not in bucket and len(bucket) >= self.max_terms:
+                continue
+            bucket[term] += 1
+            totals[term] += 1
+
+        self._rescore(terms, self._baseline_filled())
+        return True
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Термины с наибольшим всплеском: не меньше min_count упоминаний в текущем окне"""
+        if self.top_dirty or limit > self.top_limit:
+            candidates = (
+                (score, term) for term, score in self.scores.items()
+                if score > 0 and self.current[term] >= self.min_count
+            )
+            self.top_limit = max(limit, self.TOP_CACHE)
+            self.top_cache = heapq.nlargest(self.top_limit, candidates)
+            self.top_terms = {term for _, term in self.top_cache}
+            self.top_dirty = False
+        return [
+            {'term': term, 'score': round(score, 2), 'count': self.current[term]}
+            for score, term in self.top_cache[:limit]
+        ]
+
+    def trending(self, terms: Iterable[str], threshold: float) -> List[str]:
+        """Термины сообщения с оценкой всплеска не ниже threshold"""
+        return sorted(
+            term for term in terms
+            if self.scores.get(term, 0.0) >= threshold and self.current[term] >= self.min_count
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'first_epoch': self.first_epoch,
+            'latest_epoch': self.latest_epoch,
+            'buckets': {
+                str(epoch): dict(bucket)
+                for epoch, bucket in zip(self.epochs, self.buckets)
+                if epoch is not None and bucket
+            },
+        }
+
+    def restore(self, state: Dict[str, Any], now_epoch: int):
+        """Восстановление сохраненных корзин, еще не вышедших из кольца"""
+        latest = state.get('latest_epoch')
+        if latest is None or now_epoch - latest >= self.size:
+            return
+        self.first_epoch = state.get('first_epoch', latest)
+        self.latest_epoch = latest
+        for epoch_key, counts in state.get('buckets', {}).items():
+            epoch = int(epoch_key)
+            if epoch <= latest - self.size:
+                continue
+            slot = epoch % self.size
+            self.epochs[slot] = epoch
+            self.buckets[slot] = Counter(counts)
+            totals = self.current if epoch > latest - self.current_buckets else self.baseline
+            totals.update(counts)
+        self.epochs[latest % self.size] = latest
+        self._advance(max(now_epoch, latest))
+        # Сдвиг пересчитывает только измененные термины, восстановленные оцениваются заново
+        filled = self._baseline_filled()
+        self.scores = {term: self._score(term, filled) for term in self.current}
+        self.top_dirty = True
+
+class TrendTracker:
+    """Тренды по источникам пайплайна с сохранением корзин между перезапусками"""
+
+    def __init__(self, path: str, bucket_seconds: float = 300, window: float = 3600,
+                 baseline: float = 24 * 3600, min_count: int = 3, max_terms: int = 50000,
+                 flush_every: int = 1000):
+        if bucket_seconds <= 0 or window < bucket_seconds or baseline < bucket_seconds:
+            raise ValueError("окно и базовый период должны быть не меньше размера корзины")
+        self.path = Path(path)
+        self.bucket_seconds = bucket_seconds
+        self.current_buckets = int(window // bucket_seconds)
+        self.baseline_buckets = int(baseline // bucket_seconds)
+        self.min_count = min_count
+        self.max_terms = max_terms
+        self.flush_every = flush_every
+        self.windows: Dict[str, TermWindow] = {}
+        self.pending_updates = 0
+        self.loaded = False
+        self.logger = logging.getLogger(__name__)
+
+    def _new_window(self) -> TermWindow:
+        return TermWindow(self.bucket_seconds, self.current_buckets, self.baseline_buckets,
+                          self.min_count, self.max_terms)
+
+    def load(self):
+        """Загрузка корзин с диска"""
+        self.loaded = True
+        try:
+            if not self.path.exists():
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('bucket_seconds') != self.bucket_seconds:
+                self.logger.info(f"Размер корзин трендов изменился, история {self.path} не загружена")
+                return
+
+            now_epoch = int(time.time() // self.bucket_seconds)
+            for source, window_state in state.get('sources', {}).items():
+                window = self._new_window()
+                window.restore(window_state, now_epoch)
+                self.windows[source] = window
+            self.logger.info(f"Загружены тренды {self.path}: {len(self.windows)} источников")
+        except Exception as e:
+            self.logger.error(f"Ошибка загрузки трендов {self.path}: {e}")
+
+    def window(self, source: str) -> TermWindow:
+        if not self.loaded:
+            self.load()
+        if source not in self.windows:
+            self.windows[source] = self._new_window()
+        return self.windows[source]
+
+    def add(self, source: str, terms: Set[str], timestamp: Optional[float] = None) -> TermWindow:
+        """Учет терминов сообщения источника"""
+        window = self.window(source)
+        window.add(terms, timestamp if timestamp is not None else time.time())
+        self.pending_updates += 1
+        if self.pending_updates >= self.flush_every:
+            self.flush()
+        return window
+
+    def top(self, limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """Тренды всех источников"""
+        if not self.loaded:
+            self.load()
+        return {source: window.top(limit) for source, window in self.windows.items()}
+
+    def flush(self):
+        """Атомарная запись корзин: временный файл и замена"""
+        if not self.loaded or not self.pending_updates:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            state = {
+                'bucket_seconds': self.bucket_seconds,
+                'sources': {source: window.to_dict() for source, window in self.windows.items()},
+            }
+            tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.pending_updates = 0
+        except Exception as e:
+            self.logger.error(f"Ошибка сохранения трендов {self.path}: {e}")
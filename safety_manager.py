@@ -15,7 +15,17 @@ logger = logging.getLogger(__name__)
 class SafetyManager:
     """Менеджер безопасности для userbot"""
     
-    def __init__(self):
+    # Соответствие действий типам запросов общего ограничителя
+    ACTION_REQUEST_TYPES = {
+        'message': 'send',
+        'reply': 'send',
+        'forward': 'forward'
+    }
+    
+    def __init__(self, rate_limiter=None):
+        # Общий ограничитель запросов с учетом FloodWait
+        self.rate_limiter = rate_limiter
+        
         # Лимиты активности
         self.max_messages_per_hour = 20
         self.max_actions_per_day = 100
@@ -59,9 +69,13 @@ class SafetyManager:
         # delay = random.uniform(self.min_delay_between_actions, self.max_delay_between_actions)
         # await asyncio.sleep(delay)
         
-        # Выполнение действия
+        # Выполнение действия через общий ограничитель
         try:
-            result = await action_func(*args, **kwargs)
+            request_type = self.ACTION_REQUEST_TYPES.get(action_type)
+            if self.rate_limiter and request_type:
+                result = await self.rate_limiter.call(request_type, action_func, *args, **kwargs)
+            else:
+                result = await action_func(*args, **kwargs)
             
             # Обновление статистики (ОТКЛЮЧЕНО)
             # self._update_stats(action_type)
@@ -167,6 +181,12 @@ class SafetyManager:
             for pattern in self.suspicious_patterns[-3:]:
                 report += f"• {pattern}\n"
         
+        if self.rate_limiter:
+            report += f"\n🚦 Ограничитель запросов:\n"
+            for request_type, status in self.rate_limiter.get_status().items():
+                paused = f", пауза {status['paused_for']}с" if status['paused_for'] else ""
+                report += f"• {request_type}: {status['rate']}/{status['base_rate']} запр/с, FloodWait: {status['flood_waits']}{paused}\n"
+        
         return report
     
     def is_safe_to_continue(self) -> bool:
@@ -0,0 +1,71 @@
+"""
+Тесты контрольных точек: пакетная запись, атомарная замена файла и финальное сохранение
+"""
+
+import json
+import asyncio
+
+from modules.checkpoints import CheckpointStore
+
+def test_updates_are_batched(tmp_path):
+    path = tmp_path / 'checkpoints.json'
+    store = CheckpointStore(str(path), flush_every=3)
+    store.update('p', 'chan', 1)
+    store.update('p', 'chan', 2)
+    assert not path.exists()
+    store.update('p', 'chan', 3)
+    assert json.loads(path.read_text(encoding='utf-8')) == {'checkpoints': {'p': {'chan': 3}}}
+    assert store.pending_updates == 0
+
+def test_checkpoint_never_moves_back(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints.json'))
+    store.update('p', 'chan', 10)
+    store.update('p', 'chan', 5)
+    assert store.get('p', 'chan') == 10
+    assert store.pending_updates == 1
+
+def test_flush_replaces_file_atomically(tmp_path):
+    path = tmp_path / 'checkpoints.json'
+    path.write_text(json.dumps({'checkpoints': {'p': {'chan': 1}}}), encoding='utf-8')
+    store = CheckpointStore(str(path))
+    assert store.get('p', 'chan') == 1
+    store.update('p', 'chan', 7)
+    store.flush()
+    assert not (tmp_path / 'checkpoints.json.tmp').exists()
+    assert CheckpointStore(str(path)).get('p', 'chan') == 7
+
+def test_failed_write_keeps_previous_file(tmp_path, monkeypatch):
+    path = tmp_path / 'checkpoints.json'
+    store = CheckpointStore(str(path))
+    store.update('p', 'chan', 1)
+    store.flush()
+
+    def broken_replace(src, dst):
+        raise OSError("диск недоступен")
+
+    monkeypatch.setattr('modules.checkpoints.os.replace', broken_replace)
+    store.update('p', 'chan', 2)
+    store.flush()
+    assert store.pending_updates == 1
+    assert json.loads(path.read_text(encoding='utf-8')) == {'checkpoints': {'p': {'chan': 1}}}
+
+def test_reset_is_written_immediately(tmp_path):
+    path = tmp_path / 'checkpoints.json'
+    store = CheckpointStore(str(path))
+    store.update('p', 'a', 1)
+    store.update('p', 'b', 2)
+    store.reset('p', 'a')
+    assert json.loads(path.read_text(encoding='utf-8')) == {'checkpoints': {'p': {'b': 2}}}
+
+def test_close_flushes_pending_updates(tmp_path):
+    path = tmp_path / 'checkpoints.json'
+
+    async def run():
+        store = CheckpointStore(str(path), flush_interval=3600)
+        store.start()
+        store.update('p', 'chan', 42)
+        await store.close()
+        assert store.flush_task.done()
+
+    asyncio.run(run())
+    assert CheckpointStore(str(path)).get('p', 'chan') == 42
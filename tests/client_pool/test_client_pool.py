@@ -0,0 +1,112 @@
+"""
+Тесты пула сессий: распределение источников и переключение при FloodWait и без доступа
+"""
+
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+from telethon.errors import ChannelPrivateError, FloodWaitError
+
+from modules.client_pool import ClientPool
+
+class FakeClient:
+    """Клиент Telegram: история в памяти, ошибка после fail_after сообщений"""
+
+    def __init__(self, name: str, count: int = 10):
+        self.name = name
+        self.messages = [SimpleNamespace(id=i) for i in range(1, count + 1)]
+        self.error = None
+        self.fail_after = 0
+        self.handlers = []
+        self.requests = []
+
+    def add_event_handler(self, handler, event):
+        self.handlers.append((handler, event))
+
+    def remove_event_handler(self, handler, event):
+        self.handlers.remove((handler, event))
+
+    async def get_messages(self, entity, limit=None):
+        if self.error:
+            raise self.error
+        return [SimpleNamespace(id=self.messages[-1].id, session=self.name)]
+
+    async def iter_messages(self, entity, reverse=True, min_id=0, **kwargs):
+        self.requests.append(min_id)
+        sent = 0
+        for message in self.messages:
+            if message.id <= min_id:
+                continue
+            if self.error and sent >= self.fail_after:
+                raise self.error
+            sent += 1
+            yield message
+
+def make_pool(names=('a', 'b', 'c')):
+    clients = {name: FakeClient(name) for name in names}
+    return ClientPool(clients), clients
+
+def other_session(pool, session_name):
+    return next(name for name in pool.sessions if name != session_name)
+
+def test_sources_spread_with_bounded_load():
+    pool, _ = make_pool()
+    sources = [f'source{i}' for i in range(30)]
+    for source_name in sources:
+        pool.session_for(source_name)
+    loads = [len(session.sources) for session in pool.sessions.values()]
+    assert sum(loads) == 30
+    assert max(loads) <= math.ceil(pool.load_factor * 30 / 3)
+    # Назначение постоянно
+    assert all(pool.session_for(name).name == pool.assignments[name] for name in sources)
+
+def test_long_flood_wait_moves_source_with_handlers():
+    pool, clients = make_pool(('a', 'b'))
+
+    async def handler(event):
+        pass
+
+    current = pool.session_for('news').name
+    pool.add_event_handler('news', handler, 'event')
+    clients[current].error = FloodWaitError(request=None, capture=600)
+
+    result = asyncio.run(pool.call('news', 'history', 'get_messages', -100, limit=1))
+    target = other_session(pool, current)
+    assert result[0].session == target
+    assert pool.assignments['news'] == target
+    assert clients[current].handlers == [] and clients[target].handlers == [(handler, 'event')]
+    assert pool.get_status()[current]['limited']
+
+def test_no_access_session_is_not_reassigned():
+    pool, clients = make_pool(('a', 'b'))
+    current = pool.session_for('news').name
+    clients[current].error = ChannelPrivateError(request=None)
+
+    result = asyncio.run(pool.call('news', 'history', 'get_messages', -100, limit=1))
+    assert result[0].session == other_session(pool, current)
+    assert pool.no_access['news'] == {current}
+
+    # После освобождения источник не возвращается на сессию без доступа
+    pool.release('news')
+    assert pool.session_for('news').name != current
+
+def test_iter_messages_continues_on_other_session():
+    pool, clients = make_pool(('a', 'b'))
+    current = pool.session_for('news').name
+    clients[current].error = FloodWaitError(request=None, capture=600)
+    clients[current].fail_after = 4
+
+    async def read():
+        return [message.id async for message in pool.iter_messages('news', -100, reverse=True, min_id=0)]
+
+    assert asyncio.run(read()) == list(range(1, 11))
+    # Продолжение с последнего полученного сообщения
+    assert clients[other_session(pool, current)].requests == [4]
+
+def test_single_session_raises_access_error():
+    pool, clients = make_pool(('a',))
+    clients['a'].error = ChannelPrivateError(request=None)
+    with pytest.raises(ChannelPrivateError):
+        asyncio.run(pool.call('news', 'history', 'get_messages', -100, limit=1))
@@ -0,0 +1,8 @@
+"""
+Общие настройки тестов: корень проекта в пути импорта
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,79 @@
+"""
+Тесты отпечатков сообщений, фильтра Блума и хранилища дубликатов
+"""
+
+import os
+
+from modules.deduplication import BloomFilter, DedupStore, message_fingerprint
+
+def key(number: int) -> bytes:
+    return message_fingerprint(f"сообщение номер {number}")
+
+def test_fingerprint_normalization():
+    assert message_fingerprint('Привет, МИР!') == message_fingerprint('привет мир')
+    assert message_fingerprint('Ёлка') == message_fingerprint('елка')
+    assert message_fingerprint('...') is None
+
+    photo = {'type': 'photo', 'id': 5}
+    assert message_fingerprint('', photo) is not None
+    assert message_fingerprint('', photo) == message_fingerprint('', dict(photo, size=100))
+    assert message_fingerprint('текст', photo) != message_fingerprint('текст', {'type': 'photo', 'id': 6})
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for number in range(10000):
+        bloom.add(key(number))
+
+    assert all(key(number) in bloom for number in range(10000))
+    false_positives = sum(key(number) in bloom for number in range(10000, 30000))
+    assert false_positives / 20000 < 0.03
+
+def test_lru_then_bloom(tmp_path):
+    store = DedupStore(str(tmp_path / 'dedup.json'), max_entries=10, bloom_capacity=1000)
+    assert not store.check_and_add(key(1))
+    assert store.check_and_add(key(1))
+
+    # Вытесненный из LRU отпечаток помнит фильтр Блума
+    for number in range(2, 50):
+        store.check_and_add(key(number))
+    assert key(1) not in store.recent
+    assert store.check_and_add(key(1))
+
+    without_bloom = DedupStore(str(tmp_path / 'plain.json'), max_entries=10, use_bloom=False)
+    for number in range(1, 50):
+        without_bloom.check_and_add(key(number))
+    assert not without_bloom.check_and_add(key(1))
+
+def test_ttl_expiry(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('modules.deduplication.time.time', lambda: now[0])
+    store = DedupStore(str(tmp_path / 'dedup.json'), ttl=60, use_bloom=False)
+    store.check_and_add(key(1))
+    now[0] += 30
+    assert store.check_and_add(key(1))
+    now[0] += 61
+    assert not store.check_and_add(key(1))
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / 'dedup.json')
+    store = DedupStore(path, max_entries=5, bloom_capacity=1000)
+    for number in range(20):
+        store.check_and_add(key(number))
+    store.flush()
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+
+    restored = DedupStore(path, max_entries=5, bloom_capacity=1000)
+    assert all(restored.check_and_add(key(number)) for number in range(20))
+    assert not restored.check_and_add(key(100))
+
+def test_replayed_message_is_not_its_own_duplicate(tmp_path):
+    path = str(tmp_path / 'dedup.json')
+    store = DedupStore(path, bloom_capacity=1000)
+    assert not store.check_and_add(key(1), 'source:10')
+    store.flush()
+
+    # После перезапуска то же сообщение читается снова, а повтор от другого сообщения отбрасывается
+    restored = DedupStore(path, bloom_capacity=1000)
+    assert not restored.check_and_add(key(1), 'source:10')
+    assert restored.check_and_add(key(1), 'source:11')
+    assert restored.check_and_add(key(1), 'other:10')
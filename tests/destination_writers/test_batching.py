@@ -0,0 +1,147 @@
+"""
+Тесты пакетной записи в назначения: размер, задержка, закрытие и неудачные пачки
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from modules.destination_writers import (
+    DestinationWriter, create_writer, destination_error, record_id, register_writer
+)
+
+batches = []
+failures = []
+
+@register_writer('test_memory')
+class MemoryWriter(DestinationWriter):
+    """Назначение для тестов: пачки в памяти, первые failures[0] попыток неудачны"""
+
+    async def write_batch(self, items):
+        if failures and failures[0] > 0:
+            failures[0] -= 1
+            raise RuntimeError("назначение недоступно")
+        batches.append(list(items))
+
+def destination(destination_type: str = 'test_memory', **config):
+    return SimpleNamespace(
+        name='test', type=destination_type, config=config, processing_rules={},
+        success_count=0, error_count=0, last_success=None
+    )
+
+def setup_function():
+    batches.clear()
+    failures.clear()
+
+def test_flush_on_size():
+    async def scenario():
+        target = destination(max_batch=3, max_latency_ms=60000)
+        writer = create_writer(target)
+        futures = [await writer.write({'n': n}) for n in range(7)]
+        assert [len(batch) for batch in batches] == [3, 3]
+        assert [future.done() for future in futures] == [True] * 6 + [False]
+        await writer.close()
+        assert futures[-1].result() is True
+        return target
+
+    target = asyncio.run(scenario())
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert target.success_count == 7
+
+def test_flush_on_bytes():
+    async def scenario():
+        writer = create_writer(destination(max_batch=1000, max_bytes=100, max_latency_ms=60000))
+        for _ in range(5):
+            await writer.write({'text': 'x' * 40})
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+def test_flush_on_latency():
+    async def scenario():
+        writer = create_writer(destination(max_batch=1000, max_latency_ms=50))
+        future = await writer.write({'n': 1})
+        assert not future.done()
+        assert await asyncio.wait_for(future, 1) is True
+        await writer.close()
+
+    asyncio.run(scenario())
+    assert batches == [[{'n': 1}]]
+
+def test_failed_batch_is_retried():
+    failures.append(2)
+
+    async def scenario():
+        target = destination(max_batch=2, retry_delay_ms=1)
+        writer = create_writer(target)
+        await writer.write({'n': 1})
+        future = await writer.write({'n': 2})
+        return target, future.result()
+
+    target, written = asyncio.run(scenario())
+    assert written is True
+    assert batches == [[{'n': 1}, {'n': 2}]]
+    assert (target.success_count, target.error_count) == (2, 0)
+
+def test_failed_batch_is_saved_after_retries(tmp_path):
+    failures.append(10)
+
+    async def scenario():
+        target = destination(max_batch=2, max_retries=1, retry_delay_ms=1, failed_path=str(tmp_path))
+        writer = create_writer(target)
+        await writer.write({'n': 1})
+        future = await writer.write({'n': 2})
+        return target, future.result()
+
+    target, written = asyncio.run(scenario())
+    assert written is False
+    assert target.error_count == 2
+    saved = [json.loads(line) for path in tmp_path.iterdir() for line in path.read_text(encoding='utf-8').splitlines()]
+    assert saved == [{'n': 1}, {'n': 2}]
+
+def test_unsupported_destination_is_rejected():
+    assert destination_error(destination('unknown')) is not None
+    assert destination_error(destination('database')) is not None
+    assert destination_error(destination('database', connection_string='postgresql://localhost/db')) is None
+    with pytest.raises(ValueError):
+        create_writer(destination('unknown'))
+
+def test_partial_failure_retries_only_the_rest():
+    sent = []
+
+    class Limiter:
+        async def call(self, request_type, method, *args):
+            if len(sent) == 1 and not failures:
+                failures.append(0)
+                raise RuntimeError("FloodWait")
+            return await method(*args)
+
+    async def send_message(chat_id, text):
+        sent.append(text)
+
+    async def scenario():
+        target = destination('telegram', chat_id=1, max_batch=3, retry_delay_ms=1)
+        writer = create_writer(target, client=SimpleNamespace(send_message=send_message), rate_limiter=Limiter())
+        for n in range(3):
+            future = await writer.write({'text': str(n), 'source': 's'})
+        return target, future.result()
+
+    target, written = asyncio.run(scenario())
+    assert written is True
+    assert [text[-1] for text in sent] == ['0', '1', '2']
+    assert target.success_count == 3
+
+def test_records_have_stable_ids():
+    record = {'message_id': 5, 'source': 's', 'pipeline': 'p', 'text': 'x'}
+    writer = create_writer(destination('elasticsearch'))
+    action = json.loads(writer.prepare(record).split('\n')[0])
+    assert action['index']['_id'] == record_id(record) == 'p:s:5'
+    assert record_id(dict(record, event='unanswered')) != record_id(record)
+
+    database = create_writer(destination('database', connection_string='postgresql://localhost/db'))
+    item = database.prepare(record)
+    assert item[0] == 'p:s:5'
+    assert database.failed_record(item) == record
@@ -0,0 +1,95 @@
+"""
+Тесты вовлеченности: граф ответов, сводки по окнам, вытеснение и сохранение состояния
+"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from modules.engagement import EngagementTracker, message_counts
+
+START = 1_000_000 * 3600.0
+
+def message(message_id: int, seconds: float, sender_id: int = 1, reply_to: int = None, **counts):
+    fields = dict(
+        id=message_id, chat_id=10, sender_id=sender_id, reply_to_msg_id=reply_to, reply_to=None,
+        date=datetime.fromtimestamp(START + seconds, timezone.utc), views=None, forwards=None,
+        reactions=None, replies=None
+    )
+    fields.update(counts)
+    return SimpleNamespace(**fields)
+
+def test_message_counts_from_telethon_and_snapshot():
+    telethon = message(
+        1, 0, views=100, forwards=3,
+        reactions=SimpleNamespace(results=[SimpleNamespace(count=2), SimpleNamespace(count=5)]),
+        replies=SimpleNamespace(replies=4)
+    )
+    snapshot = SimpleNamespace(views=100, forwards=3, reaction_count=7, reply_count=4)
+    expected = {'views': 100, 'forwards': 3, 'reactions': 7, 'replies': 4}
+    assert message_counts(telethon) == message_counts(snapshot) == expected
+
+def test_reply_chain_links_to_thread_root(tmp_path):
+    tracker = EngagementTracker(str(tmp_path / 'engagement.json'))
+    assert tracker.observe(message(1, 0))['discussion']['depth'] == 0
+    tracker.observe(message(2, 10, sender_id=2, reply_to=1))
+    result = tracker.observe(message(3, 40, sender_id=3, reply_to=2))['discussion']
+    assert result == {'thread_id': 1, 'depth': 2, 'thread_size': 3, 'participants': 3, 'response_latency': 30.0}
+
+    # Ответ на сообщение до начала учета начинает ветку с этим сообщением
+    orphan = tracker.observe(message(5, 50, reply_to=4))['discussion']
+    assert (orphan['thread_id'], orphan['depth']) == (4, 1)
+
+    top = tracker.report()['top_threads'][0]
+    assert (top['thread_id'], top['size'], top['max_depth'], top['first_response']) == (1, 3, 2, 10.0)
+
+def test_window_summaries(tmp_path):
+    tracker = EngagementTracker(str(tmp_path / 'engagement.json'), window=3600, windows=2)
+    tracker.observe(message(1, 0, views=10))
+    tracker.observe(message(2, 2, sender_id=2, reply_to=1, views=5))
+    tracker.observe(message(3, 3700))
+    tracker.observe(message(4, 7300))
+
+    windows = tracker.report()['windows']
+    assert [window['start'] for window in windows] == [START + 3600, START + 7200]
+    # Сообщение старше хранимых окон учитывается в графе, но не в сводках
+    tracker.observe(message(5, 10, sender_id=3, reply_to=1))
+    assert tracker.report()['windows'] == windows
+
+    tracker = EngagementTracker(str(tmp_path / 'other.json'), window=3600)
+    tracker.observe(message(1, 0, views=10))
+    tracker.observe(message(2, 2, sender_id=2, reply_to=1, views=5))
+    summary = tracker.report()['windows'][0]
+    assert (summary['messages'], summary['replies'], summary['threads_started']) == (2, 1, 1)
+    assert (summary['participants'], summary['views'], summary['latency_p50']) == (2, 15, 3.0)
+
+def test_old_messages_are_evicted(tmp_path):
+    tracker = EngagementTracker(str(tmp_path / 'engagement.json'), max_messages=2)
+    for message_id in range(1, 5):
+        tracker.observe(message(message_id, message_id))
+    assert list(tracker.messages) == [(10, 3), (10, 4)]
+    assert len(tracker.threads) == 2
+
+    tracker = EngagementTracker(str(tmp_path / 'aged.json'), max_age=60)
+    tracker.observe(message(1, 0))
+    tracker.observe(message(2, 120))
+    assert list(tracker.messages) == [(10, 2)]
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / 'engagement.json')
+    tracker = EngagementTracker(path)
+    tracker.observe(message(1, 0))
+    tracker.observe(message(2, 5, sender_id=2, reply_to=1))
+    tracker.flush()
+
+    restored = EngagementTracker(path)
+    assert restored.report() == tracker.report()
+    # Ответ после перезапуска продолжает ветку
+    result = restored.observe(message(3, 9, sender_id=3, reply_to=2))['discussion']
+    assert (result['thread_id'], result['depth'], result['thread_size']) == (1, 2, 3)
+
+def test_options_disable_parts(tmp_path):
+    tracker = EngagementTracker(str(tmp_path / 'engagement.json'), measure_engagement=False)
+    assert set(tracker.observe(message(1, 0))) == {'discussion'}
+    tracker = EngagementTracker(str(tmp_path / 'other.json'), track_discussions=False)
+    assert set(tracker.observe(message(1, 0))) == {'engagement'}
+    assert not tracker.messages
@@ -0,0 +1,72 @@
+"""
+Тесты перцептивного хеша изображений и шага image_dedup
+"""
+
+import asyncio
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from telethon.tl import types
+
+from modules.image_hashing import Image, dhash
+from modules.message_record import MessageRecord, MessageView
+from modules.processing_steps import StepContext, compile_steps
+
+pytestmark = pytest.mark.skipif(Image is None, reason="Pillow не установлен")
+
+def jpeg(seed: int, quality: int = 90, size=(90, 67)) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 255, (6, 6, 3)).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).resize(size, Image.BICUBIC).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+def photo_message(message_id: int, image: bytes):
+    photo = types.Photo(
+        id=message_id, access_hash=0, file_reference=b'', date=None, dc_id=2,
+        sizes=[types.PhotoCachedSize('s', 90, 67, image)]
+    )
+    return SimpleNamespace(
+        id=message_id, text='', message='', sender_id=1, chat_id=1, date=None,
+        media=photo, photo=photo, document=None
+    )
+
+def run(plan, message, source: str = 'source'):
+    data = MessageView(MessageRecord(message, 0), source, 'test')
+    return asyncio.run(plan.run(data, StepContext(message, 'test', source)))
+
+def test_dhash_survives_recompression_and_resize():
+    for seed in range(20):
+        original = dhash(jpeg(seed, 95, (800, 600)))
+        recompressed = dhash(jpeg(seed, 30, (320, 240)))
+        other = dhash(jpeg(seed + 1000, 95, (800, 600)))
+        assert (original ^ recompressed).bit_count() <= 8
+        assert (original ^ other).bit_count() > 8
+    assert dhash(b'not an image') is None
+
+def test_duplicates_across_sources(tmp_path):
+    plan = compile_steps(
+        'test', [{'type': 'image_dedup', 'config': {'action': 'flag', 'index': 'tests_flag'}}],
+        str(tmp_path / 'data'), str(tmp_path / 'config')
+    )
+    first = run(plan, photo_message(1, jpeg(1)), 'a')
+    assert 'image_duplicate_of' not in first
+    assert len(first['image_hash']) == 16
+
+    repost = run(plan, photo_message(2, jpeg(1, 40)), 'b')
+    assert repost['image_duplicate_of']['message_id'] == 1
+    assert repost['image_duplicate_of']['source'] == 'a'
+    assert 'image_duplicate_of' not in run(plan, photo_message(3, jpeg(2)), 'a')
+
+def test_reprocessed_message_is_not_its_own_duplicate(tmp_path):
+    steps = [{'type': 'image_dedup', 'config': {'index': 'tests_self'}}]
+    plan = compile_steps('test', steps, str(tmp_path / 'data'), str(tmp_path / 'config'))
+    message = photo_message(1, jpeg(3))
+    assert run(plan, message) is not None
+
+    # Пайплайн перезапущен: индекс общий для процесса, сообщение читается заново
+    plan.close()
+    plan = compile_steps('test', steps, str(tmp_path / 'data'), str(tmp_path / 'config'))
+    assert run(plan, message) is not None
+    assert run(plan, photo_message(2, jpeg(3, 50))) is None
@@ -0,0 +1,68 @@
+"""
+Тесты поиска ключевых слов автоматом Ахо-Корасик
+"""
+
+import random
+import re
+
+from modules.keyword_matcher import KeywordMatcher, SharedKeywordMatcher
+
+def find(matcher: KeywordMatcher, text: str):
+    hits = {}
+    matcher.find(text, hits)
+    return hits
+
+def test_groups_and_overlapping_keywords():
+    matcher = KeywordMatcher()
+    for keyword in ('he', 'she', 'his', 'hers'):
+        matcher.add('words', keyword)
+    matcher.add('other', 'rs')
+    matcher.build()
+
+    assert find(matcher, 'ushers') == {'words': {'he', 'she', 'hers'}, 'other': {'rs'}}
+    assert find(matcher, 'nothing here') == {'words': {'he'}}
+    assert find(matcher, 'xyz') == {}
+
+def test_case_and_yo_folding():
+    matcher = KeywordMatcher()
+    matcher.add('keywords', 'Ёлка')
+    assert find(matcher, 'новогодняя ЕЛКА') == {'keywords': {'Ёлка'}}
+
+    strict = KeywordMatcher(case_sensitive=True, fold_yo=False)
+    strict.add('keywords', 'Ёлка')
+    assert find(strict, 'новогодняя ЕЛКА') == {}
+    assert find(strict, 'новогодняя Ёлка') == {'keywords': {'Ёлка'}}
+
+def test_whole_words():
+    matcher = KeywordMatcher()
+    matcher.add('whole', 'кот', whole_words=True)
+    matcher.add('part', 'кот')
+
+    assert find(matcher, 'котенок') == {'part': {'кот'}}
+    assert find(matcher, 'мой кот, спит') == {'whole': {'кот'}, 'part': {'кот'}}
+    assert find(matcher, 'кот') == {'whole': {'кот'}, 'part': {'кот'}}
+
+def test_matches_naive_search():
+    rng = random.Random(11)
+    keywords = {''.join(rng.choice('абв') for _ in range(rng.randint(1, 4))) for _ in range(40)}
+    matcher = KeywordMatcher()
+    for keyword in keywords:
+        matcher.add('g', keyword, whole_words=len(keyword) > 2)
+
+    for _ in range(200):
+        text = ''.join(rng.choice('абв ') for _ in range(60))
+        expected = set()
+        for keyword in keywords:
+            pattern = rf'(?<!\w){keyword}(?!\w)' if len(keyword) > 2 else re.escape(keyword)
+            if re.search(pattern, text):
+                expected.add(keyword)
+        assert find(matcher, text).get('g', set()) == expected
+
+def test_shared_matcher_separates_normalization_modes():
+    shared = SharedKeywordMatcher()
+    shared.add_group('a', ['Python'], case_sensitive=True)
+    shared.add_group('b', ['python'])
+    shared.build()
+
+    assert shared.find('I like PYTHON') == {'b': {'python'}}
+    assert shared.find('I like Python') == {'a': {'Python'}, 'b': {'python'}}
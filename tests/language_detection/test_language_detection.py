@@ -0,0 +1,80 @@
+"""
+Тесты определения языка: профили n-грамм, короткие тексты и кеш языка источников
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from modules.language_detection import (
+    UNKNOWN, LanguageDetector, SourceLanguageCache, get_language_detector, ngrams, train_profile
+)
+
+PROFILES = str(Path(__file__).resolve().parents[2] / 'config' / 'language_profiles.json')
+
+class CountingDetector:
+    """Детектор с заданным ответом и счетчиком вызовов"""
+
+    def __init__(self, language: str, confidence: float = 1.0):
+        self.answer = (language, confidence)
+        self.calls = 0
+
+    def detect(self, text):
+        self.calls += 1
+        return self.answer
+
+def test_ngrams_skip_digits_and_punctuation():
+    assert ngrams('Да, 42!') == ['д', 'а', ' д', 'да', 'а ', ' да', 'да ']
+
+@pytest.mark.parametrize('text, language', [
+    ('Привет, как дела у тебя сегодня?', 'ru'),
+    ('Привіт, як справи сьогодні у тебе?', 'uk'),
+    ('Hello, how are you doing today?', 'en'),
+])
+def test_shipped_profiles_detect_language(text, language):
+    detected, confidence = get_language_detector(PROFILES).detect(text)
+    assert detected == language and confidence > 0.99
+
+def test_short_text_is_unknown():
+    assert get_language_detector(PROFILES).detect('ok') == (UNKNOWN, 0.0)
+
+def test_trained_profiles():
+    detector = LanguageDetector({
+        'ru': train_profile('съешь же ещё этих мягких французских булок да выпей чаю ' * 3),
+        'en': train_profile('the quick brown fox jumps over the lazy dog ' * 3),
+    }, min_ngrams=4)
+    assert detector.detect('мягкие булки и чай')[0] == 'ru'
+    assert detector.detect('a lazy brown dog')[0] == 'en'
+
+def test_load_rejects_other_ngram_sizes(tmp_path):
+    path = tmp_path / 'profiles.json'
+    path.write_text(json.dumps({'ngram_sizes': [1, 2], 'languages': {'ru': {'а': 1}}}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        LanguageDetector.load(str(path))
+
+def test_stable_source_skips_detection():
+    cache = SourceLanguageCache(stable_after=3, recheck_every=5)
+    detector = CountingDetector('ru')
+    languages = [cache.detect('news', 'текст', detector) for _ in range(13)]
+    assert languages == ['ru'] * 13
+    # Три определения до стабильности, затем каждое пятое сообщение
+    assert detector.calls == 5
+    assert (cache.detections, cache.hits) == (5, 8)
+
+def test_recheck_restarts_streak_on_change():
+    cache = SourceLanguageCache(stable_after=2, recheck_every=2)
+    detector = CountingDetector('ru')
+    for _ in range(3):
+        cache.detect('news', 'текст', detector)
+    detector.answer = ('en', 1.0)
+    assert cache.detect('news', 'text', detector) == 'en'
+    assert cache.sources['news'].language == 'en' and cache.sources['news'].streak == 1
+
+def test_uncertain_answer_keeps_source_language():
+    cache = SourceLanguageCache(stable_after=1, recheck_every=1)
+    cache.detect('news', 'текст', CountingDetector('ru'))
+    assert cache.detect('news', 'ok', CountingDetector('en', 0.6)) == 'ru'
+    # Для неустановившегося источника возвращается ответ детектора
+    assert cache.detect('other', 'ok', CountingDetector('en', 0.6)) == 'en'
+    assert 'other' not in cache.sources
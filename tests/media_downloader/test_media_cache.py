@@ -0,0 +1,107 @@
+"""
+Тесты кэша медиа: вытеснение давно не использованных файлов, закрепление и общие загрузки
+"""
+
+import os
+import asyncio
+from types import SimpleNamespace
+
+from modules.media_downloader import MediaCache, MediaDownloader
+
+def put(cache: MediaCache, key: str, size: int) -> str:
+    part_path = cache.part_path(key)
+    part_path.write_bytes(b'x' * size)
+    return cache.add(key, part_path, '.bin')
+
+class FakeClient:
+    """Клиент Telegram: файл частями с паузой, счетчик загрузок"""
+
+    def __init__(self, chunks: int = 3):
+        self.chunks = chunks
+        self.downloads = 0
+
+    async def iter_download(self, media, offset=0, **kwargs):
+        self.downloads += 1
+        for _ in range(self.chunks):
+            await asyncio.sleep(0.01)
+            yield b'y' * 10
+
+def media_message(client, media_id: int = 1, size: int = 30):
+    return SimpleNamespace(
+        id=media_id, client=client, media=object(), photo=SimpleNamespace(id=media_id),
+        file=SimpleNamespace(size=size, ext='.jpg')
+    )
+
+def test_least_recently_used_file_is_evicted(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=100)
+    put(cache, 'a', 40)
+    put(cache, 'b', 40)
+    assert cache.get('a')
+    put(cache, 'c', 40)
+    assert list(cache.entries) == ['a', 'c'] and cache.total_bytes == 80
+    assert not (tmp_path / 'b.bin').exists()
+    assert cache.get('b') is None
+
+def test_pinned_files_are_kept(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=100)
+    put(cache, 'a', 40)
+    put(cache, 'b', 40)
+    cache.pin('a')
+    cache.pin('a')
+    cache.unpin('a')
+    put(cache, 'c', 40)
+    assert list(cache.entries) == ['a', 'c']
+
+    # Все файлы закреплены: кэш временно превышает лимит
+    cache.pin('c')
+    put(cache, 'd', 40)
+    assert list(cache.entries) == ['a', 'c', 'd'] and cache.total_bytes == 120
+
+    cache.unpin('a')
+    cache.evict(0)
+    assert list(cache.entries) == ['c', 'd']
+
+def test_load_restores_usage_order(tmp_path):
+    for age, name in enumerate(('new.bin', 'mid.bin', 'old.bin')):
+        path = tmp_path / name
+        path.write_bytes(b'x' * 40)
+        os.utime(path, (1000 - age, 1000 - age))
+    (tmp_path / 'broken.part').write_bytes(b'x')
+
+    cache = MediaCache(str(tmp_path), max_bytes=100)
+    cache.load()
+    assert list(cache.entries) == ['mid', 'new']
+    assert sorted(os.listdir(tmp_path)) == ['mid.bin', 'new.bin']
+
+def test_concurrent_fetches_share_one_download(tmp_path):
+    client = FakeClient()
+
+    async def scenario():
+        downloader = MediaDownloader(MediaCache(str(tmp_path), max_bytes=100))
+        paths = await asyncio.gather(*(downloader.fetch(media_message(client)) for _ in range(3)))
+        cache = downloader.cache
+        assert cache.pins == {'photo_1': 3}
+
+        # Файл из кэша не загружается повторно
+        again = await downloader.fetch(media_message(client))
+        for path in [*paths, again]:
+            downloader.release(path)
+        return paths, again, cache
+
+    paths, again, cache = asyncio.run(scenario())
+    assert client.downloads == 1
+    assert len(set(paths)) == 1 and again == paths[0]
+    assert open(paths[0], 'rb').read() == b'y' * 30
+    assert cache.pins == {}
+
+def test_file_larger_than_cache_is_not_downloaded(tmp_path):
+    client = FakeClient()
+
+    async def scenario():
+        downloader = MediaDownloader(MediaCache(str(tmp_path), max_bytes=100))
+        assert await downloader.fetch(media_message(client, size=500)) is None
+        assert await downloader.fetch(media_message(client, size=50), max_bytes=40) is None
+        return downloader.cache.pins
+
+    assert asyncio.run(scenario()) == {}
+    assert client.downloads == 0
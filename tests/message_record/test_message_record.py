@@ -0,0 +1,102 @@
+"""
+Тесты общей записи сообщения: ленивое извлечение полей, правила разбора и изменения пайплайнов
+"""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from modules.message_record import MessageRecord, MessageView, parsing_flags
+
+class CountingMessage:
+    """Сообщение Telethon со счетчиком обращений к тексту"""
+
+    def __init__(self, text='привет', **attributes):
+        self.id = 7
+        self.chat_id = -100
+        self.sender_id = 1
+        self.date = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        self.media = None
+        self.reply_markup = None
+        self.reactions = None
+        self.entities = None
+        self.views = 42
+        self.text_reads = 0
+        self._text = text
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    @property
+    def text(self):
+        self.text_reads += 1
+        return self._text
+
+def photo_message():
+    return CountingMessage(
+        'подпись', media=object(), photo=SimpleNamespace(id=555),
+        file=SimpleNamespace(mime_type='image/jpeg', size=1024, name=None)
+    )
+
+def test_fields_extracted_once_for_all_pipelines():
+    message = CountingMessage()
+    record = MessageRecord(message, parsing_flags({}))
+    assert message.text_reads == 0
+
+    first = MessageView(record, 'src', 'first')
+    second = MessageView(record, 'src', 'second')
+    assert first['text'] == second['text'] == 'привет'
+    assert message.text_reads == 1
+    # Остальные атрибуты читаются из исходного сообщения
+    assert record.views == 42
+
+def test_view_contents():
+    record = MessageRecord(photo_message(), parsing_flags({}))
+    view = MessageView(record, 'src', 'p')
+    assert view.to_dict() == {
+        'message_id': 7, 'text': 'подпись', 'sender_id': 1, 'date': '2026-01-01T00:00:00+00:00',
+        'source': 'src', 'pipeline': 'p',
+        'media': {'type': 'photo', 'id': 555, 'mime_type': 'image/jpeg', 'size': 1024},
+    }
+
+def test_parsing_rules_disable_fields():
+    message = photo_message()
+    record = MessageRecord(message, parsing_flags({'parse_text': False, 'parse_media': False}))
+    view = MessageView(record, 'src', 'p')
+    assert view['text'] == '' and 'media' not in view
+    assert message.text_reads == 0
+
+    # Реакции по умолчанию не разбираются
+    reactions = SimpleNamespace(results=[SimpleNamespace(reaction=SimpleNamespace(emoticon='👍'), count=3)])
+    message = CountingMessage(reactions=reactions)
+    assert 'reactions' not in MessageView(MessageRecord(message, parsing_flags({})), 'src', 'p')
+    enabled = MessageView(MessageRecord(message, parsing_flags({'parse_reactions': True})), 'src', 'p')
+    assert enabled['reactions'] == [{'reaction': '👍', 'count': 3}]
+
+def test_changes_stay_in_pipeline():
+    record = MessageRecord(CountingMessage(), parsing_flags({}))
+    first = MessageView(record, 'src', 'first')
+    second = MessageView(record, 'src', 'second')
+
+    first['text'] = 'изменено'
+    first['priority'] = 'high'
+    del first['sender_id']
+    assert first['text'] == 'изменено' and 'sender_id' not in first
+    assert list(first)[-1] == 'priority' and len(first) == 6
+    assert second['text'] == 'привет' and 'priority' not in second and second['sender_id'] == 1
+
+    with pytest.raises(KeyError):
+        del first['missing']
+
+def test_preset_fields_skip_extraction():
+    message = CountingMessage()
+    record = MessageRecord(message, parsing_flags({}), preset={'text': 'из воркера', 'media': None})
+    assert record.value('text') == 'из воркера'
+    assert list(record.optional_keys()) == []
+    assert message.text_reads == 0
+
+def test_extracted_fields_for_worker():
+    record = MessageRecord(photo_message(), parsing_flags({'parse_buttons': False}))
+    extracted = record.extracted()
+    assert extracted['text'] == 'подпись' and extracted['media']['id'] == 555
+    assert extracted['buttons'] is None and extracted['reactions'] is None
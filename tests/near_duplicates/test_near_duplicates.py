@@ -0,0 +1,73 @@
+"""
+Тесты SimHash и LSH-индекса почти повторов
+"""
+
+import random
+
+from modules.near_duplicates import SimHashIndex, simhash
+
+TEXT = (
+    "Центральный банк сохранил ключевую ставку на прежнем уровне и пообещал "
+    "следить за инфляцией в ближайшие месяцы, сообщили в пресс-службе регулятора. "
+    "Аналитики ожидали именно такого решения, рынки отреагировали спокойно, курс "
+    "рубля почти не изменился, а доходности облигаций остались на уровне прошлой недели"
+)
+
+def test_similar_texts_have_close_hashes():
+    # Хеши признаков зависят от процесса, поэтому сравниваются средние расстояния
+    words = TEXT.split()
+    rng = random.Random(15)
+    edited = []
+    for _ in range(20):
+        variant = list(words)
+        variant[rng.randrange(len(variant))] = 'иначе'
+        edited.append(' '.join(variant))
+    unrelated = [' '.join(rng.sample(words, len(words))[:12]) + ' футбол матч гол' for _ in range(20)]
+
+    base = simhash(TEXT)
+    edited_distance = sum((base ^ simhash(text)).bit_count() for text in edited) / len(edited)
+    unrelated_distance = sum((base ^ simhash(text)).bit_count() for text in unrelated) / len(unrelated)
+    assert edited_distance < 14
+    assert unrelated_distance > 18
+    assert simhash(TEXT.upper()) == base
+    assert simhash('два слова', min_tokens=3) is None
+
+def test_index_matches_brute_force():
+    rng = random.Random(15)
+    index = SimHashIndex(max_distance=6, window=1e9, max_entries=10 ** 6)
+    values = [rng.getrandbits(64) for _ in range(5000)]
+    for message_id, value in enumerate(values):
+        index.add(value, message_id, float(message_id))
+
+    queries = [values[i] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for i in range(100)]
+    queries += [rng.getrandbits(64) for _ in range(100)]
+    for query in queries:
+        best = min((((query ^ value).bit_count(), i) for i, value in enumerate(values)))
+        match = index.find(query)
+        if best[0] > 6:
+            assert match is None
+        else:
+            assert match is not None
+            assert round((1 - match[1]) * 64) == best[0]
+
+def test_window_and_size_eviction():
+    rng = random.Random(16)
+    values = [rng.getrandbits(64) for _ in range(200)]
+    index = SimHashIndex(max_distance=3, window=100, max_entries=50)
+    for message_id, value in enumerate(values):
+        index.add(value, message_id, float(message_id))
+
+    assert len(index) == 50
+    assert index.find(values[0]) is None
+    assert index.find(values[199])[0] == 199
+    assert 10 not in index
+    assert 199 in index
+
+def test_exclude_skips_the_same_entry():
+    index = SimHashIndex(max_distance=3)
+    index.add(0b1111, 'first', 1.0)
+    assert index.find(0b1111, exclude='first') is None
+
+    index.add(0b1110, 'second', 2.0)
+    assert index.find(0b1111, exclude='first')[0] == 'second'
+    assert index.find(0b1111)[0] == 'first'
@@ -0,0 +1,44 @@
+"""
+Тесты анализа текста: сущности, имена в начале предложения, тональность и пул анализа
+"""
+
+import asyncio
+from pathlib import Path
+
+from modules.nlp_analysis import AnalyzerPool, _init_worker, analyze_batch
+
+LEXICON_PATH = str(Path(__file__).resolve().parents[2] / 'config' / 'nlp_lexicon.json')
+
+def setup_module():
+    _init_worker(LEXICON_PATH)
+
+def test_entities():
+    text = 'Пишите @support_team на https://t.me/channel или по тел. +7 (999) 123-45-67 #новости'
+    entities = analyze_batch([text], ('entities',))[0]['entities']
+    assert entities['mentions'] == ['@support_team']
+    assert entities['hashtags'] == ['#новости']
+    assert entities['phones'] == ['+7 (999) 123-45-67']
+    assert entities['urls'] == ['https://t.me/channel']
+
+def test_names_at_sentence_start():
+    names = analyze_batch(['Иван Петров приехал. Мария Сидорова тоже. Вчера звонил Петров.'], ('entities',))
+    assert names[0]['entities']['names'] == ['Иван Петров', 'Мария Сидорова', 'Петров']
+
+def test_sentiment_with_negation():
+    positive, negated = analyze_batch(['Все прошло отлично', 'Все прошло не отлично'], ('sentiment',))
+    assert positive['sentiment']['label'] == 'positive'
+    assert negated['sentiment']['label'] == 'negative'
+
+def test_pool_batches_concurrent_requests():
+    async def scenario():
+        pool = AnalyzerPool(LEXICON_PATH, processes=1, max_batch=4)
+        try:
+            results = await asyncio.gather(*(
+                pool.analyze([f'Отличный день номер {n}'], ('keywords',)) for n in range(6)
+            ))
+        finally:
+            pool.shutdown()
+        return results
+
+    results = asyncio.run(scenario())
+    assert [result[0]['keywords'] for result in results] == [['отличный', 'день', 'номер']] * 6
@@ -0,0 +1,128 @@
+"""
+Тесты запуска и остановки пайплайна: дообработка очереди, контрольная точка и перезапуск
+"""
+
+import json
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from modules.pipeline_manager import PipelineManager
+from modules.pipeline_workers import PipelineWorkerPool
+
+class FakeClient:
+    """Клиент Telegram с историей в памяти"""
+
+    def __init__(self, count: int):
+        self.messages = [
+            SimpleNamespace(
+                id=i, message=f'сообщение {i}', text=f'сообщение {i}', media=None, reply_markup=None,
+                via_bot_id=None, sender=None, sender_id=1, chat_id=-100, reply_to_msg_id=None,
+                reply_to=None, fwd_from=None, date=datetime(2026, 1, 1)
+            )
+            for i in range(1, count + 1)
+        ]
+        self.requests = []
+
+    def add_event_handler(self, handler, event):
+        pass
+
+    def remove_event_handler(self, handler, event):
+        pass
+
+    async def iter_messages(self, entity, reverse=True, min_id=0, max_id=None, **kwargs):
+        self.requests.append(min_id)
+        for message in self.messages:
+            if message.id > min_id:
+                await asyncio.sleep(0.001)
+                yield message
+
+def write_config(config_path, export_path):
+    config_path.mkdir()
+    sources = {'src': {'id': -100, 'name': 'src', 'type': 'group', 'enabled': True,
+                       'parsing_rules': {'parse_bots': True}, 'filters': {}}}
+    destinations = {'out': {'name': 'out', 'type': 'file', 'enabled': True, 'processing_rules': {},
+                            'config': {'path': str(export_path), 'max_batch': 1}}}
+    pipelines = {'copy': {'name': 'copy', 'enabled': True, 'source': 'src', 'destinations': ['out'],
+                          'created_at': datetime(2026, 1, 1).isoformat(), 'processing_steps': [],
+                          'queue_size': 3}}
+    for name, data in (('sources', sources), ('destinations', destinations), ('pipelines', pipelines)):
+        (config_path / f'{name}.json').write_text(json.dumps({name: data}), encoding='utf-8')
+
+def exported_ids(export_path):
+    return sorted(
+        json.loads(line)['message_id'] for path in export_path.iterdir()
+        for line in path.read_text(encoding='utf-8').splitlines()
+    )
+
+def test_stop_drains_and_restart_resumes(tmp_path):
+    write_config(tmp_path / 'config', tmp_path / 'exports')
+    client = FakeClient(30)
+
+    async def scenario():
+        manager = PipelineManager(client, str(tmp_path / 'config'), str(tmp_path / 'data'))
+        assert await manager.start_pipeline('copy')
+        # Повторный запуск не создает второй экземпляр
+        assert await manager.start_pipeline('copy')
+        reader = manager.readers['src']
+        while reader.last_message_id < 10:
+            await asyncio.sleep(0.001)
+
+        assert await manager.stop_pipeline('copy')
+        assert not manager.is_pipeline_running('copy')
+        assert not reader.is_running
+        assert not await manager.stop_pipeline('copy')
+        checkpoint = manager.checkpoints.get('copy', 'src')
+        first_run = exported_ids(tmp_path / 'exports')
+
+        # Перезапуск продолжает с контрольной точки
+        assert await manager.restart_pipeline('copy')
+        while not reader.live:
+            await asyncio.sleep(0.001)
+        await manager.stop_all()
+        return checkpoint, first_run, manager.checkpoints.get('copy', 'src')
+
+    checkpoint, first_run, final_checkpoint = asyncio.run(scenario())
+    # Контрольная точка проходит только через записанные сообщения
+    assert checkpoint >= 1 and first_run == list(range(1, checkpoint + 1))
+    assert client.requests == [0, checkpoint]
+    assert exported_ids(tmp_path / 'exports') == list(range(1, 31))
+    assert final_checkpoint == 30
+    saved = json.loads((tmp_path / 'data' / 'checkpoints.json').read_text(encoding='utf-8'))
+    assert saved['checkpoints']['copy']['src'] == 30
+
+def test_drain_processes_queue_before_stop():
+    processed = []
+
+    async def scenario():
+        async def handler(message):
+            await asyncio.sleep(0.001)
+            processed.append(message.id)
+
+        pool = PipelineWorkerPool('test', handler, workers=2, queue_size=10)
+        pool.start()
+        for message_id in range(1, 11):
+            await pool.put(SimpleNamespace(id=message_id))
+        assert await pool.drain(5.0)
+        assert not pool.is_running
+
+    asyncio.run(scenario())
+    assert sorted(processed) == list(range(1, 11))
+
+def test_drain_timeout_stops_workers():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(message):
+            await release.wait()
+
+        pool = PipelineWorkerPool('test', handler, queue_size=10)
+        pool.start()
+        for message_id in range(1, 4):
+            await pool.put(SimpleNamespace(id=message_id))
+        drained = await pool.drain(0.05)
+        return drained, pool.is_running, pool.tracker.watermark
+
+    drained, running, watermark = asyncio.run(scenario())
+    # Необработанные сообщения не сдвигают контрольную точку
+    assert (drained, running, watermark) == (False, False, 0)
@@ -0,0 +1,90 @@
+"""
+Тесты границы обработанных сообщений и пула воркеров пайплайна
+"""
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+from modules.pipeline_workers import PipelineWorkerPool, WatermarkTracker
+
+def message(message_id: int, chat_id: int = 1):
+    return SimpleNamespace(id=message_id, chat_id=chat_id, sender_id=1)
+
+def test_watermark_waits_for_gaps():
+    tracker = WatermarkTracker()
+    for message_id in (1, 2, 3, 4):
+        tracker.add(message_id)
+
+    assert tracker.done(2) == 0
+    assert tracker.done(4) == 0
+    assert tracker.done(1) == 2
+    assert tracker.done(3) == 4
+
+def test_watermark_random_completion_order():
+    rng = random.Random(4)
+    ids = list(range(1, 501))
+    tracker = WatermarkTracker()
+    for message_id in ids:
+        tracker.add(message_id)
+
+    finished = set()
+    for message_id in rng.sample(ids, len(ids)):
+        finished.add(message_id)
+        contiguous = 0
+        while contiguous + 1 in finished:
+            contiguous += 1
+        assert tracker.done(message_id) == contiguous
+
+def test_pool_advances_watermark_after_writes():
+    async def scenario():
+        writes = {}
+        progress = []
+
+        async def handler(msg):
+            writes[msg.id] = asyncio.get_running_loop().create_future()
+            return writes[msg.id]
+
+        pool = PipelineWorkerPool('test', handler, workers=2, on_progress=progress.append)
+        pool.start()
+        for message_id in (1, 2, 3):
+            await pool.put(message(message_id))
+        await asyncio.sleep(0.05)
+        # Обработаны, но не записаны: граница не двигается
+        assert pool.tracker.watermark == 0
+
+        writes[2].set_result(True)
+        writes[1].set_result(True)
+        await asyncio.sleep(0)
+        assert pool.tracker.watermark == 2
+
+        # Отмененная запись останавливает границу
+        writes[3].cancel()
+        await asyncio.sleep(0)
+        assert pool.tracker.watermark == 2
+        assert await pool.wait_written(1)
+        await pool.stop()
+        return progress
+
+    assert asyncio.run(scenario())[-1] == 2
+
+def test_pool_keeps_order_per_key():
+    async def scenario():
+        seen = []
+
+        async def handler(msg):
+            await asyncio.sleep(random.random() / 100)
+            seen.append((msg.chat_id, msg.id))
+
+        pool = PipelineWorkerPool('test', handler, workers=4, ordering_key='chat')
+        pool.start()
+        for message_id in range(1, 101):
+            await pool.put(message(message_id, chat_id=message_id % 5))
+        assert await pool.drain(5)
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert len(seen) == 100
+    for chat_id in range(5):
+        ids = [message_id for chat, message_id in seen if chat == chat_id]
+        assert ids == sorted(ids)
@@ -0,0 +1,80 @@
+"""
+Тесты процессов-воркеров: обработка снимков, перезагрузка конфигурации и уведомления шагов
+"""
+
+import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from modules.pipeline_manager import PipelineMonitor
+from modules.process_workers import MessageSnapshot, ProcessSupervisor
+from modules.rate_limiter import RateLimiter
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def write_config(config_path, export_path):
+    config_path.mkdir()
+    sources = {'src': {'id': -100, 'name': 'src', 'type': 'group', 'enabled': True,
+                       'parsing_rules': {'parse_bots': True}, 'filters': {}}}
+    destinations = {'out': {'name': 'out', 'type': 'file', 'enabled': True, 'processing_rules': {},
+                            'config': {'path': str(export_path), 'max_batch': 1}}}
+    pipelines = {'questions': {
+        'name': 'questions', 'enabled': True, 'source': 'src', 'destinations': ['out'],
+        'created_at': START.isoformat(),
+        'processing_steps': [{'name': 'tracker', 'type': 'tracker', 'config': {'response_timeout': 60}}],
+    }}
+    for name, key, data in (('sources', 'sources', sources), ('destinations', 'destinations', destinations),
+                            ('pipelines', 'pipelines', pipelines)):
+        (config_path / f'{name}.json').write_text(json.dumps({key: data}), encoding='utf-8')
+
+def message(message_id: int, minutes: int, text: str = 'Вопрос?'):
+    return SimpleNamespace(
+        id=message_id, text=text, message=text, sender_id=1, chat_id=-100, date=START + timedelta(minutes=minutes),
+        reply_to_msg_id=None, reply_to=None, views=None, forwards=None, reactions=None, replies=None,
+        media=None, photo=None, document=None, fwd_from=None
+    )
+
+def test_snapshot_round_trip():
+    snapshot = MessageSnapshot.from_message(message(7, 0))
+    restored = MessageSnapshot(**snapshot.to_dict())
+    assert (restored.id, restored.text, restored.chat_id, restored.forwarded) == (7, 'Вопрос?', -100, False)
+
+def test_worker_processes_messages_and_forwards_alerts(tmp_path):
+    write_config(tmp_path / 'config', tmp_path / 'exports')
+    monitor = PipelineMonitor()
+
+    async def scenario():
+        supervisor = ProcessSupervisor(
+            1, None, RateLimiter(), str(tmp_path / 'config'), str(tmp_path / 'data'), monitor=monitor
+        )
+        await supervisor.start()
+        try:
+            writes = []
+            first = await supervisor.submit('questions', message(1, 0), writes)
+            # Перезагрузка вместе с сообщениями в обработке не прерывает их шаги
+            results = await asyncio.gather(
+                supervisor.submit('questions', message(2, 1), writes),
+                supervisor.reload_config(),
+                supervisor.submit('questions', message(3, 2), writes),
+            )
+            await asyncio.wait_for(asyncio.gather(*writes), 10)
+            # Сообщение через два часа: вопросы без ответа истекают в воркере
+            await supervisor.submit('questions', message(4, 120, 'Позже'), writes)
+            for _ in range(100):
+                if monitor.alerts:
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await supervisor.stop()
+        return [first, results[0], results[2]]
+
+    results = asyncio.run(scenario())
+    assert all(result['processed'] == 1 and result['errors'] == 0 for result in results)
+    exported = [
+        json.loads(line) for path in (tmp_path / 'exports').iterdir()
+        for line in path.read_text(encoding='utf-8').splitlines()
+    ]
+    assert {record['message_id'] for record in exported if 'event' not in record} >= {1, 2, 3}
+    assert monitor.alerts and all(alert['pipeline_name'] == 'questions' for alert in monitor.alerts)
+    assert {alert['type'] for alert in monitor.alerts} == {'unanswered'}
@@ -0,0 +1,72 @@
+"""
+Тесты компиляции шагов обработки: цепочка функций, общий поиск ключевых слов и ошибки конфигурации
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules.keyword_matcher import SharedKeywordMatcher
+from modules.processing_steps import StepContext, compile_steps
+
+STEPS = [
+    {'name': 'filter', 'type': 'filter', 'config': {'keywords': ['python', 'rust'], 'exclude_keywords': ['реклама']}},
+    {'name': 'classify', 'type': 'classifier', 'config': {'urgency_keywords': ['срочно', 'сбой'],
+                                                          'tech_keywords': ['python', 'rust']}},
+    {'name': 'format', 'type': 'formatter', 'config': {'normalize_text': True}},
+]
+
+TEXTS = ['  Срочно: сбой в python  ', 'реклама python', 'просто текст', 'rust и python']
+
+def context(message_id: int) -> StepContext:
+    return StepContext(SimpleNamespace(id=message_id), 'p', 'src')
+
+def run_all(plan, texts):
+    async def run():
+        return [await plan.run({'message_id': i, 'text': text}, context(i)) for i, text in enumerate(texts)]
+    return asyncio.run(run())
+
+def test_plan_runs_steps_in_order(tmp_path):
+    plan = compile_steps('p', STEPS, str(tmp_path))
+    assert [step.type for step in plan.steps] == ['filter', 'classifier', 'formatter']
+
+    first, advert, plain, tech = run_all(plan, TEXTS)
+    assert first == {'message_id': 0, 'text': 'Срочно: сбой в python', 'priority': 'high', 'tech_keywords': ['python']}
+    assert advert is None and plain is None
+    assert (tech['priority'], tech['tech_keywords']) == ('low', ['python', 'rust'])
+
+def test_keywords_of_all_steps_found_in_one_pass(tmp_path, monkeypatch):
+    plan = compile_steps('p', STEPS, str(tmp_path))
+    calls = []
+    original = SharedKeywordMatcher.find
+    monkeypatch.setattr(SharedKeywordMatcher, 'find', lambda self, text: calls.append(text) or original(self, text))
+    run_all(plan, ['срочно rust'])
+    assert calls == ['срочно rust']
+
+def test_batch_matches_single_runs(tmp_path):
+    plan = compile_steps('p', STEPS, str(tmp_path))
+    single = run_all(plan, TEXTS)
+    items = [({'message_id': i, 'text': text}, context(i)) for i, text in enumerate(TEXTS)]
+    assert asyncio.run(plan.run_batch(items)) == single
+
+def test_unknown_step_is_skipped(tmp_path):
+    plan = compile_steps('p', [{'type': 'missing'}, {'type': 'formatter', 'config': {}}], str(tmp_path))
+    assert [step.type for step in plan.steps] == ['formatter']
+
+@pytest.mark.parametrize('step, message', [
+    ({'name': 'f', 'type': 'filter', 'config': {'keywords': 'python'}}, 'keywords должен быть списком строк'),
+    ({'name': 'c', 'type': 'classifier', 'config': {'urgency_keywords': ['a'], 'priority_levels': ['low']}},
+     'priority_levels'),
+    ({'name': 'f', 'type': 'filter', 'config': {'min_length': 'много'}}, r'шаг f \(filter\)'),
+])
+def test_bad_config_raises_value_error(tmp_path, step, message):
+    with pytest.raises(ValueError, match=message):
+        compile_steps('p', [step], str(tmp_path))
+
+def test_close_saves_step_state(tmp_path):
+    plan = compile_steps('p', [{'name': 'f', 'type': 'filter', 'config': {'remove_duplicates': True}}], str(tmp_path))
+    first, repeat = run_all(plan, ['одинаковый текст', 'одинаковый текст'])
+    assert first is not None and repeat is None
+    plan.close()
+    assert (tmp_path / 'dedup' / 'p_f.json').exists()
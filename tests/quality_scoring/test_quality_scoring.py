@@ -0,0 +1,51 @@
+"""
+Тесты признаков и модели качества: пачка против одиночной оценки, снимки сообщений воркеров
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from modules.process_workers import MessageSnapshot
+from modules.quality_scoring import FEATURES, QualityModel, extract_features
+
+CONFIG_PATH = Path(__file__).resolve().parents[2] / 'config'
+
+def telethon_message(text: str, forwarded: bool = False, media: bool = False):
+    return SimpleNamespace(
+        id=1, text=text, sender_id=2, date=None, chat_id=3, views=None, forwards=None,
+        reactions=None, replies=None, photo=None, document=None,
+        fwd_from=object() if forwarded else None, media=object() if media else None
+    )
+
+def test_features():
+    features = dict(zip(FEATURES, extract_features('КУПИ СЕЙЧАС!!! https://spam.example @bot @bot')))
+    assert features['link_density'] == pytest.approx(1 / 5)
+    assert features['caps_ratio'] > 0.3
+    assert features['repetition'] == pytest.approx(1 / 5)
+    assert features['mention_density'] == pytest.approx(2 / 5)
+    assert features['exclamation_ratio'] == pytest.approx(3 / 5)
+    assert extract_features('') == [0.0] * len(FEATURES)
+
+def test_snapshot_has_the_same_features_as_message():
+    for forwarded in (False, True):
+        message = telethon_message('Пересланный текст', forwarded=forwarded, media=True)
+        snapshot = MessageSnapshot.from_message(message)
+        assert snapshot.forwarded is forwarded and snapshot.has_media is True
+        assert extract_features(message.text, snapshot) == extract_features(message.text, message)
+
+def test_batch_score_matches_single():
+    model = QualityModel.load(str(CONFIG_PATH / 'quality_model.json'))
+    texts = ['Обычное сообщение о встрече завтра', 'СКИДКИ!!! https://a.example https://b.example', '']
+    batch = model.score([extract_features(text) for text in texts])
+    assert batch.shape == (3, 2)
+    for text, row in zip(texts, batch):
+        assert np.allclose(model.score([extract_features(text)])[0], row)
+    # Спам с ссылками оценивается хуже обычного сообщения
+    assert batch[1][0] > batch[0][0] and batch[1][1] < batch[0][1]
+
+def test_unknown_feature_is_rejected():
+    with pytest.raises(ValueError):
+        QualityModel({'spam': {'weights': {'unknown': 1.0}}})
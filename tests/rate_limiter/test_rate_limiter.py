@@ -0,0 +1,99 @@
+"""
+Тесты ведра токенов и ограничителя запросов с FloodWait
+"""
+
+import asyncio
+
+import pytest
+from telethon.errors import FloodWaitError
+
+from modules import rate_limiter as rate_limiter_module
+from modules.rate_limiter import RateLimiter, TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, 'monotonic', fake)
+    return fake
+
+def test_bucket_refill(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.reserve() == 0.0
+    # Запас не превышает capacity после долгого простоя
+    clock.now += 100
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() > 0
+
+def test_bucket_consume_debt(clock):
+    bucket = TokenBucket(rate=100.0, capacity=100)
+    assert bucket.consume(50) == 0.0
+    assert bucket.consume(150) == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.consume(0) == 0.0
+
+def test_flood_pauses_and_slows_down(clock):
+    bucket = TokenBucket(rate=4.0, capacity=4)
+    bucket.on_flood(10)
+    assert bucket.reserve() == pytest.approx(10)
+    assert bucket.rate == 2.0
+
+    clock.now += 10
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 4.0
+
+def test_call_retries_after_flood_wait():
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise FloodWaitError(request=None, capture=0)
+        return 'ok'
+
+    limiter = RateLimiter({'send': (1000.0, 10)})
+    assert asyncio.run(limiter.call('send', request)) == 'ok'
+    assert len(attempts) == 3
+    assert limiter.flood_waits['send'] == 2
+
+def test_call_raises_long_flood_wait():
+    async def request():
+        raise FloodWaitError(request=None, capture=60)
+
+    limiter = RateLimiter()
+    with pytest.raises(FloodWaitError):
+        asyncio.run(limiter.call('send', request, max_flood_wait=30))
+    assert limiter.is_paused('send')
+    assert not limiter.is_paused('history')
+
+def test_iter_download_resumes_after_flood_wait():
+    class Client:
+        def __init__(self):
+            self.offsets = []
+
+        async def iter_download(self, media, offset=0, request_size=10):
+            self.offsets.append(offset)
+            for position in range(offset, 40, request_size):
+                if position == 20 and len(self.offsets) == 1:
+                    raise FloodWaitError(request=None, capture=0)
+                yield bytes([position]) * request_size
+
+    async def download(client):
+        limiter = RateLimiter({'download': (1000.0, 10)})
+        return [chunk async for chunk in limiter.iter_download(client, None, request_size=10)]
+
+    client = Client()
+    chunks = asyncio.run(download(client))
+    assert client.offsets == [0, 20]
+    assert [chunk[0] for chunk in chunks] == [0, 10, 20, 30]
@@ -0,0 +1,60 @@
+"""
+Тесты отслеживания ответов: ответы, уточнения автора и время трекера при догрузке истории
+"""
+
+import time
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from modules.response_tracker import ResponseTracker
+
+def message(message_id: int, sent_at: float, sender_id: int = 1, reply_to: int = None):
+    return SimpleNamespace(
+        id=message_id, chat_id=10, sender_id=sender_id, reply_to_msg_id=reply_to, reply_to=None,
+        date=datetime.fromtimestamp(sent_at, timezone.utc)
+    )
+
+def test_answer_closes_question(tmp_path):
+    tracker = ResponseTracker(str(tmp_path / 'tracker.json'), timeout=600)
+    start = 1_000_000.0
+    assert tracker.observe(message(1, start), 'Вопрос?') == {'awaiting_response': True}
+    # Уточнение автора не закрывает вопрос, ответ на уточнение закрывает
+    assert tracker.observe(message(2, start + 10, reply_to=1)) == {}
+    result = tracker.observe(message(3, start + 60, sender_id=2, reply_to=2))
+    assert result == {'response_to': {'message_id': 1, 'response_time': 60.0}}
+    assert tracker.stats()['open'] == 0
+
+def test_timeout_follows_message_dates(tmp_path):
+    events = []
+    tracker = ResponseTracker(str(tmp_path / 'tracker.json'), timeout=600, on_timeout=events.append)
+    start = 1_000_000.0
+    tracker.observe(message(1, start), 'Вопрос?')
+    tracker.observe(message(2, start + 599), 'Другое')
+    assert events == []
+    tracker.observe(message(3, start + 601), 'Еще')
+    assert [event['message_id'] for event in events] == [1]
+
+def test_history_pause_does_not_expire_questions(tmp_path):
+    events = []
+
+    async def scenario():
+        tracker = ResponseTracker(
+            str(tmp_path / 'tracker.json'), timeout=60, tick=0.01, idle_after=0.05, on_timeout=events.append
+        )
+        # Вопрос из истории, затем пауза чтения дольше idle_after
+        old = time.time() - 86400
+        tracker.observe(message(1, old), 'Вопрос?')
+        await asyncio.sleep(0.2)
+        assert events == []
+        # Ответ, прочитанный после паузы, закрывает вопрос
+        assert 'response_to' in tracker.observe(message(2, old + 30, sender_id=2, reply_to=1))
+
+        # Свежий вопрос без новых сообщений истекает по текущему времени
+        tracker.timeout = 0.1
+        tracker.observe(message(3, time.time()), 'Вопрос?')
+        await asyncio.sleep(0.4)
+        tracker.close()
+
+    asyncio.run(scenario())
+    assert [event['message_id'] for event in events] == [3]
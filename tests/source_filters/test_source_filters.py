@@ -0,0 +1,69 @@
+"""
+Тесты фильтров источника: правила разбора, ключевые слова, ответы, медиа и отправители
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from modules.message_record import MessageRecord, parsing_flags
+from modules.source_filters import SourceFilter
+
+def message(text: str = '', **attributes):
+    fields = dict(
+        id=1, message=text, text=text, media=None, photo=None, video=None, reply_markup=None,
+        via_bot_id=None, sender=None, sender_id=100, reply_to_msg_id=None, reply_to=None
+    )
+    fields.update(attributes)
+    return SimpleNamespace(**fields)
+
+def test_parsing_rules_do_not_drop_messages():
+    rules = {'parse_text': False, 'parse_media': False, 'parse_buttons': False, 'parse_bots': True}
+    source_filter = SourceFilter({}, rules)
+    photo = message('подпись', media=object(), photo=object())
+    with_buttons = message('текст', reply_markup=SimpleNamespace(rows=[]))
+    assert source_filter.is_empty
+    assert source_filter.accepts(photo) and source_filter.accepts(with_buttons)
+
+    # Поля не извлекаются, но сообщение остается
+    record = MessageRecord(photo, parsing_flags(rules))
+    assert record.value('text') == ''
+    with pytest.raises(KeyError):
+        record.value('media')
+
+def test_bots_are_rejected_by_default():
+    source_filter = SourceFilter({}, {})
+    assert not source_filter.accepts(message('через бота', via_bot_id=5))
+    assert not source_filter.accepts(message('от бота', sender=SimpleNamespace(bot=True)))
+    assert source_filter.accepts(message('от человека', sender=SimpleNamespace(bot=False)))
+    assert SourceFilter({}, {'parse_bots': True}).accepts(message('через бота', via_bot_id=5))
+
+def test_keywords_and_replies():
+    source_filter = SourceFilter(
+        {'keywords': ['python'], 'exclude_keywords': ['реклама'], 'min_length': 5}, {'parse_bots': True}
+    )
+    assert source_filter.accepts(message('Вакансия Python-разработчика'))
+    assert not source_filter.accepts(message('Вакансия Java-разработчика'))
+    assert not source_filter.accepts(message('Python реклама курсов'))
+    assert not source_filter.accepts(message('py'))
+    # Ответ проходит без ключевых слов, но не без min_length и exclude_keywords
+    assert source_filter.accepts(message('Спасибо, подходит', reply_to_msg_id=10))
+    assert not source_filter.accepts(message('Да', reply_to_msg_id=10))
+    assert not source_filter.accepts(message('Реклама в ответе', reply_to_msg_id=10))
+    strict = SourceFilter({'keywords': ['python'], 'keep_replies': False}, {'parse_bots': True})
+    assert not strict.accepts(message('Спасибо, подходит', reply_to_msg_id=10))
+
+def test_whole_words():
+    source_filter = SourceFilter({'keywords': ['кот'], 'whole_words': True}, {'parse_bots': True})
+    assert source_filter.accepts(message('Наш кот спит'))
+    assert not source_filter.accepts(message('Котлеты на ужин'))
+
+def test_media_types_and_senders():
+    source_filter = SourceFilter({'media_types': ['photo'], 'from_users': [100]}, {'parse_bots': True})
+    assert source_filter.accepts(message(media=object(), photo=object()))
+    assert not source_filter.accepts(message(media=object(), video=object()))
+    assert not source_filter.accepts(message(media=object(), photo=object(), sender_id=200))
+    with pytest.raises(ValueError):
+        SourceFilter({'media_types': ['hologram']}, {})
+    with pytest.raises(ValueError):
+        SourceFilter({'keywords': 'python'}, {})
@@ -0,0 +1,78 @@
+"""
+Поддельные источник и пул сессий для тестов читателя источника
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+class FakeClients:
+    """Пул сессий с историей в памяти; fail_after - ошибка после стольких сообщений одного чтения"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.fail_after = None
+        self.requests = []
+
+    def add_event_handler(self, source_name, handler, event):
+        pass
+
+    def remove_event_handler(self, source_name, handler, event):
+        pass
+
+    async def call(self, source_name, request_type, method, entity, limit=None):
+        return self.messages[-1:]
+
+    async def iter_messages(self, source_name, entity, reverse=True, min_id=0, max_id=None,
+                            search=None, filter=None, from_user=None):
+        self.requests.append({'min_id': min_id, 'max_id': max_id, 'search': search})
+        fail_after, self.fail_after = self.fail_after, None
+        for count, message in enumerate(self.messages):
+            if fail_after is not None and count >= fail_after:
+                raise RuntimeError("соединение прервано")
+            if message.id <= min_id or (max_id is not None and message.id >= max_id):
+                continue
+            if search is not None and search not in message.message.lower().split():
+                continue
+            # Загрузка страницы истории
+            await asyncio.sleep(0)
+            yield message
+
+def make_message(message_id: int, text: str = ''):
+    return SimpleNamespace(
+        id=message_id, message=text or f'сообщение {message_id}', text=text or f'сообщение {message_id}',
+        media=None, reply_markup=None, via_bot_id=None, sender=None, sender_id=1,
+        chat_id=-100, reply_to_msg_id=None, reply_to=None, date=None
+    )
+
+def make_source(filters=None, backfill=None):
+    return SimpleNamespace(
+        id=-100, filters=filters or {}, parsing_rules={'parse_bots': True}, backfill=backfill or {},
+        error_count=0, message_count=0, last_activity=None
+    )
+
+class Collector:
+    """Подписчик: ID полученных сообщений и ожидание нужного количества"""
+
+    def __init__(self):
+        self.ids = []
+        self.skipped = []
+
+    async def put(self, message):
+        self.ids.append(message.id)
+
+    def skip(self, message_id):
+        self.skipped.append(message_id)
+
+    async def wait_for(self, count, timeout=5.0):
+        async def wait():
+            while len(self.ids) < count:
+                await asyncio.sleep(0.001)
+        await asyncio.wait_for(wait(), timeout)
+
+@pytest.fixture
+def fakes():
+    return SimpleNamespace(
+        Clients=FakeClients, message=make_message, source=make_source, Collector=Collector
+    )
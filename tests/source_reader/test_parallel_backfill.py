@@ -0,0 +1,55 @@
+"""
+Тесты параллельной догрузки истории диапазонами ID
+"""
+
+import asyncio
+
+from modules.source_reader import SourceReader
+
+def run_backfill(fakes, backfill, count=25):
+    clients = fakes.Clients([fakes.message(i) for i in range(1, count + 1)])
+    collector = fakes.Collector()
+    checkpoints = []
+
+    async def scenario():
+        reader = SourceReader(clients, 'news', fakes.source(backfill=backfill))
+
+        def on_safe_checkpoint():
+            # Все сообщения до безопасной контрольной точки уже переданы подписчику
+            checkpoints.append((reader.safe_checkpoint, set(collector.ids)))
+
+        reader.on_safe_checkpoint = on_safe_checkpoint
+        reader.subscribe('main', collector.put)
+        reader.start()
+        await collector.wait_for(count)
+        reader.unsubscribe('main')
+        await reader.stop()
+
+    asyncio.run(scenario())
+    return collector.ids, clients.requests, checkpoints
+
+def test_ordered_parallel_backfill_keeps_order(fakes):
+    ids, requests, checkpoints = run_backfill(fakes, {'concurrency': 3, 'range_size': 4})
+    assert ids == list(range(1, 26))
+    assert sorted(request['min_id'] for request in requests) == [0, 4, 8, 12, 16, 20, 24]
+    assert checkpoints == []
+
+def test_unordered_backfill_limits_safe_checkpoint(fakes):
+    ids, requests, checkpoints = run_backfill(fakes, {'concurrency': 3, 'range_size': 4, 'ordered': False})
+    assert sorted(ids) == list(range(1, 26))
+    assert len(requests) == 7
+
+    # Граница сдвигается только вперед и не обгоняет переданные сообщения
+    bounds = [bound for bound, _ in checkpoints[:-1]]
+    assert bounds == sorted(bounds) and bounds[-1] == 25
+    for bound, delivered in checkpoints[:-1]:
+        assert set(range(1, bound + 1)) <= delivered
+    # После завершения догрузки ограничение снимается
+    assert checkpoints[-1][0] is None
+
+def test_checkpoint_limit_during_unordered_backfill(fakes):
+    reader = SourceReader(fakes.Clients([]), 'news', fakes.source())
+    assert reader.checkpoint_limit(100) == 100
+    reader.safe_checkpoint = 40
+    assert reader.checkpoint_limit(100) == 40
+    assert reader.checkpoint_limit(30) == 30
@@ -0,0 +1,62 @@
+"""
+Тесты догрузки истории поиском Telegram: запросы по фильтрам и слияние результатов
+"""
+
+import asyncio
+
+from modules.source_filters import SourceFilter
+from modules.source_reader import SourceReader
+
+TEXTS = {
+    2: 'новости python',
+    4: 'python и rust',
+    5: 'обзор rust',
+    7: 'pythonista пишет',
+    8: 'rust снова',
+}
+
+SEARCH_FILTERS = {'keywords': ['python', 'rust'], 'whole_words': True, 'keep_replies': False}
+
+def history(fakes, count=10):
+    return [fakes.message(i, TEXTS.get(i, '')) for i in range(1, count + 1)]
+
+def read(fakes, filters, expected):
+    clients = fakes.Clients(history(fakes))
+    collector = fakes.Collector()
+
+    async def scenario():
+        reader = SourceReader(clients, 'news', fakes.source(filters=filters, backfill={'mode': 'search'}))
+        reader.subscribe('main', collector.put, on_skip=collector.skip)
+        reader.start()
+        await collector.wait_for(expected)
+        while not reader.live:
+            await asyncio.sleep(0.001)
+        reader.unsubscribe('main')
+        await reader.stop()
+
+    asyncio.run(scenario())
+    return collector, clients.requests
+
+def test_search_queries_follow_filters():
+    assert SourceFilter(dict(SEARCH_FILTERS, from_users=[1, 2]), {}).search_queries() == [
+        {'search': 'python', 'from_user': 1}, {'search': 'python', 'from_user': 2},
+        {'search': 'rust', 'from_user': 1}, {'search': 'rust', 'from_user': 2},
+    ]
+    # Поиск Telegram не находит подстрок и ответов
+    assert SourceFilter({'keywords': ['python'], 'keep_replies': False}, {}).search_queries() is None
+    assert SourceFilter({'keywords': ['python'], 'whole_words': True}, {}).search_queries() is None
+    assert SourceFilter({}, {}).search_queries() is None
+    assert len(SourceFilter({'media_types': ['photo']}, {}).search_queries()) == 1
+
+def test_search_results_merge_in_order(fakes):
+    collector, requests = read(fakes, SEARCH_FILTERS, 4)
+    # Сообщение с обоими словами передается один раз, порядок по ID
+    assert collector.ids == [2, 4, 5, 8]
+    assert sorted(request['search'] for request in requests) == ['python', 'rust']
+    # Контрольная точка сдвигается до конца истории
+    assert collector.skipped == [10]
+
+def test_inexpressible_filters_read_whole_history(fakes):
+    collector, requests = read(fakes, {'keywords': ['python', 'rust']}, 5)
+    assert collector.ids == [2, 4, 5, 7, 8]
+    assert [request['search'] for request in requests] == [None]
@@ -0,0 +1,71 @@
+"""
+Тесты общего читателя источника: раздача подписчикам и догрузка для подключенных позже
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from modules.source_reader import SourceReader
+
+class Monitor:
+    def __init__(self):
+        self.alerts = []
+
+    async def send_alert(self, alert_type, message, pipeline_name=None):
+        self.alerts.append((alert_type, pipeline_name))
+
+def test_one_read_for_all_subscribers(fakes):
+    clients = fakes.Clients([fakes.message(i) for i in range(1, 11)])
+
+    async def scenario():
+        reader = SourceReader(clients, 'news', fakes.source())
+        first, second = fakes.Collector(), fakes.Collector()
+        reader.subscribe('first', first.put)
+        reader.subscribe('second', second.put, after_id=4)
+        reader.start()
+        await first.wait_for(10)
+        await second.wait_for(6)
+        reader.unsubscribe('first')
+        reader.unsubscribe('second')
+        await reader.stop()
+        return first.ids, second.ids
+
+    first_ids, second_ids = asyncio.run(scenario())
+    assert first_ids == list(range(1, 11))
+    assert second_ids == list(range(5, 11))
+    assert len(clients.requests) == 1
+
+def test_late_subscriber_catch_up_retries_after_error(fakes):
+    clients = fakes.Clients([fakes.message(i) for i in range(1, 11)])
+    monitor = Monitor()
+
+    async def scenario():
+        reader = SourceReader(clients, 'news', fakes.source(), monitor)
+        reader.CATCH_UP_MAX_DELAY = 0
+        first, late = fakes.Collector(), fakes.Collector()
+        reader.subscribe('first', first.put)
+        reader.start()
+        await first.wait_for(10)
+
+        # Догрузка для подключенного позже обрывается после трех сообщений и продолжается
+        clients.fail_after = 3
+        reader.subscribe('late', late.put, after_id=0)
+        await late.wait_for(10)
+        while 'late' in reader.catch_up_tasks:
+            await asyncio.sleep(0.001)
+
+        # Новое сообщение получают оба подписчика
+        clients.messages.append(fakes.message(11))
+        await reader._on_live_message(SimpleNamespace(message=clients.messages[-1]))
+        await late.wait_for(11)
+        reader.unsubscribe('first')
+        reader.unsubscribe('late')
+        await reader.stop()
+        return first.ids, late.ids, clients.requests
+
+    first_ids, late_ids, requests = asyncio.run(scenario())
+    assert first_ids == list(range(1, 12))
+    assert late_ids == list(range(1, 12))
+    # Повтор начинается с последнего переданного сообщения
+    assert [request['min_id'] for request in requests[1:]] == [0, 3]
+    assert monitor.alerts == [('pipeline_error', 'late')]
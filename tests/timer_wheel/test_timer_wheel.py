@@ -0,0 +1,77 @@
+"""
+Тесты иерархического колеса таймеров
+"""
+
+import math
+import random
+import time
+
+import pytest
+
+from modules.timer_wheel import TimerWheel
+
+def test_fires_in_order_of_deadline():
+    wheel = TimerWheel(tick=1.0, slots=8, levels=3)
+    deadlines = {f"t{i}": deadline for i, deadline in enumerate([3, 1, 700, 64, 65, 5000, 2])}
+    for key, deadline in deadlines.items():
+        wheel.schedule(key, deadline, deadline)
+
+    fired = []
+    for now in range(1, 5001):
+        fired.extend(value for _, value in wheel.advance(now))
+    assert fired == sorted(deadlines.values())
+    assert len(wheel) == 0
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(tick=1.0)
+    wheel.schedule('a', 10, 'first')
+    wheel.schedule('b', 10)
+    assert wheel.cancel('b')
+    assert not wheel.cancel('b')
+    wheel.schedule('a', 20, 'second')
+
+    assert wheel.advance(15) == []
+    assert wheel.advance(20) == [('a', 'second')]
+
+def test_overdue_timer_fires_on_next_tick():
+    wheel = TimerWheel(tick=1.0, start=100)
+    wheel.schedule('late', 50)
+    assert wheel.advance(100) == []
+    assert wheel.advance(101) == [('late', None)]
+
+def test_random_schedule_matches_brute_force():
+    rng = random.Random(20)
+    wheel = TimerWheel(tick=1.0, slots=8, levels=3)
+    expected = {}
+    now = 0.0
+    for _ in range(3000):
+        action = rng.random()
+        if action < 0.5:
+            key = rng.randrange(100)
+            deadline = now + rng.choice([rng.uniform(0, 20), rng.uniform(0, 600), rng.uniform(0, 5000)])
+            wheel.schedule(key, deadline)
+            expected[key] = deadline
+        elif action < 0.6:
+            key = rng.randrange(100)
+            wheel.cancel(key)
+            expected.pop(key, None)
+        else:
+            now += rng.choice([rng.uniform(0, 3), rng.uniform(0, 100), rng.uniform(0, 3000)])
+            fired = sorted(key for key, _ in wheel.advance(now))
+            due = sorted(key for key, deadline in expected.items() if math.ceil(deadline) <= math.floor(now))
+            assert fired == due
+            for key in fired:
+                del expected[key]
+
+@pytest.mark.parametrize('timers', [0, 1, 1000])
+def test_large_jump_is_fast(timers):
+    wheel = TimerWheel(tick=1.0)
+    for i in range(timers):
+        wheel.schedule(i, 10 ** 9 + i)
+    wheel.schedule('soon', 5)
+
+    started = time.perf_counter()
+    fired = wheel.advance(365 * 24 * 3600)
+    assert time.perf_counter() - started < 1.0
+    assert fired == [('soon', None)]
+    assert len(wheel) == timers
@@ -0,0 +1,91 @@
+"""
+Тесты поиска трендов: термины, кольцо корзин, оценка всплеска и сохранение между перезапусками
+"""
+
+import time
+import random
+from collections import Counter
+
+import pytest
+
+from modules.trend_detection import TermWindow, TrendTracker, extract_terms
+
+BUCKET = 60
+
+def test_extract_terms():
+    assert extract_terms('Ёлка и #Новый_год: ёлка, 2026 год', frozenset({'елка'})) == {'#новый_год', 'год'}
+
+def test_burst_rises_above_steady_terms():
+    window = TermWindow(BUCKET, current_buckets=2, baseline_buckets=10)
+    # Базовый уровень: одно упоминание в каждой корзине
+    for epoch in range(10):
+        window.add({'погода', 'пожар'} if epoch == 0 else {'погода'}, epoch * BUCKET)
+    for i in range(6):
+        window.add({'пожар', 'погода'}, 10 * BUCKET + i)
+
+    top = window.top(5)
+    assert top[0]['term'] == 'пожар' and top[0]['count'] == 6
+    assert window.trending({'пожар', 'погода'}, threshold=3.0) == ['пожар']
+
+def test_min_count_hides_rare_terms():
+    window = TermWindow(BUCKET, current_buckets=2, baseline_buckets=10, min_count=3)
+    window.add({'редкое'}, 0)
+    window.add({'редкое'}, 1)
+    assert window.top() == []
+    window.add({'редкое'}, 2)
+    assert [item['term'] for item in window.top()] == ['редкое']
+
+def test_running_sums_match_buckets():
+    rng = random.Random(7)
+    window = TermWindow(BUCKET, current_buckets=3, baseline_buckets=5)
+    timestamp = 0.0
+    for _ in range(2000):
+        timestamp += rng.expovariate(1 / 20)
+        # Иногда приходят сообщения с опозданием
+        late = timestamp - rng.choice((0, 0, 0, 200, 600))
+        window.add(set(rng.sample(['a', 'b', 'c', 'd', 'e', 'f'], 2)), max(0.0, late))
+
+        current, baseline = Counter(), Counter()
+        for epoch, bucket in zip(window.epochs, window.buckets):
+            if epoch is None:
+                continue
+            if epoch > window.latest_epoch - window.current_buckets:
+                current.update(bucket)
+            else:
+                baseline.update(bucket)
+        assert window.current == current and window.baseline == baseline
+
+def test_messages_older_than_ring_are_ignored():
+    window = TermWindow(BUCKET, current_buckets=2, baseline_buckets=3)
+    assert window.add({'новое'}, 10 * BUCKET)
+    assert not window.add({'старое'}, 5 * BUCKET)
+    # Корзина до начала учета источника
+    assert not window.add({'раньше'}, 9 * BUCKET)
+    assert 'старое' not in window.current and 'раньше' not in window.current
+
+def test_long_gap_resets_history():
+    window = TermWindow(BUCKET, current_buckets=2, baseline_buckets=3)
+    window.add({'старое'}, 0)
+    window.add({'новое'}, 100 * BUCKET)
+    assert window.current == Counter({'новое': 1}) and not window.baseline
+
+def test_tracker_restores_buckets(tmp_path):
+    path = str(tmp_path / 'trends.json')
+    now = time.time()
+    tracker = TrendTracker(path, bucket_seconds=BUCKET, window=2 * BUCKET, baseline=10 * BUCKET)
+    for i in range(5):
+        tracker.add('news', {'выборы'}, now - i)
+    tracker.add('other', {'спорт'}, now - 1)
+    tracker.flush()
+
+    restored = TrendTracker(path, bucket_seconds=BUCKET, window=2 * BUCKET, baseline=10 * BUCKET)
+    assert restored.top() == tracker.top()
+    assert restored.window('news').current == Counter({'выборы': 5})
+
+    # Другой размер корзин: сохраненная история не загружается
+    other = TrendTracker(path, bucket_seconds=2 * BUCKET, window=2 * BUCKET, baseline=10 * BUCKET)
+    assert other.top() == {}
+
+def test_invalid_window_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        TrendTracker(str(tmp_path / 'trends.json'), bucket_seconds=300, window=60)